@@ -0,0 +1,466 @@
+"""
+YouTube Live Chat Collector - Load Benchmark
+
+合成チャットソース（CHAT_SOURCE=synthetic）または記録したチャットの再生（CHAT_SOURCE=replay）で
+実際のCommentCollectorパイプラインに負荷をかけ、
+Fargateタスクのサイジングに必要な値を計測する
+- 持続スループット（永続化されたコメント数/秒）
+- 取り込みから永続化までのレイテンシ（p50/p99、コメントの投稿時刻からBatchWriteItem完了まで）
+- 常駐メモリ量（ピーク）
+
+使用例:
+    python benchmark.py --rate 500 --streams 4 --duration 60 --pipeline queue
+    python benchmark.py --rate 200 --endpoint-url http://localhost:8000  # DynamoDB Local
+    python benchmark.py --replay recordings/xxxxxxxxxxx-20250101T120000.chat.jsonl.gz --speed 4
+    python benchmark.py --compare-parsers 50000  # CHAT_PARSE_MODE default/rawの解析コスト比較
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import zlib
+import random
+import argparse
+import threading
+from typing import Dict, Any, List
+
+BENCHMARK_VIDEO_PREFIX = 'bench'
+BENCHMARK_CHANNEL_ID = 'UCbenchmark'
+RSS_SAMPLE_INTERVAL = 0.5  # 秒
+PARSER_ROUNDS = 5  # 解析比較の繰り返し回数（最速値を採用）
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Comment collector load benchmark')
+    parser.add_argument('--rate', type=float, default=100, help='配信ごとの平均コメント数/秒')
+    parser.add_argument('--burstiness', type=float, default=0.5, help='流量倍率の対数標準偏差 (0で一定)')
+    parser.add_argument('--authors', type=int, default=1000, help='配信ごとの投稿者の種類数')
+    parser.add_argument('--duration', type=float, default=30, help='コメントを生成する秒数')
+    parser.add_argument('--streams', type=int, default=1, help='並行して収集する配信数')
+    parser.add_argument('--replay', help='合成コメントの代わりに再生するチャット記録ファイル（CHAT_RECORD_DIRで記録）')
+    parser.add_argument('--speed', type=float, default=1, help='--replayの再生速度の倍率')
+    parser.add_argument('--pipeline', choices=['inline', 'queue', 'spool'], default='inline', help='COLLECTOR_PIPELINE_MODE')
+    parser.add_argument('--storage', choices=['item', 'chunked'], default='item', help='COMMENT_STORAGE_MODE')
+    parser.add_argument('--endpoint-url', help='DynamoDB LocalなどのエンドポイントURL（省略時はインメモリの代替を使用）')
+    parser.add_argument('--write-latency-ms', type=float, default=5, help='インメモリ代替のBatchWriteItem応答時間（ミリ秒）')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='インメモリ代替でUnprocessedItemsとして返すアイテムの割合 (0-1)')
+    parser.add_argument('--compare-parsers', type=int, default=0, metavar='N',
+                        help='収集の代わりにN件の合成アクションでCHAT_PARSE_MODE default/rawの解析を比較')
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力')
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """main.pyは読み込み時に環境変数を参照するため、import前に設定する"""
+    os.environ['CHAT_SOURCE'] = 'replay' if args.replay else 'synthetic'
+    os.environ['CHAT_REPLAY_PATH'] = args.replay or ''
+    os.environ['CHAT_REPLAY_SPEED'] = str(args.speed)
+    os.environ['CHAT_REPLAY_REBASE'] = 'true'
+    os.environ['CHAT_RECORD_DIR'] = ''
+    os.environ['SYNTHETIC_RATE'] = str(args.rate)
+    os.environ['SYNTHETIC_BURSTINESS'] = str(args.burstiness)
+    os.environ['SYNTHETIC_AUTHORS'] = str(args.authors)
+    os.environ['SYNTHETIC_DURATION'] = str(args.duration)
+    os.environ['COLLECTOR_PIPELINE_MODE'] = args.pipeline
+    os.environ['COMMENT_STORAGE_MODE'] = args.storage
+    os.environ['COMMENT_LOG_MODE'] = 'aggregate'
+    os.environ['COLLECTOR_RESUME'] = 'false'
+    os.environ.setdefault('ENVIRONMENT', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+    if not args.endpoint_url:
+        # インメモリ代替ではAWSに接続しないためダミーの認証情報で十分
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+
+class InMemoryTable:
+    """CommentCollectorが使用するTableメソッドのインメモリ代替（TaskStatus・LiveStreams用）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get_item(self, Key: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        with self.lock:
+            item = self.items.get(json.dumps(Key, sort_keys=True))
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        key = {'video_id': Item.get('video_id')}
+        with self.lock:
+            self.items[json.dumps(key, sort_keys=True)] = dict(Item)
+        return {}
+
+    def update_item(self, Key: Dict[str, Any], ExpressionAttributeValues: Dict[str, Any] = None, **kwargs) -> Dict[str, Any]:
+        # 計測に必要なのは最終値のみのため、更新式は解釈せず値をそのまま保持
+        values = {name.lstrip(':'): value for name, value in (ExpressionAttributeValues or {}).items()}
+        with self.lock:
+            item = self.items.setdefault(json.dumps(Key, sort_keys=True), dict(Key))
+            item.update(values)
+        return {}
+
+
+class InMemoryDynamoDB:
+    """
+    DynamoDBのインメモリ代替
+
+    Comments書き込みは件数のみ保持する（アイテムを保持するとコレクターのメモリ計測に混ざるため）。
+    """
+
+    def __init__(self, write_latency: float = 0.0, throttle_rate: float = 0.0):
+        self.write_latency = write_latency
+        self.throttle_rate = throttle_rate
+        self.tables = {}
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def Table(self, name: str) -> InMemoryTable:
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = InMemoryTable(name)
+            return self.tables[name]
+
+    def batch_write_item(self, RequestItems: Dict[str, list], **kwargs) -> Dict[str, Any]:
+        if self.write_latency:
+            time.sleep(self.write_latency)
+
+        unprocessed = {}
+        written = 0
+        for table_name, requests in RequestItems.items():
+            rejected = [request for request in requests if self.throttle_rate and random.random() < self.throttle_rate]
+            if rejected:
+                unprocessed[table_name] = rejected
+            written += len(requests) - len(rejected)
+
+        with self.lock:
+            self.written += written
+        return {'UnprocessedItems': unprocessed}
+
+
+class PersistRecorder:
+    """BatchWriteItemクライアントをラップし、永続化されたコメントごとのレイテンシを記録"""
+
+    def __init__(self, client, posted_at_index: int, comments_table: str):
+        self.client = client
+        self.comments_table = comments_table
+        self.posted_at_index = posted_at_index
+        self.latencies_ms = []
+        self.expected = {}  # comment_id -> 投稿時刻（ミリ秒）
+        self.persisted = 0
+        self.first_persist = None
+        self.last_persist = None
+        self.lock = threading.Lock()
+
+    def expect(self, video_id: str, comments: list) -> None:
+        """チャットソースが返したコメントの投稿時刻を登録"""
+        with self.lock:
+            for comment in comments:
+                self.expected[f"{video_id}#{comment.id}"] = comment.timestamp
+
+    def batch_write_item(self, RequestItems: Dict[str, list], **kwargs) -> Dict[str, Any]:
+        response = self.client.batch_write_item(RequestItems=RequestItems, **kwargs)
+        now = time.time()
+
+        latencies = []
+        for table_name, requests in RequestItems.items():
+            if table_name != self.comments_table:
+                continue
+            unprocessed = {
+                request['PutRequest']['Item']['comment_id']['S']
+                for request in response.get('UnprocessedItems', {}).get(table_name, [])
+            }
+            for request in requests:
+                if request['PutRequest']['Item']['comment_id']['S'] not in unprocessed:
+                    latencies.extend(now * 1000 - posted_at for posted_at in self._posted_at_ms(request['PutRequest']['Item']))
+
+        with self.lock:
+            self.latencies_ms.extend(latencies)
+            self.persisted += len(latencies)
+            if latencies:
+                self.first_persist = self.first_persist or now
+                self.last_persist = now
+        return response
+
+    def _posted_at_ms(self, item: Dict[str, Any]) -> List[int]:
+        """書き込まれたアイテムに含まれるコメントの投稿時刻（ミリ秒）"""
+        if 'payload' in item:
+            # chunkedモード: 圧縮ペイロードの各レコードから取得
+            records = json.loads(zlib.decompress(item['payload']['B']))
+            return [record[self.posted_at_index] for record in records]
+
+        # itemモード: チャットソースが返した時点で登録した投稿時刻
+        with self.lock:
+            posted_at = self.expected.pop(item['comment_id']['S'], None)
+        return [posted_at] if posted_at is not None else []
+
+
+class TrackedChatSource:
+    """チャットソースをラップし、返したコメント数と投稿時刻を記録"""
+
+    def __init__(self, source, video_id: str, recorder: PersistRecorder):
+        self.source = source
+        self.video_id = video_id
+        self.recorder = recorder
+        self.generated = 0
+        self.continuation = None
+
+    def is_alive(self) -> bool:
+        return self.source.is_alive()
+
+    def get(self):
+        page = self.source.get()
+        self.generated += len(page.items)
+        self.recorder.expect(self.video_id, page.items)
+        return page
+
+    def terminate(self) -> None:
+        self.source.terminate()
+
+    def raise_for_status(self) -> None:
+        self.source.raise_for_status()
+
+
+class RssSampler:
+    """一定間隔で常駐メモリ量を計測してピークを保持"""
+
+    def __init__(self, read_rss):
+        self.read_rss = read_rss
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, self.read_rss())
+            self.stopped.wait(RSS_SAMPLE_INTERVAL)
+
+
+def ensure_tables(resource, main) -> None:
+    """DynamoDB Localなどにテーブルが無ければ作成"""
+    schemas = {
+        main.COMMENTS_TABLE: [('comment_id', 'HASH'), ('video_id', 'RANGE')],
+        main.TASKSTATUS_TABLE: [('video_id', 'HASH')],
+        main.LIVESTREAMS_TABLE: [('video_id', 'HASH')],
+        main.ROLLUPS_TABLE: [('video_id', 'HASH'), ('bucket', 'RANGE')],
+        main.AUTHORS_TABLE: [('author_channel_id', 'HASH')],
+    }
+    existing = resource.meta.client.list_tables()['TableNames']
+    for name, keys in schemas.items():
+        if name in existing:
+            continue
+        resource.create_table(
+            TableName=name,
+            KeySchema=[{'AttributeName': attribute, 'KeyType': key_type} for attribute, key_type in keys],
+            AttributeDefinitions=[{'AttributeName': attribute, 'AttributeType': 'S'} for attribute, _ in keys],
+            BillingMode='PAY_PER_REQUEST'
+        ).wait_until_exists()
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+
+    if args.endpoint_url:
+        import boto3
+        main.dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+        ensure_tables(main.dynamodb, main)
+        client = main.dynamodb.meta.client
+    else:
+        main.dynamodb = client = InMemoryDynamoDB(args.write_latency_ms / 1000, args.throttle_rate)
+
+    recorder = PersistRecorder(client, main.CommentRecord.__slots__.index('posted_at_ms'), main.COMMENTS_TABLE)
+    main.comment_writer = main.CommentBatchWriter(client=recorder)
+
+    # 生成件数の集計とレイテンシ計測のため、作成したチャットソースの出力を記録
+    sources = []
+    source_factory = main.CHAT_SOURCES[main.CHAT_SOURCE]
+
+    def create_source(video_id: str, channel_id: str):
+        source = TrackedChatSource(source_factory(video_id, channel_id), video_id, recorder)
+        sources.append(source)
+        return source
+
+    main.register_chat_source(main.CHAT_SOURCE, create_source)
+
+    sampler = RssSampler(main.read_rss_bytes)
+    sampler.start()
+    baseline_rss = main.read_rss_bytes()
+
+    pipeline = main.create_pipeline()
+    collectors = [
+        main.CommentCollector(f"{BENCHMARK_VIDEO_PREFIX}{i:03d}", BENCHMARK_CHANNEL_ID, pipeline=pipeline)
+        for i in range(args.streams)
+    ]
+    threads = [
+        threading.Thread(target=collector.start_collection, name=f"stream-{collector.video_id}")
+        for collector in collectors
+    ]
+
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if pipeline:
+        pipeline.close()
+    finished = time.time()
+    sampler.stop()
+
+    generated = sum(source.generated for source in sources)
+    persist_window = (recorder.last_persist or finished) - started
+    return {
+        'source': main.CHAT_SOURCE,
+        'streams': args.streams,
+        'pipeline': args.pipeline,
+        'storage': args.storage,
+        'target_rate': args.rate * args.streams if not args.replay else None,
+        'generated': generated,
+        'persisted': recorder.persisted,
+        'lost': generated - recorder.persisted,
+        'elapsed_seconds': round(finished - started, 2),
+        'throughput_per_second': round(recorder.persisted / persist_window, 1) if persist_window > 0 else 0.0,
+        'latency_p50_ms': round(percentile(recorder.latencies_ms, 0.50), 1),
+        'latency_p99_ms': round(percentile(recorder.latencies_ms, 0.99), 1),
+        'latency_max_ms': round(max(recorder.latencies_ms, default=0.0), 1),
+        'write_throttles': main.comment_writer.throttle_count,
+        'rss_baseline_mb': round(baseline_rss / 1024 / 1024, 1),
+        'rss_peak_mb': round(sampler.peak / 1024 / 1024, 1),
+    }
+
+
+def build_raw_actions(count: int, authors: int) -> List[Dict[str, Any]]:
+    """get_live_chatのaddChatItemActionを模した合成アクション（通常・絵文字・スパチャ・メンバー加入・バッジを含む）"""
+    rng = random.Random(0)
+    base_usec = int(time.time() * 1000000)
+    badges = {
+        'OWNER': {'liveChatAuthorBadgeRenderer': {'icon': {'iconType': 'OWNER'}}},
+        'MODERATOR': {'liveChatAuthorBadgeRenderer': {'icon': {'iconType': 'MODERATOR'}}},
+        'VERIFIED': {'liveChatAuthorBadgeRenderer': {'icon': {'iconType': 'VERIFIED'}}},
+        'MEMBER': {'liveChatAuthorBadgeRenderer': {'customThumbnail': {'thumbnails': [{'url': 'https://example.com/badge.png'}]}}},
+    }
+    emoji = {'emoji': {'emojiId': 'UC/kusa', 'shortcuts': [':_kusa:'], 'image': {'thumbnails': [{'url': 'https://example.com/kusa.png'}]}}}
+
+    actions = []
+    for i in range(count):
+        author = rng.randrange(max(1, authors))
+        renderer = {
+            'id': f"raw{i:08d}",
+            'timestampUsec': str(base_usec + i * 20000),
+            'authorName': {'simpleText': f"viewer{author}"},
+            'authorExternalChannelId': f"UCraw{author:06d}",
+            'authorPhoto': {'thumbnails': [{'url': 'https://example.com/s.png'}, {'url': 'https://example.com/l.png'}]},
+            'message': {'runs': [{'text': f"comment {i} "}, emoji] if i % 4 == 0 else [{'text': f"comment {i}"}]},
+        }
+        if author % 50 == 0:
+            renderer['authorBadges'] = [badges[rng.choice(list(badges))]]
+
+        roll = rng.random()
+        if roll < 0.05:
+            key = 'liveChatPaidMessageRenderer'
+            renderer['purchaseAmountText'] = {'simpleText': '¥1,000'}
+        elif roll < 0.07:
+            key = 'liveChatPaidStickerRenderer'
+            renderer['purchaseAmountText'] = {'simpleText': '¥500'}
+            renderer['sticker'] = {'thumbnails': [{'url': '//example.com/sticker.png'}]}
+            del renderer['message']
+        elif roll < 0.09:
+            key = 'liveChatMembershipItemRenderer'
+            renderer['headerSubtext'] = {'runs': [{'text': 'Welcome to '}, {'text': 'the club'}]}
+            del renderer['message']
+        elif roll < 0.095:
+            # 投稿者チャンネルIDの無いアクション（どちらの解析でも除外される）
+            key = 'liveChatTextMessageRenderer'
+            del renderer['authorExternalChannelId']
+        else:
+            key = 'liveChatTextMessageRenderer'
+        actions.append({'addChatItemAction': {'item': {key: renderer}}})
+    return actions
+
+
+def compare_parsers(args: argparse.Namespace) -> Dict[str, Any]:
+    """同じアクションをDefaultProcessor + format_commentとRawChatProcessorで解析し、結果の一致と所要時間を比較"""
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+    import pytchat
+
+    actions = build_raw_actions(args.compare_parsers, args.authors)
+    received_at = '2025-01-01T00:00:00+00:00'
+
+    def parse_default():
+        page = pytchat.DefaultProcessor().process([{'video_id': 'bench', 'timeout': 5, 'chatdata': actions}])
+        return [main.CommentCollector.format_comment(comment, received_at) for comment in page.items]
+
+    def parse_raw():
+        page = main.RawChatProcessor().process([{'video_id': 'bench', 'timeout': 5, 'chatdata': actions}])
+        return [main.CommentCollector.format_comment(record, received_at) for record in page.items]
+
+    timings = {}
+    results = {}
+    # DefaultProcessorは除外したアクションごとにERRORログを出すため、計測中はログを止める
+    logging.disable(logging.ERROR)
+    try:
+        for name, parse in (('default', parse_default), ('raw', parse_raw)):
+            best = None
+            for _ in range(PARSER_ROUNDS):
+                started = time.perf_counter()
+                results[name] = parse()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+    finally:
+        logging.disable(logging.NOTSET)
+
+    default_rows = [record.astuple() for record in results['default']]
+    raw_rows = [record.astuple() for record in results['raw']]
+    return {
+        'actions': len(actions),
+        'records': len(raw_rows),
+        'identical': default_rows == raw_rows,
+        'default_us_per_action': round(timings['default'] / len(actions) * 1000000, 2),
+        'raw_us_per_action': round(timings['raw'] / len(actions) * 1000000, 2),
+        'default_actions_per_second': round(len(actions) / timings['default']),
+        'raw_actions_per_second': round(len(actions) / timings['raw']),
+        'speedup': round(timings['default'] / timings['raw'], 2),
+    }
+
+
+def main_cli():
+    args = parse_args()
+    if args.compare_parsers:
+        result = compare_parsers(args)
+        title = "Chat parser comparison"
+    else:
+        result = run_benchmark(args)
+        title = "Collector benchmark"
+
+    if args.json:
+        print(json.dumps(result))
+        return
+
+    print()
+    print(f"=== {title} ===")
+    for key, value in result.items():
+        print(f"  {key:24s} {value}")
+
+
+if __name__ == "__main__":
+    main_cli()
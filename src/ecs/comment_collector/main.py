@@ -9,15 +9,41 @@ YouTubeライブ配信のコメントをリアルタイムで収集してDynamoD
 """
 
 import os
+import re
 import sys
 import time
 import json
+import math
+import heapq
+import queue
+import gzip
+import hashlib
+import random
+import signal
+import threading
+import zlib
 import boto3
 import logging
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+import multiprocessing
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Tuple
 import pytchat
-from botocore.exceptions import ClientError
+from pytchat.paramgen import liveparam
+from boto3.dynamodb.types import Binary, TypeSerializer
+from botocore.exceptions import BotoCoreError, ClientError
+
+# 列指向エクスポート用（未インストールの場合はエクスポート無効）
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 # ログ設定
 logging.basicConfig(
@@ -29,45 +55,2443 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# AWS クライアント初期化
-dynamodb = boto3.resource('dynamodb')
+# AWS クライアント初期化
+dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
+
+# 環境変数
+VIDEO_ID = os.environ.get('VIDEO_ID')
+CHANNEL_ID = os.environ.get('CHANNEL_ID')
+ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+COMMENTS_TABLE = os.environ.get('DYNAMODB_TABLE_COMMENTS', f'{ENVIRONMENT}-Comments')
+TASKSTATUS_TABLE = os.environ.get('DYNAMODB_TABLE_TASKSTATUS', f'{ENVIRONMENT}-TaskStatus')
+LIVESTREAMS_TABLE = os.environ.get('DYNAMODB_TABLE_LIVESTREAMS', f'{ENVIRONMENT}-LiveStreams')
+ROLLUPS_TABLE = os.environ.get('DYNAMODB_TABLE_ROLLUPS', f'{ENVIRONMENT}-Rollups')
+AUTHORS_TABLE = os.environ.get('DYNAMODB_TABLE_AUTHORS', f'{ENVIRONMENT}-Authors')
+
+# マルチストリームモード設定
+# single: 1タスク1配信 / multi: 1プロセスで複数配信を並行収集
+COLLECTOR_MODE = os.environ.get('COLLECTOR_MODE', 'single')
+VIDEO_IDS = os.environ.get('VIDEO_IDS', '')  # 初期配信リスト "video_id:channel_id,..."
+COLLECTOR_COMMAND_QUEUE_URL = os.environ.get('COLLECTOR_COMMAND_QUEUE_URL')
+MAX_STREAMS_PER_TASK = int(os.environ.get('MAX_STREAMS_PER_TASK', '10'))  # 1配信あたり約40MB（バッファ・重複排除キャッシュ・集計）を見込み、512MBのタスクに収まる数
+
+# スーパーバイザーモード設定
+# supervisor: 複数のワーカープロセス（各ワーカーはmultiモード相当）に配信を分散して全コアを使う
+SUPERVISOR_WORKERS = int(os.environ.get('SUPERVISOR_WORKERS', '0'))  # ワーカープロセス数 (0でCPU数)
+SUPERVISOR_HEARTBEAT_INTERVAL = 5  # 秒 (ワーカーが配信ごとのコメント数を報告する間隔)
+SUPERVISOR_HEARTBEAT_TIMEOUT = int(os.environ.get('SUPERVISOR_HEARTBEAT_TIMEOUT', '60'))  # 秒 (報告が途絶えたワーカーを再起動)
+SUPERVISOR_RESTART_MAX_DELAY = 60  # 秒 (連続クラッシュ時の再起動間隔の上限)
+SUPERVISOR_STABLE_SECONDS = 300  # 秒 (この時間動き続けたワーカーは再起動回数をリセット)
+SUPERVISOR_STATUS_KEY = '__multi_stream_collector__'  # 集約状況を書き込むTaskStatusキー（タスク起動Lambdaと共通）
+DEFAULT_EXPECTED_RATE = float(os.environ.get('DEFAULT_EXPECTED_RATE', '1'))  # 件/秒 (expected_rate未指定の配信の想定流量)
+RATE_SMOOTHING = 0.3  # 実測流量の指数移動平均の係数
+
+# 設定
+MAX_RETRY_COUNT = 3
+RETRY_DELAY = 5  # 秒
+RETRY_MAX_DELAY = 60  # 秒 (再接続バックオフの上限)
+HEALTH_CHECK_INTERVAL = 30  # 秒
+LEASE_DURATION = int(os.environ.get('LEASE_DURATION', str(HEALTH_CHECK_INTERVAL * 3)))  # 秒 (生存リースの有効期間)
+STATUS_TTL_SECONDS = int(os.environ.get('STATUS_TTL_SECONDS', str(7 * 24 * 3600)))  # 秒 (最終更新後にTaskStatusを自動削除するまでの期間)
+BATCH_SIZE = 25  # DynamoDB書き込みバッチサイズ
+
+# ポーリング間隔設定
+POLL_MIN_INTERVAL = float(os.environ.get('POLL_MIN_INTERVAL', '0.5'))  # 秒 (高負荷時の最短間隔)
+POLL_BASE_INTERVAL = float(os.environ.get('POLL_BASE_INTERVAL', '1'))  # 秒 (通常時の間隔)
+POLL_MAX_INTERVAL = float(os.environ.get('POLL_MAX_INTERVAL', '10'))  # 秒 (閑散時・エラー時の最長間隔)
+POLL_BUSY_ITEMS = int(os.environ.get('POLL_BUSY_ITEMS', '20'))  # 1回の取得でこの件数以上なら高負荷と判定
+POLL_ERROR_BASE_INTERVAL = 2  # 秒 (エラー時バックオフの初期値)
+
+# ログ設定
+# all: コメントごとにINFOログ / aggregate: 定期的な集計ログ + サンプリングしたコメントログ
+COMMENT_LOG_MODE = os.environ.get('COMMENT_LOG_MODE', 'all')
+COMMENT_LOG_SAMPLE_RATE = float(os.environ.get('COMMENT_LOG_SAMPLE_RATE', '0'))  # aggregateモードでコメントを出力する割合 (0-1)
+STATS_LOG_INTERVAL = float(os.environ.get('STATS_LOG_INTERVAL', '60'))  # 秒 (集計ログ出力間隔)
+
+# チャット再開チェックポイント設定
+RESUME_ENABLED = os.environ.get('COLLECTOR_RESUME', 'true').lower() == 'true'  # 配信中は無制限に再接続
+CHECKPOINT_INTERVAL = float(os.environ.get('CHECKPOINT_INTERVAL', '10'))  # 秒 (TaskStatusへの書き込み間隔)
+CHECKPOINT_MAX_PAST_SEC = int(os.environ.get('CHECKPOINT_MAX_PAST_SEC', '3600'))  # 秒 (遡って取得する最大時間)
+
+# 重複コメント抑止設定 (再接続時にYouTubeが再送するコメントを除外)
+DEDUP_CACHE_SIZE = int(os.environ.get('DEDUP_CACHE_SIZE', '50000'))  # 0で無効
+
+# 投稿者ディメンション設定 (itemモードのコメントには投稿者IDだけを保存し、属性はAuthorsテーブルに保存)
+AUTHOR_CACHE_SIZE = int(os.environ.get('AUTHOR_CACHE_SIZE', '20000'))  # 0で無効 (コメントに投稿者属性を埋め込む)
+UNKNOWN_AUTHOR_ID = 'unknown'  # チャンネルIDが取得できなかった投稿者（属性はコメントに埋め込む）
+
+# 保存形式設定
+# item: 1コメント1アイテム / chunked: 一定時間分のコメントを圧縮して1アイテムに格納
+COMMENT_STORAGE_MODE = os.environ.get('COMMENT_STORAGE_MODE', 'item')
+CHUNK_SECONDS = float(os.environ.get('CHUNK_SECONDS', '10'))  # 秒 (1チャンクに含める時間幅)
+CHUNK_MAX_COMMENTS = int(os.environ.get('CHUNK_MAX_COMMENTS', '1000'))  # 1チャンクの最大コメント数 (アイテムサイズ上限対策)
+CHUNK_MAX_BYTES = int(os.environ.get('CHUNK_MAX_BYTES', '350000'))  # 圧縮後ペイロードの最大バイト数 (DynamoDBの400KB上限に余裕を持たせる)
+
+# GSI書き込みシャーディング設定 (大規模配信でvideo_id-timestamp-indexの1パーティションへの書き込み集中を分散)
+# 有効時はvideo_idに「video_id#シャード番号」を保存する
+COMMENT_SHARD_COUNT = int(os.environ.get('COMMENT_SHARD_COUNT', '0'))  # 0/1で無効 (配信ごとにLiveStreamsへ記録し、記録済みの配信はその値を使う)
+
+# 列指向エクスポート設定 (分析用にParquet/Arrowファイルを出力)
+COLUMNAR_EXPORT_TARGET = os.environ.get('COLUMNAR_EXPORT_TARGET', '')  # s3://bucket/prefix またはローカルディレクトリ (空で無効)
+COLUMNAR_EXPORT_FORMAT = os.environ.get('COLUMNAR_EXPORT_FORMAT', 'parquet')  # parquet | arrow
+COLUMNAR_EXPORT_ROLL_SECONDS = float(os.environ.get('COLUMNAR_EXPORT_ROLL_SECONDS', '300'))  # 秒 (セグメントを書き出す間隔)
+COLUMNAR_EXPORT_ROLL_ROWS = int(os.environ.get('COLUMNAR_EXPORT_ROLL_ROWS', '50000'))  # セグメントの最大行数
+
+# 取得/書き込みパイプライン設定
+# inline: 取得ループ内で直接書き込み / queue: 有界キュー経由でライターワーカーが書き込み
+# spool: ローカルディスクの追記型スプール経由でドレイナーが書き込み
+PIPELINE_MODE = os.environ.get('COLLECTOR_PIPELINE_MODE', 'inline')
+COMMENT_QUEUE_MAX_BATCHES = int(os.environ.get('COMMENT_QUEUE_MAX_BATCHES', '200'))  # キューに保持する最大バッチ数
+WRITER_WORKERS = int(os.environ.get('WRITER_WORKERS', '2'))
+QUEUE_PUT_TIMEOUT = 5  # 秒 (バックプレッシャー警告間隔)
+DRAIN_TIMEOUT = 60  # 秒 (終了時にキューを空にする最大待ち時間)
+WRITER_MAX_CONCURRENCY = int(os.environ.get('WRITER_MAX_CONCURRENCY', '8'))  # 並列BatchWriteItem数の上限
+WRITE_MAX_ATTEMPTS = int(os.environ.get('WRITE_MAX_ATTEMPTS', '8'))  # UnprocessedItems・スロットリング時の最大試行回数
+WRITE_BACKOFF_BASE = 0.05  # 秒 (再試行バックオフの初期値)
+WRITE_BACKOFF_MAX = 5  # 秒 (再試行バックオフの上限)
+WRITE_PACE_MAX = 1  # 秒 (スロットリング時に空けるBatchWriteItem間隔の上限)
+DYNAMODB_BATCH_LIMIT = 25  # BatchWriteItem 1回あたりの最大アイテム数
+THROTTLE_ERROR_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+STOP_TIMEOUT = int(os.environ.get('STOP_TIMEOUT', '30'))  # 秒 (ECSのstopTimeout: SIGTERMからSIGKILLまでの猶予)
+SHUTDOWN_MARGIN = 3  # 秒 (最終ステータス書き込みとプロセス終了のために残す時間)
+SPOOL_DIR = os.environ.get('SPOOL_DIR', '/tmp/comment-spool')
+SPOOL_SEGMENT_MAX_BYTES = int(os.environ.get('SPOOL_SEGMENT_MAX_BYTES', str(4 * 1024 * 1024)))
+SPOOL_SEGMENT_MAX_AGE = float(os.environ.get('SPOOL_SEGMENT_MAX_AGE', '2'))  # 秒 (セグメントを封止するまでの最大時間)
+SPOOL_MAX_BACKOFF = 60  # 秒 (DynamoDB書き込み失敗時の最大待機)
+# 書き込めなかったバッチの保存先（スプールと同じ行形式のため、.segとしてスプールに戻せば再生される）
+DEAD_LETTER_DIR = os.environ.get('DEAD_LETTER_DIR', os.path.join(SPOOL_DIR, 'dead-letter'))
+COMMAND_POLL_WAIT = 10  # 秒 (コマンドキューのロングポーリング)
+STREAM_SUMMARY_INTERVAL = 60  # 秒 (マルチストリーム状態ログ間隔)
+
+# 分単位集計設定
+ROLLUP_FLUSH_INTERVAL = float(os.environ.get('ROLLUP_FLUSH_INTERVAL', '30'))  # 秒 (Rollupsテーブルへの書き込み間隔、0で無効)
+ROLLUP_RETAIN_MINUTES = 5  # 書き込み済みの分集計をメモリに保持する分数 (遅れて届いたコメント用)
+ROLLUP_TOTAL_KEY = '__all__'  # 全配信の日次集計のvideo_id
+HLL_PRECISION = 10  # HyperLogLogのレジスタ数 2^10 (標準誤差 約3%)
+ROLLUP_MERGE_ATTEMPTS = 3  # 他プロセスと同時更新になった分集計を読み直してマージする回数 (1回のflushあたり)
+
+# トレンド（頻出語・絵文字）設定
+TRENDING_SNAPSHOT_INTERVAL = float(os.environ.get('TRENDING_SNAPSHOT_INTERVAL', '30'))  # 秒 (スナップショット書き込み間隔、0で無効)
+TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', '20'))  # ウィンドウごとに保存する上位件数
+TRENDING_WINDOWS = (('1m', 60), ('5m', 300), ('60m', 3600))  # (名前, 秒)
+TRENDING_WINDOW_SLICES = 6  # ウィンドウを分割するスライス数 (スライド幅 = ウィンドウ / スライス数)
+CMS_EPSILON = 0.001  # Count-Min Sketchの相対誤差 (過大推定はウィンドウ内の総トークン数 × ε 以下)
+CMS_WIDTH = math.ceil(math.e / CMS_EPSILON)  # Count-Min Sketchの幅 (e/ε = 2719)
+CMS_DEPTH = 4  # Count-Min Sketchの深さ (ハッシュ関数の数、誤差を超える確率 e^-4 ≒ 2%)
+TRENDING_SNAPSHOT_BUCKET = 'trending'  # Rollupsテーブルのスナップショットのbucket
+# 絵文字ショートコード(:smile:)・絵文字・英数字語・カタカナ語・漢字語をトークンとして抽出
+TOKEN_PATTERN = re.compile(
+    r':[^:\s]+:|[\U0001F000-\U0001FAFF\u2600-\u27BF]|[A-Za-z0-9]{2,}|[ァ-ヴー]{2,}|[一-龯々]+'
+)
+
+# チャット取得元設定
+# youtube: pytchatでYouTubeから取得 / synthetic: 負荷試験用の合成コメントを生成
+# replay: CHAT_RECORD_DIRに記録したチャットを再生
+CHAT_SOURCE = os.environ.get('CHAT_SOURCE', 'youtube')
+# youtubeのアクション解析方法
+# default: pytchatのDefaultProcessorでChatオブジェクトを生成 / raw: アクションJSONから保存項目だけを取り出す
+CHAT_PARSE_MODE = os.environ.get('CHAT_PARSE_MODE', 'default')
+CHAT_PARSE_MODES = ('default', 'raw')
+SYNTHETIC_RATE = float(os.environ.get('SYNTHETIC_RATE', '50'))  # 件/秒 (平均流量)
+SYNTHETIC_BURSTINESS = float(os.environ.get('SYNTHETIC_BURSTINESS', '0.5'))  # 取得ごとの流量倍率の対数標準偏差 (0で一定)
+SYNTHETIC_AUTHORS = int(os.environ.get('SYNTHETIC_AUTHORS', '1000'))  # 投稿者の種類数
+SYNTHETIC_DURATION = float(os.environ.get('SYNTHETIC_DURATION', '0'))  # 秒 (生成を終了するまでの時間、0で無制限)
+CHAT_RECORD_DIR = os.environ.get('CHAT_RECORD_DIR', '')  # 受信したチャットを記録するディレクトリ (空で無効)
+CHAT_REPLAY_PATH = os.environ.get('CHAT_REPLAY_PATH', '')  # 再生する記録ファイル
+CHAT_REPLAY_SPEED = float(os.environ.get('CHAT_REPLAY_SPEED', '1'))  # 再生速度の倍率
+CHAT_REPLAY_REBASE = os.environ.get('CHAT_REPLAY_REBASE', 'true').lower() == 'true'  # 投稿時刻を再生時刻に置き換える
+CHAT_RECORDING_FORMAT = 'chat-recording/1'
+RECORDED_COMMENT_FIELDS = ('id', 'type', 'message', 'datetime', 'timestamp', 'amountString')
+RECORDED_AUTHOR_FIELDS = ('name', 'channelId', 'isChatOwner', 'isChatModerator', 'isVerified')
+
+# メトリクス設定
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))  # Prometheus形式の/metricsを公開するポート (0で無効)
+METRICS_EMF_INTERVAL = float(os.environ.get('METRICS_EMF_INTERVAL', '0'))  # 秒 (CloudWatch EMFの出力間隔、0で無効)
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'YoutubeCommentCollector')
+METRICS_EMF_MAX_SAMPLES = 100  # EMF 1メトリクスあたりの最大値数
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # 秒
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# ライブコメント配信設定 (Server-Sent Eventsで新着コメントをプッシュ)
+COMMENT_STREAM_PORT = int(os.environ.get('COMMENT_STREAM_PORT', '0'))  # /streams/{video_id}/eventsを公開するポート (0で無効)
+COMMENT_STREAM_BUFFER = int(os.environ.get('COMMENT_STREAM_BUFFER', '2000'))  # 再開用に配信ごとに保持する直近イベント数
+COMMENT_STREAM_SUBSCRIBER_QUEUE = int(os.environ.get('COMMENT_STREAM_SUBSCRIBER_QUEUE', '1000'))  # 購読者ごとの未送信イベント上限 (超えたら切断)
+COMMENT_STREAM_KEEPALIVE = 15  # 秒 (無通信時にコメント行を送る間隔)
+COMMENT_STREAM_RETRY_MS = 3000  # クライアントの再接続間隔 (SSEのretry)
+COMMENT_STREAM_PATH = re.compile(r'^/streams/([^/]+)/events$')
+
+
+class PollScheduler:
+    """チャット量に応じてポーリング間隔を調整するスケジューラ"""
+    
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL, base_interval: float = POLL_BASE_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL, busy_items: int = POLL_BUSY_ITEMS):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.busy_items = busy_items
+        self.interval = base_interval
+        self.consecutive_errors = 0
+    
+    def on_success(self, item_count: int, server_timeout: float = 0) -> float:
+        """
+        取得成功後の次回ポーリング間隔を計算
+        
+        Args:
+            item_count: 今回取得したコメント数
+            server_timeout: YouTubeが返した次回取得までの推奨待機時間（秒）
+            
+        Returns:
+            次回ポーリングまでの間隔（秒）
+        """
+        self.consecutive_errors = 0
+        
+        if item_count >= self.busy_items:
+            # 取得が溢れている: 間隔を半分に短縮（閑散からの復帰時は基準間隔から）
+            self.interval = max(self.min_interval, min(self.interval, self.base_interval) / 2)
+            return self.interval
+        
+        if item_count == 0:
+            # 閑散: 指数的に間隔を延長
+            self.interval = min(self.max_interval, self.interval * 2)
+        else:
+            # 通常: 基準間隔に戻す
+            self.interval = self.base_interval
+        
+        # 取得が溢れていない限りYouTubeの推奨待機時間より短くしない
+        return max(self.interval, min(server_timeout, self.max_interval))
+    
+    def on_error(self) -> float:
+        """取得失敗後の待機時間を計算（指数バックオフ）"""
+        self.consecutive_errors += 1
+        return min(self.max_interval, POLL_ERROR_BASE_INTERVAL * (2 ** (self.consecutive_errors - 1)))
+
+
+class CollectorStats:
+    """コメント収集の集計値（一定間隔でまとめてログ出力）"""
+    
+    def __init__(self, interval: float = STATS_LOG_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._reset(time.time())
+    
+    def _reset(self, now: float) -> None:
+        self.window_started = now
+        self.comments = 0
+        self.flushes = 0
+        self.saved = 0
+        self.write_seconds = 0.0
+        self.max_write_seconds = 0.0
+    
+    def record_comments(self, count: int) -> None:
+        with self.lock:
+            self.comments += count
+    
+    def record_flush(self, count: int, write_seconds: float) -> None:
+        with self.lock:
+            self.flushes += 1
+            self.saved += count
+            self.write_seconds += write_seconds
+            self.max_write_seconds = max(self.max_write_seconds, write_seconds)
+    
+    def maybe_report(self, video_id: str) -> None:
+        """集計間隔を過ぎていれば集計ログを出力してリセット"""
+        now = time.time()
+        if now - self.window_started < self.interval:
+            return
+        
+        with self.lock:
+            elapsed = now - self.window_started
+            avg_write_ms = self.write_seconds / self.flushes * 1000 if self.flushes else 0.0
+            logger.info(
+                "Stats [%s]: %d comments (%.1f/s), %d flushes, %d saved, write latency avg %.0fms max %.0fms",
+                video_id, self.comments, self.comments / elapsed, self.flushes, self.saved,
+                avg_write_ms, self.max_write_seconds * 1000
+            )
+            self._reset(now)
+
+
+class CommentIdCache:
+    """書き込み済みコメントIDを保持する上限付きLRUキャッシュ"""
+    
+    def __init__(self, max_size: int = DEDUP_CACHE_SIZE):
+        self.max_size = max_size
+        self.ids = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+    
+    def check_and_add(self, comment_id: str) -> bool:
+        """
+        コメントIDを登録
+        
+        Returns:
+            既に登録済み（重複）の場合True
+        """
+        with self.lock:
+            self.lookups += 1
+            
+            if comment_id in self.ids:
+                self.hits += 1
+                self.ids.move_to_end(comment_id)
+                return True
+            
+            self.ids[comment_id] = None
+            if len(self.ids) > self.max_size:
+                self.ids.popitem(last=False)
+            return False
+    
+    def discard(self, comment_ids) -> None:
+        """書き込めなかったコメントIDを削除（再送されたときに再度保存できるようにする）"""
+        with self.lock:
+            for comment_id in comment_ids:
+                self.ids.pop(comment_id, None)
+    
+    @property
+    def hit_rate(self) -> float:
+        """重複として除外した割合"""
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class AuthorCache:
+    """
+    投稿者属性の上限付きLRUキャッシュ
+    
+    プロセス内の全配信で共有し、初出または名前・認証状態が変わった投稿者だけを
+    Authorsテーブルにupsertする。配信者・モデレーターは配信ごとの役割のためコメント側に残す。
+    """
+    
+    def __init__(self, max_size: int = AUTHOR_CACHE_SIZE):
+        self.max_size = max_size
+        self.authors = OrderedDict()  # author_channel_id -> (author_name, is_verified)
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+    
+    def changed_items(self, records: List['CommentRecord']) -> List[Dict[str, Any]]:
+        """キャッシュと属性が異なる投稿者のAuthorsアイテム（1バッチ内で投稿者IDは一意）"""
+        items = {}
+        updated_at = datetime.now(timezone.utc).isoformat()
+        
+        with self.lock:
+            for record in records:
+                author_id = record.author_channel_id
+                if author_id == UNKNOWN_AUTHOR_ID:
+                    continue
+                
+                self.lookups += 1
+                attributes = (record.author_name, bool(record.is_verified))
+                if self.authors.get(author_id) == attributes:
+                    self.hits += 1
+                    self.authors.move_to_end(author_id)
+                    continue
+                
+                self.authors[author_id] = attributes
+                self.authors.move_to_end(author_id)
+                if len(self.authors) > self.max_size:
+                    self.authors.popitem(last=False)
+                
+                items[author_id] = {
+                    'author_channel_id': author_id,
+                    'author_name': attributes[0],
+                    'is_verified': attributes[1],
+                    'updated_at': updated_at
+                }
+        
+        return list(items.values())
+    
+    def forget(self, author_ids: List[str]) -> None:
+        """書き込みに失敗した投稿者をキャッシュから外し、次のバッチで再度upsertさせる"""
+        with self.lock:
+            for author_id in author_ids:
+                self.authors.pop(author_id, None)
+    
+    def write(self, records: List['CommentRecord']) -> None:
+        """属性が変わった投稿者をAuthorsテーブルに書き込み"""
+        items = self.changed_items(records)
+        if not items:
+            return
+        
+        try:
+            comment_writer.write(AUTHORS_TABLE, items)
+        except (ClientError, UnprocessedItemsError):
+            self.forget([item['author_channel_id'] for item in items])
+            raise
+    
+    @property
+    def hit_rate(self) -> float:
+        """書き込みを省略できた割合"""
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class Histogram:
+    """固定バケットのヒストグラム（EMF用に出力間隔内の値をサンプリング保持）"""
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.samples = []
+        self._window_count = 0
+    
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        
+        # 出力間隔内の値をリザーバサンプリング（EMFの値数上限対策）
+        self._window_count += 1
+        if len(self.samples) < METRICS_EMF_MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            index = random.randrange(self._window_count)
+            if index < METRICS_EMF_MAX_SAMPLES:
+                self.samples[index] = value
+    
+    def take_samples(self) -> List[float]:
+        """出力間隔内のサンプルを取り出してリセット"""
+        samples = self.samples
+        self.samples = []
+        self._window_count = 0
+        return samples
+
+
+class MetricsRegistry:
+    """コレクターのメトリクス（Prometheus形式で公開、またはCloudWatch EMFで出力）"""
+    
+    # 名前: (種別, 説明, EMFメトリクス名, 単位, ヒストグラムのバケット)
+    DEFINITIONS = {
+        'comments_received_total': ('counter', 'Comments fetched from live chat', 'CommentsReceived', 'Count', None),
+        'comments_saved_total': ('counter', 'Comments written to DynamoDB', 'CommentsSaved', 'Count', None),
+        'fetch_errors_total': ('counter', 'Live chat fetch errors', 'FetchErrors', 'Count', None),
+        'reconnects_total': ('counter', 'Live chat reconnect attempts', 'Reconnects', 'Count', None),
+        'write_retries_total': ('counter', 'DynamoDB batch write retries', 'WriteRetries', 'Count', None),
+        'unprocessed_items_total': ('counter', 'Items returned as UnprocessedItems by BatchWriteItem', 'UnprocessedItems', 'Count', None),
+        'write_throttles_total': ('counter', 'BatchWriteItem calls throttled by DynamoDB', 'WriteThrottles', 'Count', None),
+        'dead_letter_batches_total': ('counter', 'Batches moved to the dead-letter directory', 'DeadLetterBatches', 'Count', None),
+        'fetch_latency_seconds': ('histogram', 'Live chat fetch latency', 'FetchLatency', 'Seconds', LATENCY_BUCKETS),
+        'write_latency_seconds': ('histogram', 'DynamoDB batch write latency', 'WriteLatency', 'Seconds', LATENCY_BUCKETS),
+        'batch_size': ('histogram', 'Comments per write batch', 'BatchSize', 'Count', BATCH_SIZE_BUCKETS),
+        'queue_depth': ('gauge', 'Batches waiting in the write pipeline', 'QueueDepth', 'Count', None),
+        'writer_concurrency': ('gauge', 'Adaptive BatchWriteItem concurrency limit', 'WriterConcurrency', 'Count', None),
+        'rss_bytes': ('gauge', 'Resident memory of the collector process', 'MemoryRSS', 'Bytes', None),
+    }
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # (名前, video_id) -> 値またはHistogram
+        self.collectors = []
+        self._emitted = {}  # EMF出力済みのカウンター値
+        self._retired = set()  # 次回のEMF出力後に系列を破棄するvideo_id
+        self._last_emit = time.time()
+    
+    def inc(self, name: str, video_id: str = '', value: float = 1) -> None:
+        with self.lock:
+            key = (name, video_id)
+            self.values[key] = self.values.get(key, 0) + value
+    
+    def set_gauge(self, name: str, video_id: str, value: float) -> None:
+        with self.lock:
+            self.values[(name, video_id)] = value
+    
+    def observe(self, name: str, video_id: str, value: float) -> None:
+        with self.lock:
+            key = (name, video_id)
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(self.DEFINITIONS[name][4])
+            histogram.observe(value)
+    
+    def remove_video(self, video_id: str) -> None:
+        """収集を終えた配信の系列を破棄（EMF出力時は未出力の差分を出力してから破棄）"""
+        if not video_id:
+            return
+        with self.lock:
+            if METRICS_EMF_INTERVAL:
+                self._retired.add(video_id)
+            else:
+                self._drop_video(video_id)
+    
+    def _drop_video(self, video_id: str) -> None:
+        for key in [key for key in self.values if key[1] == video_id]:
+            del self.values[key]
+            self._emitted.pop(key, None)
+    
+    def add_collector(self, callback) -> None:
+        """出力直前に呼び出すゲージ更新処理を登録"""
+        self.collectors.append(callback)
+    
+    def refresh(self) -> None:
+        """プロセス単位のゲージを更新"""
+        self.set_gauge('rss_bytes', '', read_rss_bytes())
+        for callback in self.collectors:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+    
+    def render_prometheus(self) -> str:
+        """Prometheusテキスト形式で出力"""
+        self.refresh()
+        lines = []
+        with self.lock:
+            for name, (kind, help_text, _, _, _) in self.DEFINITIONS.items():
+                entries = sorted((video_id, value) for (key, video_id), value in self.values.items() if key == name)
+                if not entries:
+                    continue
+                
+                metric = f"collector_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                for video_id, value in entries:
+                    labels = f'video_id="{video_id}"' if video_id else ''
+                    selector = f"{{{labels}}}" if labels else ''
+                    if kind != 'histogram':
+                        lines.append(f"{metric}{selector} {value}")
+                        continue
+                    
+                    cumulative = 0
+                    prefix = f"{labels}," if labels else ''
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {value.count}')
+                    lines.append(f"{metric}_sum{selector} {value.sum}")
+                    lines.append(f"{metric}_count{selector} {value.count}")
+        return "\n".join(lines) + "\n"
+    
+    def build_emf_documents(self) -> List[Dict[str, Any]]:
+        """前回出力以降の値をCloudWatch Embedded Metric Format（video_id単位）で作成"""
+        self.refresh()
+        now = time.time()
+        documents = {}
+        
+        with self.lock:
+            elapsed = max(now - self._last_emit, 1e-6)
+            self._last_emit = now
+            
+            for (name, video_id), value in self.values.items():
+                kind, _, emf_name, unit, _ = self.DEFINITIONS[name]
+                if kind == 'counter':
+                    metric_value = value - self._emitted.get((name, video_id), 0)
+                    self._emitted[(name, video_id)] = value
+                elif kind == 'histogram':
+                    metric_value = value.take_samples()
+                    if not metric_value:
+                        continue
+                else:
+                    metric_value = value
+                
+                document = documents.setdefault(video_id, {'metrics': [], 'values': {}})
+                document['metrics'].append({'Name': emf_name, 'Unit': unit})
+                document['values'][emf_name] = metric_value
+                
+                if name == 'comments_received_total':
+                    document['metrics'].append({'Name': 'CommentsPerSecond', 'Unit': 'Count/Second'})
+                    document['values']['CommentsPerSecond'] = metric_value / elapsed
+            
+            for video_id in self._retired:
+                self._drop_video(video_id)
+            self._retired.clear()
+        
+        result = []
+        for video_id, document in documents.items():
+            emf = {
+                '_aws': {
+                    'Timestamp': int(now * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': METRICS_NAMESPACE,
+                        'Dimensions': [['VideoId']] if video_id else [[]],
+                        'Metrics': document['metrics']
+                    }]
+                },
+                **document['values']
+            }
+            if video_id:
+                emf['VideoId'] = video_id
+            result.append(emf)
+        return result
+    
+    def emit_emf(self) -> None:
+        """EMFドキュメントを標準出力に書き出し（CloudWatch Logsがメトリクスとして取り込む）"""
+        for document in self.build_emf_documents():
+            sys.stdout.write(json.dumps(document) + "\n")
+        sys.stdout.flush()
+
+
+def read_rss_bytes() -> int:
+    """プロセスの常駐メモリ量（バイト）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        # /procが無い環境では最大常駐メモリ量で代用（Linuxの単位はKB）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+metrics = MetricsRegistry()
+
+# SIGTERM受信時に設定される書き込み完了期限（epoch秒）
+shutdown_deadline = None
+
+
+def drain_timeout() -> float:
+    """書き込み完了を待てる残り時間（SIGTERM受信後はstopTimeoutの期限まで）"""
+    if shutdown_deadline is None:
+        return DRAIN_TIMEOUT
+    return max(0.0, shutdown_deadline - time.time())
+
+
+def install_shutdown_handler(on_shutdown) -> None:
+    """SIGTERM受信時に収集を停止し、stopTimeout内に残りのコメントを書き込ませる"""
+    def handle_signal(signum, frame):
+        global shutdown_deadline
+        if shutdown_deadline is not None:
+            return
+        shutdown_deadline = time.time() + max(1, STOP_TIMEOUT - SHUTDOWN_MARGIN)
+        logger.info(f"Received signal {signum}. Stopping collection and draining comments "
+                    f"(budget {drain_timeout():.0f}s)...")
+        on_shutdown()
+    
+    signal.signal(signal.SIGTERM, handle_signal)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """/metricsでPrometheus形式のメトリクスを返すハンドラ"""
+    
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        
+        body = metrics.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # スクレイプごとのアクセスログは出力しない
+        pass
+
+
+def start_metrics(pipeline=None, port_offset: int = 0) -> None:
+    """
+    メトリクスの公開・出力を開始（METRICS_PORT / METRICS_EMF_INTERVAL未設定の場合は何もしない）
+    
+    port_offsetはスーパーバイザーのワーカー番号（ワーカーごとにMETRICS_PORT + 番号で公開）
+    """
+    if not METRICS_PORT and not METRICS_EMF_INTERVAL:
+        return
+    
+    if pipeline:
+        metrics.add_collector(lambda: metrics.set_gauge('queue_depth', '', pipeline.queue_depth))
+    
+    if METRICS_PORT:
+        port = METRICS_PORT + port_offset
+        server = ThreadingHTTPServer(('', port), MetricsRequestHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Metrics endpoint listening on :{port}/metrics")
+    
+    if METRICS_EMF_INTERVAL:
+        def emf_loop():
+            while True:
+                time.sleep(METRICS_EMF_INTERVAL)
+                try:
+                    metrics.emit_emf()
+                except Exception as e:
+                    logger.warning(f"Failed to emit EMF metrics: {str(e)}")
+        
+        threading.Thread(target=emf_loop, name="metrics-emf", daemon=True).start()
+        logger.info(f"EMF metrics enabled: interval={METRICS_EMF_INTERVAL}s, namespace={METRICS_NAMESPACE}")
+
+
+class CommentSubscription:
+    """1接続分の購読（送信待ちイベントの有界キュー）"""
+    
+    def __init__(self, video_id: str, max_pending: int = COMMENT_STREAM_SUBSCRIBER_QUEUE):
+        self.video_id = video_id
+        self.events = queue.Queue(maxsize=max_pending)
+        self.closed = False
+    
+    def offer(self, event) -> bool:
+        """イベントを追加（満杯の場合は遅い購読者として閉じる）"""
+        try:
+            self.events.put_nowait(event)
+            return True
+        except queue.Full:
+            self.close()
+            return False
+    
+    def close(self) -> None:
+        self.closed = True
+        try:
+            self.events.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class CommentBroadcaster:
+    """
+    収集したコメントを配信ごとの購読者にファンアウト
+    
+    配信ごとに連番のイベントIDを振って直近COMMENT_STREAM_BUFFER件を保持し、
+    Last-Event-ID以降を再送してから新着の購読を始める（同じロック内で行うため欠落・重複なし）。
+    """
+    
+    def __init__(self, buffer_size: int = COMMENT_STREAM_BUFFER):
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.sequences = {}  # video_id -> 最新イベントID
+        self.buffers = {}  # video_id -> deque[(イベントID, JSON)]
+        self.subscribers = {}  # video_id -> set[CommentSubscription]
+    
+    def publish(self, video_id: str, channel_id: str, records: List['CommentRecord']) -> None:
+        """コメントをイベントとして保持し、購読者に送信"""
+        payloads = [json.dumps(comment_event(video_id, channel_id, record), ensure_ascii=False) for record in records]
+        
+        with self.lock:
+            buffer = self.buffers.get(video_id)
+            if buffer is None:
+                buffer = self.buffers[video_id] = deque(maxlen=self.buffer_size)
+            sequence = self.sequences.get(video_id, 0)
+            events = []
+            for payload in payloads:
+                sequence += 1
+                events.append((sequence, payload))
+            self.sequences[video_id] = sequence
+            buffer.extend(events)
+            
+            subscribers = self.subscribers.get(video_id, ())
+            for subscription in list(subscribers):
+                for event in events:
+                    if not subscription.offer(event):
+                        subscribers.discard(subscription)
+                        logger.warning(f"Dropped slow comment stream subscriber for video {video_id}")
+                        break
+    
+    def subscribe(self, video_id: str, last_event_id: Optional[int] = None) -> Tuple[CommentSubscription, list]:
+        """
+        購読を開始
+        
+        Returns:
+            (購読, last_event_id以降のバッファ済みイベント)
+        """
+        subscription = CommentSubscription(video_id)
+        with self.lock:
+            backlog = []
+            if last_event_id is not None:
+                backlog = [event for event in self.buffers.get(video_id, ()) if event[0] > last_event_id]
+            self.subscribers.setdefault(video_id, set()).add(subscription)
+        return subscription, backlog
+    
+    def unsubscribe(self, subscription: CommentSubscription) -> None:
+        with self.lock:
+            self.subscribers.get(subscription.video_id, set()).discard(subscription)
+    
+    def close(self) -> None:
+        """全購読者の接続を終了（クライアントはLast-Event-IDで再接続）"""
+        with self.lock:
+            for subscribers in self.subscribers.values():
+                for subscription in subscribers:
+                    subscription.close()
+            self.subscribers.clear()
+    
+    @property
+    def subscriber_count(self) -> int:
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+
+def comment_event(video_id: str, channel_id: str, record: 'CommentRecord') -> Dict[str, Any]:
+    """配信イベントのペイロード（GET /streams/{video_id}/commentsのコメントと同じ形式）"""
+    return {
+        'comment_id': f"{video_id}#{record.id}",
+        'video_id': video_id,
+        'channel_id': channel_id,
+        'author_name': record.author_name,
+        'author_channel_id': record.author_channel_id,
+        'message': record.message,
+        'timestamp': record.received_at,
+        'datetime': record.datetime,
+        'is_owner': record.is_owner,
+        'is_moderator': record.is_moderator,
+        'is_verified': record.is_verified,
+        'created_at': record.received_at
+    }
+
+
+class CommentStreamRequestHandler(BaseHTTPRequestHandler):
+    """GET /streams/{video_id}/eventsで新着コメントをServer-Sent Eventsとして送信するハンドラ"""
+    
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        match = COMMENT_STREAM_PATH.match(path)
+        if not match:
+            self.send_error(404)
+            return
+        
+        # EventSourceは再接続時にLast-Event-IDヘッダーを付ける。初回接続はクエリで指定
+        cursor = self.headers.get('Last-Event-ID')
+        if cursor is None:
+            params = dict(part.partition('=')[::2] for part in query.split('&') if part)
+            cursor = params.get('last_event_id')
+        try:
+            last_event_id = int(cursor) if cursor else None
+        except ValueError:
+            self.send_error(400, 'Invalid Last-Event-ID')
+            return
+        
+        subscription, backlog = comment_broadcaster.subscribe(match.group(1), last_event_id)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.end_headers()
+            self.wfile.write(f"retry: {COMMENT_STREAM_RETRY_MS}\n\n".encode('utf-8'))
+            self._write_events(backlog)
+            
+            while not subscription.closed:
+                try:
+                    event = subscription.events.get(timeout=COMMENT_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    break
+                
+                # 溜まっているイベントはまとめて書き込む
+                events = [event]
+                while len(events) < 100:
+                    try:
+                        event = subscription.events.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is None:
+                        subscription.closed = True
+                        break
+                    events.append(event)
+                self._write_events(events)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            comment_broadcaster.unsubscribe(subscription)
+    
+    def _write_events(self, events: list) -> None:
+        if not events:
+            return
+        body = ''.join(f"id: {event_id}\nevent: comment\ndata: {payload}\n\n" for event_id, payload in events)
+        self.wfile.write(body.encode('utf-8'))
+        self.wfile.flush()
+    
+    def log_message(self, format, *args):
+        # 接続ごとのアクセスログは出力しない
+        pass
+
+
+comment_broadcaster = CommentBroadcaster() if COMMENT_STREAM_PORT else None
+
+
+def start_comment_stream(port_offset: int = 0) -> None:
+    """ライブコメント配信サーバーを開始（COMMENT_STREAM_PORT未設定の場合は何もしない）"""
+    if not comment_broadcaster:
+        return
+    
+    port = COMMENT_STREAM_PORT + port_offset
+    server = ThreadingHTTPServer(('', port), CommentStreamRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="comment-stream-server", daemon=True).start()
+    logger.info(f"Comment stream listening on :{port}/streams/{{video_id}}/events")
+
+
+class CommentWritePipeline:
+    """コメント取得とDynamoDB書き込みを分離する有界キュー"""
+    
+    def __init__(self, max_batches: int = COMMENT_QUEUE_MAX_BATCHES, workers: int = WRITER_WORKERS):
+        self.queue = queue.Queue(maxsize=max_batches)
+        self.workers = []
+        self.backpressure_waits = 0
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        
+        for i in range(max(1, workers)):
+            worker = threading.Thread(target=self._worker, name=f"comment-writer-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        
+        logger.info(f"Write pipeline started: workers={len(self.workers)}, max_batches={max_batches}")
+    
+    @property
+    def queue_depth(self) -> int:
+        """書き込み待ちバッチ数"""
+        return self.queue.qsize()
+    
+    def submit(self, collector: 'CommentCollector', batch: list, seq: int) -> None:
+        """バッチをキューに投入（満杯の場合は空きが出るまでブロック）"""
+        with self._pending_cond:
+            self._pending[collector] = self._pending.get(collector, 0) + 1
+        
+        while True:
+            try:
+                self.queue.put((collector, batch, seq), timeout=QUEUE_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                # キュー満杯: 書き込みが追いつくまで取得側を止める
+                self.backpressure_waits += 1
+                logger.warning(f"Write queue full ({self.queue_depth} batches). Fetch is waiting for writers...")
+    
+    def wait_idle(self, collector: 'CommentCollector', timeout: float = DRAIN_TIMEOUT) -> bool:
+        """指定コレクターのバッチが全て書き込まれるまで待機"""
+        deadline = time.time() + timeout
+        with self._pending_cond:
+            while self._pending.get(collector, 0) > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.error(f"Timed out waiting for {self._pending[collector]} pending batches")
+                    return False
+                self._pending_cond.wait(remaining)
+            self._pending.pop(collector, None)
+        return True
+    
+    def close(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """キューを空にしてワーカーを停止"""
+        for _ in self.workers:
+            self.queue.put(None)
+        
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.time()))
+        
+        logger.info(f"Write pipeline stopped. Backpressure waits: {self.backpressure_waits}")
+    
+    def _worker(self) -> None:
+        """キューからバッチを取り出してDynamoDBに書き込むワーカー"""
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            
+            collector, batch, seq = entry
+            try:
+                for attempt in range(1, MAX_RETRY_COUNT + 1):
+                    try:
+                        collector.save_comments_batch(batch)
+                        collector.complete_batch(seq, 'persisted')
+                        break
+                    except Exception as e:
+                        if attempt >= MAX_RETRY_COUNT:
+                            logger.error(f"Giving up on batch of {len(batch)} comments after {attempt} attempts: {str(e)}")
+                            collector.complete_batch(seq, 'dropped', str(e))
+                        else:
+                            metrics.inc('write_retries_total', collector.video_id)
+                            time.sleep(RETRY_DELAY)
+            finally:
+                with self._pending_cond:
+                    self._pending[collector] = self._pending.get(collector, 0) - 1
+                    self._pending_cond.notify_all()
+
+
+def is_retryable_error(error: ClientError) -> bool:
+    """スロットリングまたはサーバー側（5xx）のエラーか"""
+    if error.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES:
+        return True
+    return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+
+
+def write_dead_letter(video_id: str, channel_id: str, records: List['CommentRecord'], reason: str) -> bool:
+    """
+    書き込めなかったバッチをDEAD_LETTER_DIRに保存
+    
+    Returns:
+        保存できた場合True
+    """
+    line = json.dumps({
+        'v': video_id,
+        'c': channel_id,
+        'r': [record.astuple() for record in records],
+        'e': reason
+    }, ensure_ascii=False) + '\n'
+    path = os.path.join(DEAD_LETTER_DIR, f"{int(time.time() * 1000)}-{os.getpid()}-{threading.get_ident()}.jsonl")
+    try:
+        os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except OSError as e:
+        logger.error(f"Failed to write {len(records)} comments of {video_id} to dead letter: {str(e)}")
+        return False
+    
+    metrics.inc('dead_letter_batches_total', video_id)
+    logger.error(f"Moved {len(records)} comments of {video_id} to dead letter {path}: {reason}")
+    return True
+
+
+class CommentSpool:
+    """
+    DynamoDBへの書き込み前にコメントを保持する追記型のディスクスプール
+    
+    - 全コメントを書き込み中セグメント (*.open) に追記
+    - サイズまたは経過時間で封止 (*.seg) し、ドレイナーがDynamoDBに再生
+    - 書き込み完了したセグメントは削除
+    - 起動時に残っているセグメントを再生
+    
+    バッチの完了（チェックポイント・配信等）はドレイナーがDynamoDBに書き込んだ後に通知する。
+    SPOOL_DIRはタスクのローカルディスクのため、再生できるのは同じコンテナが再起動した場合のみ。
+    """
+    
+    def __init__(self, spool_dir: str = SPOOL_DIR,
+                 segment_max_bytes: int = SPOOL_SEGMENT_MAX_BYTES,
+                 segment_max_age: float = SPOOL_SEGMENT_MAX_AGE):
+        self.spool_dir = spool_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.comments_table = dynamodb.Table(COMMENTS_TABLE)
+        self.lock = threading.Lock()
+        self.collectors = {}
+        self._pending = {}
+        self._pending_cond = threading.Condition()
+        self._active_file = None
+        self._active_path = None
+        self._active_opened_at = 0.0
+        self._active_lines = 0
+        # (セグメント番号, 行番号) -> (コレクター, バッチ番号)。DynamoDBへの書き込み後に完了を通知する
+        self._inflight = {}
+        self._stopped = threading.Event()
+        
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._next_seq = self._recover_segments()
+        
+        self.drainer = threading.Thread(target=self._drain_loop, name='spool-drainer', daemon=True)
+        self.drainer.start()
+        
+        logger.info(f"Comment spool started: dir={self.spool_dir}, pending segments={len(self._sealed_segments())}")
+    
+    @property
+    def queue_depth(self) -> int:
+        """DynamoDB書き込み待ちバッチ数"""
+        with self._pending_cond:
+            return sum(self._pending.values())
+    
+    def _recover_segments(self) -> int:
+        """前回プロセスの書き込み中セグメントを封止し、次のセグメント番号を返す"""
+        last_seq = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            seq_str, ext = os.path.splitext(name)
+            if ext not in ('.open', '.seg') or not seq_str.isdigit():
+                continue
+            last_seq = max(last_seq, int(seq_str))
+            if ext == '.open':
+                path = os.path.join(self.spool_dir, name)
+                os.rename(path, os.path.join(self.spool_dir, f"{seq_str}.seg"))
+                logger.info(f"Recovered unsealed spool segment: {name}")
+        return last_seq + 1
+    
+    def _sealed_segments(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.seg'))
+    
+    def _seal_active(self) -> None:
+        """書き込み中セグメントを封止（lock保持中に呼び出す）"""
+        if not self._active_file:
+            return
+        self._active_file.close()
+        os.rename(self._active_path, self._active_path[:-len('.open')] + '.seg')
+        self._active_file = None
+        self._active_path = None
+    
+    def submit(self, collector: 'CommentCollector', batch: list, seq: int) -> None:
+        """バッチをスプールに追記（書き込み確定はドレイナーがDynamoDBへの書き込み後に通知）"""
+        # 1バッチ = 1行のJSONレコード（コメントはタプル形式で保持）
+        line = json.dumps({
+            'v': collector.video_id,
+            'c': collector.channel_id,
+            's': collector.shard_count,
+            'r': [record.astuple() for record in batch]
+        }, ensure_ascii=False) + '\n'
+        
+        with self.lock:
+            if not self._active_file:
+                self._active_path = os.path.join(self.spool_dir, f"{self._next_seq:012d}.open")
+                self._next_seq += 1
+                self._active_file = open(self._active_path, 'a', encoding='utf-8')
+                self._active_opened_at = time.time()
+                self._active_lines = 0
+            
+            self._active_file.write(line)
+            self._active_file.flush()
+            
+            # 追記に成功したバッチだけを書き込み待ちとして数える（ドレイナーは封止後に読むためlock内で加算）
+            segment = os.path.basename(self._active_path)[:-len('.open')]
+            self._inflight[(segment, self._active_lines)] = (collector, seq)
+            self._active_lines += 1
+            with self._pending_cond:
+                self.collectors[collector.video_id] = collector
+                self._pending[collector.video_id] = self._pending.get(collector.video_id, 0) + 1
+            
+            if self._active_file.tell() >= self.segment_max_bytes:
+                self._seal_active()
+    
+    def wait_idle(self, collector: 'CommentCollector', timeout: float = DRAIN_TIMEOUT) -> bool:
+        """指定コレクターのスプール済みコメントが全て書き込まれるまで待機"""
+        deadline = time.time() + timeout
+        with self._pending_cond:
+            while self._pending.get(collector.video_id, 0) > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.error(f"Timed out waiting for {self._pending[collector.video_id]} spooled batches (kept on disk)")
+                    return False
+                self._pending_cond.wait(remaining)
+            self._pending.pop(collector.video_id, None)
+            self.collectors.pop(collector.video_id, None)
+        return True
+    
+    def close(self, timeout: float = DRAIN_TIMEOUT) -> None:
+        """書き込み中セグメントを封止し、ドレイナーの完了を待って停止"""
+        with self.lock:
+            self._seal_active()
+        
+        deadline = time.time() + timeout
+        while self._sealed_segments() and time.time() < deadline:
+            time.sleep(0.2)
+        
+        self._stopped.set()
+        self.drainer.join(max(0, deadline - time.time()))
+        
+        remaining = self._sealed_segments()
+        if remaining:
+            logger.warning(f"Comment spool stopped with {len(remaining)} segments left on disk")
+        else:
+            logger.info("Comment spool stopped. All segments drained")
+    
+    def _drain_loop(self) -> None:
+        """封止済みセグメントを順番にDynamoDBへ再生"""
+        while not self._stopped.is_set():
+            with self.lock:
+                if self._active_file and time.time() - self._active_opened_at >= self.segment_max_age:
+                    self._seal_active()
+            
+            segments = self._sealed_segments()
+            if not segments:
+                self._stopped.wait(0.2)
+                continue
+            
+            for name in segments:
+                if self._stopped.is_set():
+                    break
+                self._drain_segment(os.path.join(self.spool_dir, name))
+    
+    def _drain_segment(self, path: str) -> None:
+        """1セグメントを書き込み、完了後に削除"""
+        segment = os.path.basename(path)[:-len('.seg')]
+        records = []
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                if not line.strip():
+                    continue
+                try:
+                    records.append((line_number, json.loads(line)))
+                except json.JSONDecodeError:
+                    # プロセス停止時の書きかけ行は破棄
+                    logger.warning(f"Skipping corrupt spool record in {os.path.basename(path)}")
+        
+        for line_number, record in records:
+            with self.lock:
+                inflight = self._inflight.pop((segment, line_number), None)
+            try:
+                video_id = record['v']
+                comment_records = [CommentRecord.from_tuple(values) for values in record['r']]
+                items = build_storage_items(video_id, record['c'], comment_records,
+                                            record.get('s', COMMENT_SHARD_COUNT))
+            except (KeyError, TypeError) as e:
+                logger.warning(f"Skipping malformed spool record in {os.path.basename(path)}: {str(e)}")
+                if inflight:
+                    inflight[0].complete_batch(inflight[1], 'dropped', f"Malformed spool record: {str(e)}")
+                continue
+            
+            write_started = time.time()
+            error = self._write_with_retry(video_id, items, comment_records)
+            write_seconds = time.time() - write_started
+            
+            with self._pending_cond:
+                collector = self.collectors.get(video_id)
+                if video_id in self._pending:
+                    self._pending[video_id] -= 1
+                self._pending_cond.notify_all()
+            
+            if inflight:
+                # このプロセスで投入したバッチは投入元に完了を通知（droppedはデッドレター退避と重複除外の解除を含む）
+                if error:
+                    inflight[0].complete_batch(inflight[1], 'dropped', error)
+                else:
+                    inflight[0].record_saved(len(comment_records), write_seconds)
+                    inflight[0].complete_batch(inflight[1], 'persisted')
+            elif error:
+                # 前回プロセスのレコードは、同じ配信を収集中ならその重複除外キャッシュから外して再取得させる
+                write_dead_letter(video_id, record['c'], comment_records, error)
+                if collector and collector.dedup_cache:
+                    collector.dedup_cache.discard(comment_record.id for comment_record in comment_records)
+            else:
+                logger.info(f"Replayed {len(comment_records)} spooled comments for video {video_id}")
+        
+        # 書きかけで読めなかった行のバッチは失われたものとして完了させる
+        with self.lock:
+            lost = [key for key in self._inflight if key[0] == segment]
+            lost = [self._inflight.pop(key) for key in lost]
+        for collector, seq in lost:
+            collector.complete_batch(seq, 'dropped', 'Spool record could not be read')
+        
+        os.remove(path)
+    
+    def _write_with_retry(self, video_id: str, items: list, records: List['CommentRecord']) -> Optional[str]:
+        """
+        DynamoDBへ書き込み（スロットリング・5xx・通信エラーは成功するまで指数バックオフで再試行）
+        
+        Returns:
+            再試行しても解消しないエラー（ValidationException等）の場合はその内容、成功時はNone
+        """
+        delay = 1
+        while True:
+            try:
+                write_authors(records)
+                write_comment_items(self.comments_table, items)
+                return None
+            except ClientError as e:
+                if not is_retryable_error(e):
+                    # 1件の不正なレコードで共有スプール全体を止めない
+                    return str(e)
+                logger.warning(f"Spool drain write failed, retrying in {delay}s: {str(e)}")
+            except (UnprocessedItemsError, BotoCoreError) as e:
+                logger.warning(f"Spool drain write failed, retrying in {delay}s: {str(e)}")
+            
+            metrics.inc('write_retries_total', video_id)
+            time.sleep(delay)
+            delay = min(delay * 2, SPOOL_MAX_BACKOFF)
+
+
+class CommentRecord:
+    """1コメント分の収集データ（DynamoDB形式への変換は書き込み時に行う）"""
+    
+    __slots__ = ('id', 'author_name', 'author_channel_id', 'message', 'datetime',
+                 'is_owner', 'is_moderator', 'is_verified', 'received_at', 'posted_at_ms')
+    
+    def __init__(self, id, author_name, author_channel_id, message, datetime,
+                 is_owner, is_moderator, is_verified, received_at, posted_at_ms):
+        self.id = id
+        self.author_name = author_name
+        self.author_channel_id = author_channel_id
+        self.message = message
+        self.datetime = datetime
+        self.is_owner = is_owner
+        self.is_moderator = is_moderator
+        self.is_verified = is_verified
+        self.received_at = received_at
+        self.posted_at_ms = posted_at_ms
+    
+    def astuple(self) -> tuple:
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+    
+    @classmethod
+    def from_tuple(cls, values) -> 'CommentRecord':
+        return cls(*values)
+
+
+def build_comment_items(video_id: str, channel_id: str, records: List[CommentRecord]) -> List[Dict[str, Any]]:
+    """CommentRecordのリストをDynamoDBアイテムに変換（投稿者キャッシュ有効時は投稿者名・認証状態を省略）"""
+    comment_id_prefix = f"{video_id}#"
+    items = []
+    for record in records:
+        item = {
+            'comment_id': comment_id_prefix + record.id,
+            'video_id': video_id,
+            'channel_id': channel_id,
+            'author_channel_id': record.author_channel_id,
+            'message': record.message,
+            'timestamp': record.received_at,
+            'datetime': record.datetime,
+            'is_owner': record.is_owner,
+            'is_moderator': record.is_moderator,
+            'created_at': record.received_at
+        }
+        if not author_cache or record.author_channel_id == UNKNOWN_AUTHOR_ID:
+            item['author_name'] = record.author_name
+            item['is_verified'] = record.is_verified
+        items.append(item)
+    return items
+
+
+def build_chunk_item(video_id: str, channel_id: str, records: List[CommentRecord]) -> Dict[str, Any]:
+    """CommentRecordのリストを圧縮チャンクアイテムに変換"""
+    first = records[0]
+    last = records[-1]
+    payload = json.dumps([record.astuple() for record in records], ensure_ascii=False, separators=(',', ':'))
+    
+    return {
+        'comment_id': f"{video_id}#chunk#{first.received_at}#{first.id}",
+        'video_id': video_id,
+        'channel_id': channel_id,
+        'item_type': 'chunk',
+        'timestamp': last.received_at,
+        'chunk_start': first.received_at,
+        'comment_count': len(records),
+        'payload_fields': list(CommentRecord.__slots__),
+        'payload': Binary(zlib.compress(payload.encode('utf-8'))),
+        'created_at': last.received_at
+    }
+
+
+def build_chunk_items(video_id: str, channel_id: str, records: List[CommentRecord]) -> List[Dict[str, Any]]:
+    """
+    CommentRecordのリストを圧縮チャンクアイテムに変換し、圧縮後ペイロードが
+    CHUNK_MAX_BYTESを超える場合は件数を半分ずつに分割する
+    """
+    item = build_chunk_item(video_id, channel_id, records)
+    if len(item['payload'].value) <= CHUNK_MAX_BYTES or len(records) == 1:
+        return [item]
+    
+    middle = len(records) // 2
+    return (build_chunk_items(video_id, channel_id, records[:middle])
+            + build_chunk_items(video_id, channel_id, records[middle:]))
+
+
+def shard_comment_items(video_id: str, items: List[Dict[str, Any]], shard_count: int) -> List[Dict[str, Any]]:
+    """
+    comment_idのハッシュでシャードを選び、video_idを「video_id#シャード番号」に置き換える
+    
+    video_idはテーブルのソートキー兼GSIのパーティションキーのため、書き込みはGSI上で
+    シャード数分のパーティションに分散される。元のvideo_idはcomment_idの接頭辞から復元できる。
+    """
+    for item in items:
+        shard = zlib.crc32(item['comment_id'].encode('utf-8')) % shard_count
+        item['video_id'] = f"{video_id}#{shard}"
+    return items
+
+
+def build_storage_items(video_id: str, channel_id: str, records: List[CommentRecord],
+                        shard_count: int = COMMENT_SHARD_COUNT) -> List[Dict[str, Any]]:
+    """COMMENT_STORAGE_MODEに応じてDynamoDBアイテムに変換（shard_countは配信に記録したシャード数）"""
+    if COMMENT_STORAGE_MODE == 'chunked':
+        items = build_chunk_items(video_id, channel_id, records)
+    else:
+        items = build_comment_items(video_id, channel_id, records)
+    if shard_count > 1:
+        return shard_comment_items(video_id, items, shard_count)
+    return items
+
+
+class UnprocessedItemsError(Exception):
+    """再試行上限までにBatchWriteItemが全アイテムを書き込めなかった"""
+
+
+class CommentBatchWriter:
+    """
+    並列・スロットリング対応のBatchWriteItemライター
+    
+    プロセス内の全書き込みで共有し、スロットリングを検知したら並列数を半減・
+    呼び出し間隔を延長し、成功が続けば並列数を1ずつ戻す（AIMD）。
+    """
+    
+    def __init__(self, client=None, max_concurrency: int = WRITER_MAX_CONCURRENCY,
+                 max_attempts: int = WRITE_MAX_ATTEMPTS):
+        self.client = client or dynamodb.meta.client
+        self.serializer = TypeSerializer()
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='batch-write')
+        self.concurrency = float(self.max_concurrency)
+        self.pace = 0.0
+        self.in_flight = 0
+        self.throttle_count = 0
+        self.cond = threading.Condition()
+    
+    def write(self, table_name: str, items: List[Dict[str, Any]]) -> None:
+        """アイテムを25件ずつに分割して並列に書き込み（全件完了まで待機）"""
+        if not items:
+            return
+        
+        video_id = items[0].get('video_id', '')
+        requests = [{'PutRequest': {'Item': {key: self.serializer.serialize(value) for key, value in item.items()}}}
+                    for item in items]
+        chunks = [requests[i:i + DYNAMODB_BATCH_LIMIT] for i in range(0, len(requests), DYNAMODB_BATCH_LIMIT)]
+        
+        if len(chunks) == 1:
+            self._write_chunk(table_name, chunks[0], video_id)
+            return
+        
+        futures = [self.executor.submit(self._write_chunk, table_name, chunk, video_id) for chunk in chunks]
+        for future in futures:
+            future.result()
+    
+    def _write_chunk(self, table_name: str, requests: list, video_id: str) -> None:
+        """1回分のBatchWriteItemを実行し、UnprocessedItemsをジッター付きバックオフで再試行"""
+        pending = requests
+        attempt = 0
+        
+        while pending:
+            self._acquire()
+            throttled = False
+            try:
+                response = self.client.batch_write_item(RequestItems={table_name: pending})
+                unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+                if unprocessed:
+                    metrics.inc('unprocessed_items_total', video_id, len(unprocessed))
+                    throttled = True
+                pending = unprocessed
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in THROTTLE_ERROR_CODES:
+                    raise
+                throttled = True
+            finally:
+                self._release(throttled, video_id)
+            
+            if not pending:
+                return
+            
+            attempt += 1
+            if attempt >= self.max_attempts:
+                raise UnprocessedItemsError(f"{len(pending)} items left unprocessed after {attempt} attempts")
+            
+            metrics.inc('write_retries_total', video_id)
+            time.sleep(self.backoff(attempt))
+    
+    def backoff(self, attempt: int) -> float:
+        """再試行までの待機時間（フルジッター付き指数バックオフ）"""
+        return random.uniform(0, min(WRITE_BACKOFF_MAX, WRITE_BACKOFF_BASE * (2 ** attempt)))
+    
+    def _acquire(self) -> None:
+        """並列数の上限に空きが出るまで待機し、スロットリング中は呼び出し間隔を空ける"""
+        with self.cond:
+            while self.in_flight >= int(self.concurrency):
+                self.cond.wait()
+            self.in_flight += 1
+            pace = self.pace
+        
+        if pace:
+            time.sleep(pace)
+    
+    def _release(self, throttled: bool, video_id: str) -> None:
+        """呼び出し結果に応じて並列数と呼び出し間隔を調整（AIMD）"""
+        with self.cond:
+            self.in_flight -= 1
+            
+            if throttled:
+                # 乗算的減少: 並列数を半減し、呼び出し間隔を延長
+                self.throttle_count += 1
+                self.concurrency = max(1.0, self.concurrency / 2)
+                self.pace = min(WRITE_PACE_MAX, max(WRITE_BACKOFF_BASE, self.pace * 2))
+            else:
+                # 加算的増加: 並列数1つ分の成功ごとに+1、呼び出し間隔は短縮
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+                self.pace = self.pace / 2 if self.pace > WRITE_BACKOFF_BASE / 8 else 0.0
+            
+            self.cond.notify_all()
+        
+        metrics.set_gauge('writer_concurrency', '', self.concurrency)
+        if throttled:
+            metrics.inc('write_throttles_total', video_id)
+
+
+comment_writer = CommentBatchWriter()
+
+
+author_cache = AuthorCache() if AUTHOR_CACHE_SIZE > 0 and COMMENT_STORAGE_MODE != 'chunked' else None
+
+
+def write_comment_items(table, items: list) -> None:
+    """コメントアイテムをDynamoDBにバッチ書き込み（共有ライター経由）"""
+    comment_writer.write(table.name, items)
+
+
+def write_authors(records: List['CommentRecord']) -> None:
+    """コメントより先に投稿者属性を書き込み（chunkedモードはペイロードに含むため不要）"""
+    if author_cache:
+        author_cache.write(records)
+
+
+class HyperLogLog:
+    """ユニーク数推定用のHyperLogLog（レジスタはBinaryとして保存しマージ可能）"""
+    
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytes = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+    
+    def add(self, value: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def merge(self, other: 'HyperLogLog') -> None:
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+    
+    def estimate(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        raw = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.size and zeros:
+            # 小さい値は線形カウントで補正
+            return int(round(self.size * math.log(self.size / zeros)))
+        return int(round(raw))
+
+
+class MinuteRollup:
+    """1分間の集計値（件数は未書き込み分を差分として保持）"""
+    __slots__ = ('authors', 'comments', 'owner', 'moderator', 'dirty', 'version')
+    
+    def __init__(self):
+        self.authors = HyperLogLog()
+        self.comments = 0
+        self.owner = 0
+        self.moderator = 0
+        self.dirty = False
+        self.version = None  # 最後に読み書きしたhll_version (未確認の場合None)
+
+
+class StreamRollups:
+    """
+    配信ごとの分単位集計（コメント数・ユニーク投稿者数・オーナー/モデレーター発言数）
+    
+    Rollupsテーブルに video_id + bucket="minute#YYYY-MM-DDTHH:MM" で書き込み、
+    全配信の日次コメント数を video_id="__all__" + bucket="day#YYYY-MM-DD" に加算する。
+    件数はADDで差分を加算するため、タスク再起動をまたいでも累積される。
+    HyperLogLogのレジスタはhll_versionを条件にした楽観的更新で書き込み、他プロセスが
+    先に書き込んでいた場合は読み直してレジスタごとの最大値でマージする。
+    addは書き込みが確定したバッチの完了処理（書き込みワーカー）から呼ばれるため、
+    収集スレッドのflushとはロックで排他する。
+    """
+    
+    def __init__(self, video_id: str, channel_id: str, flush_interval: float = ROLLUP_FLUSH_INTERVAL):
+        self.video_id = video_id
+        self.channel_id = channel_id
+        self.flush_interval = flush_interval
+        self.table = dynamodb.Table(ROLLUPS_TABLE)
+        self.minutes = {}
+        self.daily = {}
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+    
+    def add(self, record: CommentRecord) -> None:
+        posted_at = record.posted_at_ms / 1000 if record.posted_at_ms else time.time()
+        minute = datetime.fromtimestamp(posted_at, timezone.utc).strftime('%Y-%m-%dT%H:%M')
+        
+        with self.lock:
+            rollup = self.minutes.get(minute)
+            if rollup is None:
+                rollup = self.minutes[minute] = MinuteRollup()
+            rollup.authors.add(record.author_channel_id)
+            rollup.comments += 1
+            rollup.owner += bool(record.is_owner)
+            rollup.moderator += bool(record.is_moderator)
+            rollup.dirty = True
+            
+            day = minute[:10]
+            self.daily[day] = self.daily.get(day, 0) + 1
+    
+    def maybe_flush(self) -> None:
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self) -> None:
+        """未書き込みの集計をRollupsテーブルに書き込み"""
+        with self.lock:
+            self._flush()
+    
+    def _flush(self) -> None:
+        self.last_flush = time.time()
+        updated_at = datetime.now(timezone.utc).isoformat()
+        
+        for minute, rollup in list(self.minutes.items()):
+            if not rollup.dirty:
+                continue
+            try:
+                if self._write_minute(minute, rollup, updated_at):
+                    rollup.comments = rollup.owner = rollup.moderator = 0
+                    rollup.dirty = False
+                else:
+                    logger.warning(f"Rollup for {minute} is being updated concurrently. Retrying at next flush")
+            except ClientError as e:
+                logger.error(f"Error writing rollup for {minute}: {str(e)}")
+        
+        for day, count in list(self.daily.items()):
+            try:
+                self.table.update_item(
+                    Key={'video_id': ROLLUP_TOTAL_KEY, 'bucket': f"day#{day}"},
+                    UpdateExpression='SET updated_at = :updated_at ADD comment_count :comments',
+                    ExpressionAttributeValues={':updated_at': updated_at, ':comments': count}
+                )
+                del self.daily[day]
+            except ClientError as e:
+                logger.error(f"Error writing daily rollup for {day}: {str(e)}")
+        
+        # 書き込み済みの古い分集計を破棄
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=ROLLUP_RETAIN_MINUTES)).strftime('%Y-%m-%dT%H:%M')
+        for minute in [minute for minute, rollup in self.minutes.items() if minute < cutoff and not rollup.dirty]:
+            del self.minutes[minute]
+    
+    def _write_minute(self, minute: str, rollup: MinuteRollup, updated_at: str) -> bool:
+        """
+        分集計を書き込み（件数はADD、HLLレジスタは保存済みのレジスタとマージして置き換え）
+        
+        Returns:
+            書き込めた場合True（同時更新が続きROLLUP_MERGE_ATTEMPTS回で書き込めなかった場合False）
+        """
+        key = {'video_id': self.video_id, 'bucket': f"minute#{minute}"}
+        for _ in range(ROLLUP_MERGE_ATTEMPTS):
+            values = {
+                ':channel_id': self.channel_id,
+                ':unique_authors': rollup.authors.estimate(),
+                ':hll': Binary(bytes(rollup.authors.registers)),
+                ':next_version': (rollup.version or 0) + 1,
+                ':updated_at': updated_at,
+                ':comments': rollup.comments,
+                ':owner': rollup.owner,
+                ':moderator': rollup.moderator
+            }
+            if rollup.version is None:
+                # 保存済みのレジスタが無い場合のみ書き込める
+                condition = 'attribute_not_exists(hll)'
+            elif rollup.version == 0:
+                condition = 'attribute_not_exists(hll_version)'
+            else:
+                condition = 'hll_version = :version'
+                values[':version'] = rollup.version
+            
+            try:
+                self.table.update_item(
+                    Key=key,
+                    UpdateExpression=('SET channel_id = :channel_id, unique_authors = :unique_authors, hll = :hll, '
+                                      'hll_version = :next_version, updated_at = :updated_at '
+                                      'ADD comment_count :comments, owner_count :owner, moderator_count :moderator'),
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=values
+                )
+                rollup.version = values[':next_version']
+                return True
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+            
+            # 再起動前のタスクなど他プロセスが書き込んだレジスタを取り込んで再試行
+            item = self.table.get_item(Key=key, ConsistentRead=True).get('Item', {})
+            if 'hll' in item:
+                stored = HyperLogLog(registers=bytes(getattr(item['hll'], 'value', item['hll'])))
+                if len(stored.registers) == len(rollup.authors.registers):
+                    rollup.authors.merge(stored)
+            rollup.version = int(item.get('hll_version', 0))
+        return False
+
+
+class CountMinSketch:
+    """頻度推定用のCount-Min Sketch（同じ幅・深さのスケッチ同士で減算可能）"""
+    
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH):
+        self.width = width
+        self.rows = [array('l', [0]) * width for _ in range(depth)]
+    
+    @staticmethod
+    def indices(token: str, width: int = CMS_WIDTH, depth: int = CMS_DEPTH) -> List[int]:
+        """トークンの各行の列位置（2つのハッシュ値の線形結合で深さ分を生成）"""
+        digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], 'big')
+        h2 = int.from_bytes(digest[4:], 'big') | 1
+        return [(h1 + i * h2) % width for i in range(depth)]
+    
+    def add(self, indices: List[int], count: int = 1) -> None:
+        for row, index in zip(self.rows, indices):
+            row[index] += count
+    
+    def estimate(self, indices: List[int]) -> int:
+        return min(row[index] for row, index in zip(self.rows, indices))
+    
+    def subtract(self, other: 'CountMinSketch') -> None:
+        for row, other_row in zip(self.rows, other.rows):
+            for i, value in enumerate(other_row):
+                if value:
+                    row[i] -= value
+
+
+class WindowedTopK:
+    """
+    スライディングウィンドウ内の上位トークン
+    
+    ウィンドウをスライスに分割してスライスごとのスケッチと合計スケッチを持ち、
+    期限切れスライスを合計から減算する。上位候補は推定値のmin-heapで保持する。
+    """
+    
+    def __init__(self, window_seconds: float, top_k: int = TRENDING_TOP_K, slices: int = TRENDING_WINDOW_SLICES):
+        self.slice_seconds = window_seconds / slices
+        self.slice_count = slices
+        self.top_k = top_k
+        self.capacity = top_k * 5
+        self.slices = deque()
+        self.total = CountMinSketch()
+        self.heap = []  # (最後に確認した推定値, トークン)
+        self.candidates = {}  # トークン -> 列位置
+    
+    def _rotate(self, now: float) -> None:
+        current = int(now // self.slice_seconds)
+        while self.slices and self.slices[0][0] <= current - self.slice_count:
+            _, expired = self.slices.popleft()
+            self.total.subtract(expired)
+        if not self.slices or self.slices[-1][0] != current:
+            self.slices.append((current, CountMinSketch()))
+    
+    def add(self, token: str, indices: List[int], now: float) -> None:
+        self._rotate(now)
+        self.slices[-1][1].add(indices)
+        self.total.add(indices)
+        estimate = self.total.estimate(indices)
+        
+        if token in self.candidates:
+            return
+        if len(self.candidates) < self.capacity:
+            self.candidates[token] = indices
+            heapq.heappush(self.heap, (estimate, token))
+            return
+        
+        # ヒープの推定値は追加時点のものなので、最小の候補をスケッチの現在値で更新してから比較
+        while True:
+            stored, candidate = self.heap[0]
+            current = self.total.estimate(self.candidates[candidate])
+            if current == stored:
+                break
+            heapq.heapreplace(self.heap, (current, candidate))
+        
+        if estimate > self.heap[0][0]:
+            _, evicted = heapq.heapreplace(self.heap, (estimate, token))
+            self.candidates.pop(evicted, None)
+            self.candidates[token] = indices
+    
+    def top(self, now: float) -> List[Tuple[str, int]]:
+        """現在のウィンドウでの上位トークン（候補の推定値を再計算し、ヒープも更新）"""
+        self._rotate(now)
+        estimates = [(self.total.estimate(indices), token) for token, indices in self.candidates.items()]
+        estimates = [entry for entry in estimates if entry[0] > 0]
+        
+        # 期限切れで推定値が下がった候補を反映してヒープを作り直す
+        self.heap = list(estimates)
+        heapq.heapify(self.heap)
+        self.candidates = {token: self.candidates[token] for _, token in estimates}
+        
+        return [(token, count) for count, token in heapq.nlargest(self.top_k, estimates)]
+
+
+def tokenize_message(message: str) -> List[str]:
+    """コメント本文からトレンド集計用のトークンを抽出（1コメント内の重複は1回）"""
+    tokens = []
+    seen = set()
+    for token in TOKEN_PATTERN.findall(message or ''):
+        if token.isascii() and not token.startswith(':'):
+            token = token.lower()
+        if token not in seen:
+            seen.add(token)
+            tokens.append(token)
+    return tokens
+
+
+class TrendingTracker:
+    """
+    配信ごとの頻出語・絵文字（1/5/60分ウィンドウ）をRollupsテーブルにスナップショット
+    
+    addは書き込みが確定したバッチの完了処理（書き込みワーカー）から呼ばれるため、
+    収集スレッドのsnapshotとはロックで排他する。
+    """
+    
+    def __init__(self, video_id: str, channel_id: str, interval: float = TRENDING_SNAPSHOT_INTERVAL):
+        self.video_id = video_id
+        self.channel_id = channel_id
+        self.interval = interval
+        self.table = dynamodb.Table(ROLLUPS_TABLE)
+        self.windows = [(name, WindowedTopK(seconds)) for name, seconds in TRENDING_WINDOWS]
+        self.last_snapshot = time.time()
+        self.dirty = False
+        self.lock = threading.Lock()
+    
+    def add(self, message: str) -> None:
+        now = time.time()
+        tokens = [(token, CountMinSketch.indices(token)) for token in tokenize_message(message)]
+        if not tokens:
+            return
+        with self.lock:
+            for token, indices in tokens:
+                for _, window in self.windows:
+                    window.add(token, indices, now)
+            self.dirty = True
+    
+    def maybe_snapshot(self) -> None:
+        if time.time() - self.last_snapshot >= self.interval:
+            self.snapshot()
+    
+    def snapshot(self) -> None:
+        """各ウィンドウの上位トークンを1アイテムとして書き込み（APIはGetItem 1回で取得）"""
+        self.last_snapshot = time.time()
+        with self.lock:
+            if not self.dirty:
+                return
+            
+            now = time.time()
+            windows = {
+                name: [{'token': token, 'count': count} for token, count in window.top(now)]
+                for name, window in self.windows
+            }
+            self.dirty = False
+        try:
+            self.table.put_item(Item={
+                'video_id': self.video_id,
+                'bucket': TRENDING_SNAPSHOT_BUCKET,
+                'channel_id': self.channel_id,
+                'windows': windows,
+                'updated_at': datetime.now(timezone.utc).isoformat()
+            })
+        except ClientError as e:
+            logger.error(f"Error writing trending snapshot: {str(e)}")
+            self.dirty = True
+
+
+class ChatDisconnectedError(Exception):
+    """配信終了ではなく接続断でチャット取得が停止した"""
+
+
+class ChatSource:
+    """
+    チャット取得元のインターフェース（pytchatのPytchatCoreと同じメソッド）
+    
+    get()はitems（コメントのリスト）とinterval（次回取得までの推奨秒数）を持つページを返す。
+    コメントはpytchatのChatと同じ属性（id, message, datetime, timestamp, author）を持つ。
+    """
+    
+    continuation = None
+    
+    def is_alive(self) -> bool:
+        raise NotImplementedError
+    
+    def get(self):
+        raise NotImplementedError
+    
+    def terminate(self) -> None:
+        raise NotImplementedError
+    
+    def raise_for_status(self) -> None:
+        """取得停止の原因が配信終了以外の場合に例外を送出"""
+
+
+class ChatPage:
+    """ChatSource.get()の結果"""
+    __slots__ = ('items', 'interval')
+    
+    def __init__(self, items: list, interval: float = 0):
+        self.items = items
+        self.interval = interval
+
+
+class ChatAuthor:
+    """合成・再生コメントの投稿者（pytchatのAuthorと同じ属性名）"""
+    __slots__ = RECORDED_AUTHOR_FIELDS
+    
+    def __init__(self, name, channelId, isChatOwner=False, isChatModerator=False, isVerified=False):
+        self.name = name
+        self.channelId = channelId
+        self.isChatOwner = isChatOwner
+        self.isChatModerator = isChatModerator
+        self.isVerified = isVerified
+
+
+class ChatComment:
+    """合成・再生コメント（pytchatのChatと同じ属性名）"""
+    __slots__ = RECORDED_COMMENT_FIELDS + ('author',)
+    
+    def __init__(self, id, message, datetime, timestamp, author, type='textMessage', amountString=''):
+        self.id = id
+        self.type = type
+        self.message = message
+        self.datetime = datetime
+        self.timestamp = timestamp
+        self.amountString = amountString
+        self.author = author
+
+
+class SyntheticChatSource(ChatSource):
+    """負荷試験用の合成チャット（指定流量・バースト性・投稿者数でコメントを生成）"""
+    
+    def __init__(self, video_id: str, channel_id: str, rate: float = SYNTHETIC_RATE,
+                 burstiness: float = SYNTHETIC_BURSTINESS, authors: int = SYNTHETIC_AUTHORS,
+                 duration: float = SYNTHETIC_DURATION):
+        self.video_id = video_id
+        self.rate = rate
+        self.burstiness = burstiness
+        self.duration = duration
+        self.authors = [
+            ChatAuthor(f"SyntheticUser{i}", f"UCsynthetic{i:010d}", i == 0, i % 50 == 1, i % 100 == 2)
+            for i in range(max(1, authors))
+        ]
+        self.started = time.time()
+        self.last_get = self.started
+        self.generated = 0
+        self._is_alive = True
+    
+    def is_alive(self) -> bool:
+        if self.duration and time.time() - self.started >= self.duration:
+            self._is_alive = False
+        return self._is_alive
+    
+    def get(self) -> ChatPage:
+        """前回取得から経過した時間分のコメントを生成（投稿時刻は期間内に均等に配置）"""
+        now = time.time()
+        if self.duration:
+            now = min(now, self.started + self.duration)
+        elapsed = max(0.0, now - self.last_get)
+        
+        # 平均1の対数正規分布で流量を揺らしてバーストを再現
+        multiplier = random.lognormvariate(-self.burstiness ** 2 / 2, self.burstiness) if self.burstiness else 1.0
+        expected = self.rate * elapsed * multiplier
+        count = int(expected) + (1 if random.random() < expected - int(expected) else 0)
+        
+        items = []
+        for i in range(count):
+            posted_at_ms = int((self.last_get + elapsed * (i + 1) / count) * 1000)
+            seq = self.generated + i
+            items.append(ChatComment(
+                f"synthetic-{posted_at_ms}-{seq}",
+                f"synthetic comment {seq}",
+                datetime.fromtimestamp(posted_at_ms / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                posted_at_ms,
+                random.choice(self.authors)
+            ))
+        
+        self.generated += count
+        self.last_get = now
+        return ChatPage(items)
+    
+    def terminate(self) -> None:
+        self._is_alive = False
+
+
+class ChatRecorder:
+    """
+    チャットセッションをラップし、受信したコメントを圧縮ファイルに記録
+    
+    形式: gzip圧縮のJSON Lines。1行目はヘッダー、以降は取得ページごとに
+    {"t": 受信時刻, "i": 推奨待機秒, "c": [[コメント属性..., [投稿者属性...]], ...]}
+    """
+    
+    def __init__(self, chat, video_id: str, record_dir: str = CHAT_RECORD_DIR):
+        self.chat = chat
+        self.lock = threading.Lock()
+        os.makedirs(record_dir, exist_ok=True)
+        self.path = os.path.join(record_dir, f"{video_id}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.chat.jsonl.gz")
+        self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._write({
+            'format': CHAT_RECORDING_FORMAT,
+            'video_id': video_id,
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'comment_fields': RECORDED_COMMENT_FIELDS,
+            'author_fields': RECORDED_AUTHOR_FIELDS
+        })
+        logger.info(f"Recording live chat to {self.path}")
+    
+    @property
+    def continuation(self):
+        return getattr(self.chat, 'continuation', None)
+    
+    @continuation.setter
+    def continuation(self, value):
+        self.chat.continuation = value
+    
+    def is_alive(self) -> bool:
+        return self.chat.is_alive()
+    
+    def get(self):
+        received_at = time.time()
+        chat_data = self.chat.get()
+        items = getattr(chat_data, 'items', None) or []
+        if items:
+            self._write({
+                't': received_at,
+                'i': getattr(chat_data, 'interval', 0),
+                'c': [
+                    [getattr(item, field, None) for field in RECORDED_COMMENT_FIELDS] +
+                    [[getattr(item.author, field, None) for field in RECORDED_AUTHOR_FIELDS]]
+                    for item in items
+                ]
+            })
+        return chat_data
+    
+    def terminate(self) -> None:
+        self.chat.terminate()
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                logger.info(f"Chat recording saved: {self.path}")
+    
+    def raise_for_status(self) -> None:
+        self.chat.raise_for_status()
+    
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + "\n")
+            # ページ単位でフラッシュし、強制終了時も記録済みページは読めるようにする
+            self.file.flush()
+
+
+class ReplayChatSource(ChatSource):
+    """ChatRecorderの記録ファイルを元の間隔（またはN倍速）で再生するチャット取得元"""
+    
+    def __init__(self, video_id: str, channel_id: str, path: str = CHAT_REPLAY_PATH,
+                 speed: float = CHAT_REPLAY_SPEED, rebase: bool = CHAT_REPLAY_REBASE):
+        self.video_id = video_id
+        self.speed = speed if speed > 0 else 1.0
+        self.rebase = rebase
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.file = gzip.open(path, 'rt', encoding='utf-8')
+        
+        header = json.loads(self.file.readline())
+        if header.get('format') != CHAT_RECORDING_FORMAT:
+            raise ValueError(f"Unsupported chat recording format: {header.get('format')}")
+        self.comment_fields = header['comment_fields']
+        self.author_fields = header['author_fields']
+        
+        self.next_page = self._read_page()
+        self.record_started = self.next_page['t'] if self.next_page else 0
+        self.started = time.time()
+        self.generated = 0
+        self._is_alive = True
+        logger.info(f"Replaying chat recording {path} of {header.get('video_id')} at {self.speed}x")
+    
+    def is_alive(self) -> bool:
+        return self._is_alive and self.next_page is not None
+    
+    def get(self) -> ChatPage:
+        """再生時刻に達したページをまとめて返す（無ければ次のページの時刻まで待機）"""
+        with self.lock:
+            page = self.next_page
+        if page is None:
+            return ChatPage([])
+        
+        wait = self._due_time(page) - time.time()
+        if wait > 0:
+            self.wake.wait(wait)
+        
+        items = []
+        with self.lock:
+            while self._is_alive and self.next_page and self._due_time(self.next_page) <= time.time():
+                items.extend(self._build_items(self.next_page))
+                self.next_page = self._read_page()
+        
+        self.generated += len(items)
+        return ChatPage(items)
+    
+    def terminate(self) -> None:
+        self._is_alive = False
+        self.wake.set()
+        with self.lock:
+            self.next_page = None
+            self.file.close()
+    
+    def _due_time(self, page: Dict[str, Any]) -> float:
+        return self.started + (page['t'] - self.record_started) / self.speed
+    
+    def _read_page(self) -> Optional[Dict[str, Any]]:
+        for line in self.file:
+            if not line.strip():
+                continue
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                # 記録中に停止した場合の書きかけ行
+                logger.warning("Skipping truncated page at the end of chat recording")
+                return None
+        return None
+    
+    def _build_items(self, page: Dict[str, Any]) -> List[ChatComment]:
+        items = []
+        for values in page['c']:
+            fields = dict(zip(self.comment_fields, values[:-1]))
+            fields['author'] = ChatAuthor(**dict(zip(self.author_fields, values[-1])))
+            
+            if self.rebase and fields.get('timestamp'):
+                # 記録時の投稿時刻を再生時の時刻軸に変換（レイテンシ計測用）
+                posted_at = self.started + (fields['timestamp'] / 1000 - self.record_started) / self.speed
+                fields['timestamp'] = int(posted_at * 1000)
+                fields['datetime'] = datetime.fromtimestamp(posted_at, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            
+            items.append(ChatComment(**fields))
+        return items
+
+
+class RawChatProcessor(pytchat.ChatProcessor):
+    """
+    アクションJSONから保存項目だけを取り出してCommentRecordを直接生成するProcessor
+    
+    DefaultProcessor + format_commentと同じ値になるよう同じ規則で項目を取り出し、
+    DefaultProcessorが除外するアクション（必須項目の欠落でKeyError/TypeError）も同様に除外する。
+    received_atは取得ループで設定する。
+    """
+    
+    RENDERERS = {
+        'liveChatTextMessageRenderer': 'text',
+        'liveChatPaidMessageRenderer': 'paid',
+        'liveChatPaidStickerRenderer': 'sticker',
+        'liveChatLegacyPaidMessageRenderer': 'legacy',
+        'liveChatMembershipItemRenderer': 'membership',
+        'liveChatDonationAnnouncementRenderer': 'text',
+    }
+    DATETIME_CACHE_SIZE = 1000
+    
+    def __init__(self):
+        self._datetimes = {}  # 秒 -> 'YYYY-MM-DD HH:MM:SS'
+    
+    def process(self, chat_components: list) -> ChatPage:
+        records = []
+        timeout = 0
+        for component in chat_components:
+            if component is None:
+                continue
+            timeout += component.get('timeout', 0)
+            chatdata = component.get('chatdata')
+            if chatdata is None:
+                continue
+            for action in chatdata:
+                if action is None:
+                    continue
+                add_action = action.get('addChatItemAction')
+                if add_action is None:
+                    continue
+                item = add_action.get('item')
+                if item is None:
+                    continue
+                record = self._parse(item)
+                if record:
+                    records.append(record)
+        
+        return ChatPage(records, float(timeout))
+    
+    def _parse(self, item: Dict[str, Any]) -> Optional['CommentRecord']:
+        key = next(iter(item), None)
+        kind = self.RENDERERS.get(key)
+        if kind is None:
+            return None
+        try:
+            return self._build(kind, item[key])
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Skipping unparsable chat item ({key}): {type(e).__name__} {str(e)}")
+            return None
+    
+    def _build(self, kind: str, renderer: Dict[str, Any]) -> Optional['CommentRecord']:
+        timestamp_usec = int(renderer.get('timestampUsec', 0))
+        
+        if kind == 'membership':
+            try:
+                message = ''.join(run.get('text', '') for run in renderer['headerSubtext']['runs'])
+            except KeyError:
+                message = 'Welcome New Member!'
+        elif kind == 'legacy':
+            message = renderer['eventText']['runs'][0]['text'] + ' / ' + renderer['detailText']['simpleText']
+        else:
+            message = ''
+            for run in renderer.get('message', {}).get('runs', {}):
+                if not hasattr(run, 'get'):
+                    continue
+                emoji = run.get('emoji')
+                if emoji:
+                    message += emoji.get('shortcuts', [''])[0]
+                    # DefaultProcessorは画像の無い絵文字を含むコメントを除外する
+                    emoji['image']['thumbnails']
+                else:
+                    message += run.get('text', '')
+        
+        if kind in ('paid', 'sticker'):
+            renderer['purchaseAmountText']['simpleText']
+        if kind == 'sticker':
+            renderer['sticker']['thumbnails'][0]['url']
+        
+        is_verified = is_owner = is_moderator = False
+        for badge in renderer.get('authorBadges', {}):
+            badge_renderer = badge['liveChatAuthorBadgeRenderer']
+            icon = badge_renderer.get('icon')
+            if icon:
+                icon_type = icon['iconType']
+                if icon_type == 'VERIFIED':
+                    is_verified = True
+                elif icon_type == 'OWNER':
+                    is_owner = True
+                elif icon_type == 'MODERATOR':
+                    is_moderator = True
+            if badge_renderer.get('customThumbnail'):
+                badge_renderer['customThumbnail']['thumbnails'][0]['url']
+        
+        channel_id = renderer.get('authorExternalChannelId')
+        if not isinstance(channel_id, str):
+            # DefaultProcessorはチャンネルURLの組み立てで除外する
+            return None
+        author_name = renderer['authorName']['simpleText']
+        renderer['authorPhoto']['thumbnails']
+        
+        return CommentRecord(
+            renderer.get('id'),
+            author_name,
+            channel_id or UNKNOWN_AUTHOR_ID,
+            message,
+            self._format_datetime(timestamp_usec),
+            is_owner,
+            is_moderator,
+            is_verified,
+            None,
+            int(timestamp_usec / 1000)
+        )
+    
+    def _format_datetime(self, timestamp_usec: int) -> str:
+        """投稿日時（DefaultProcessorと同じローカル時刻表記）を秒単位でキャッシュして生成"""
+        second = timestamp_usec // 1000000
+        formatted = self._datetimes.get(second)
+        if formatted is None:
+            if len(self._datetimes) >= self.DATETIME_CACHE_SIZE:
+                self._datetimes.clear()
+            formatted = datetime.fromtimestamp(timestamp_usec / 1000000).strftime('%Y-%m-%d %H:%M:%S')
+            self._datetimes[second] = formatted
+        return formatted
+
+
+def create_youtube_chat(video_id: str, channel_id: str):
+    """pytchatセッションを作成"""
+    # pytchatのデフォルトProcessorはモジュール共有のためセッションごとに生成する
+    # メインスレッド以外ではSIGINTハンドラを登録できないためinterruptableを無効化
+    # HTTPクライアントはpytchatが全セッションで共有するkeep-aliveのhttpx.Clientを使う
+    return pytchat.create(
+        video_id=video_id,
+        processor=RawChatProcessor() if CHAT_PARSE_MODE == 'raw' else pytchat.DefaultProcessor(),
+        interruptable=threading.current_thread() is threading.main_thread()
+    )
+
 
-# 環境変数
-VIDEO_ID = os.environ.get('VIDEO_ID')
-CHANNEL_ID = os.environ.get('CHANNEL_ID')
-ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
-COMMENTS_TABLE = os.environ.get('DYNAMODB_TABLE_COMMENTS', f'{ENVIRONMENT}-Comments')
-TASKSTATUS_TABLE = os.environ.get('DYNAMODB_TABLE_TASKSTATUS', f'{ENVIRONMENT}-TaskStatus')
+# CHAT_SOURCE名 -> (video_id, channel_id)を受け取りChatSource互換オブジェクトを返すファクトリ
+CHAT_SOURCES = {
+    'youtube': create_youtube_chat,
+    'synthetic': SyntheticChatSource,
+    'replay': ReplayChatSource,
+}
+
+
+def register_chat_source(name: str, factory) -> None:
+    """チャット取得元を登録（CHAT_SOURCE環境変数で選択）"""
+    CHAT_SOURCES[name] = factory
+
+
+class ColumnarExporter:
+    """
+    収集したコメントを列指向ファイル (Parquet / Arrow IPC) に書き出すエクスポーター
+    
+    channel_id/date/video_id でパーティション分割し、一定時間または行数ごとに
+    セグメントファイルとしてS3またはローカルディレクトリに出力する
+    """
+    
+    def __init__(self, video_id: str, channel_id: str, target: str = COLUMNAR_EXPORT_TARGET,
+                 file_format: str = COLUMNAR_EXPORT_FORMAT):
+        self.video_id = video_id
+        self.channel_id = channel_id
+        self.target = target
+        self.file_format = file_format
+        self.records = []
+        self.segment_started = time.time()
+        self.segment_seq = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='columnar-export')
+        self.s3 = boto3.client('s3') if target.startswith('s3://') else None
+        # 書き込みワーカーからのaddと収集スレッドからのrollが競合しないようにする
+        self.lock = threading.Lock()
+        self.closed = False
+    
+    @staticmethod
+    def schema():
+        return pyarrow.schema([
+            ('comment_id', pyarrow.string()),
+            ('video_id', pyarrow.string()),
+            ('channel_id', pyarrow.string()),
+            ('author_name', pyarrow.string()),
+            ('author_channel_id', pyarrow.string()),
+            ('message', pyarrow.string()),
+            ('timestamp', pyarrow.string()),
+            ('datetime', pyarrow.string()),
+            ('posted_at', pyarrow.timestamp('ms', tz='UTC')),
+            ('is_owner', pyarrow.bool_()),
+            ('is_moderator', pyarrow.bool_()),
+            ('is_verified', pyarrow.bool_())
+        ])
+    
+    def add(self, records: List[CommentRecord]) -> None:
+        """レコードを追加し、閾値を超えたらセグメントを書き出す"""
+        with self.lock:
+            if self.closed:
+                # 終了時の待機がタイムアウトした後に書き込みが確定したバッチ
+                logger.warning(f"Exporter already closed. Skipped exporting {len(records)} comments")
+                return
+            self.records.extend(records)
+            if (len(self.records) >= COLUMNAR_EXPORT_ROLL_ROWS
+                    or time.time() - self.segment_started >= COLUMNAR_EXPORT_ROLL_SECONDS):
+                self._roll()
+    
+    def roll(self) -> None:
+        """現在のセグメントをバックグラウンドで書き出す"""
+        with self.lock:
+            if not self.closed:
+                self._roll()
+    
+    def _roll(self) -> None:
+        if self.records:
+            records, self.records = self.records, []
+            self.segment_seq += 1
+            self.executor.submit(self._write_segment, records, self.segment_seq)
+        self.segment_started = time.time()
+    
+    def close(self) -> None:
+        """残りのレコードを書き出して終了"""
+        with self.lock:
+            self._roll()
+            self.closed = True
+        self.executor.shutdown(wait=True)
+    
+    def _build_table(self, records: List[CommentRecord]):
+        comment_id_prefix = f"{self.video_id}#"
+        columns = {
+            'comment_id': [comment_id_prefix + record.id for record in records],
+            'video_id': [self.video_id] * len(records),
+            'channel_id': [self.channel_id] * len(records),
+            'author_name': [record.author_name for record in records],
+            'author_channel_id': [record.author_channel_id for record in records],
+            'message': [record.message for record in records],
+            'timestamp': [record.received_at for record in records],
+            'datetime': [record.datetime for record in records],
+            'posted_at': [record.posted_at_ms or None for record in records],
+            'is_owner': [bool(record.is_owner) for record in records],
+            'is_moderator': [bool(record.is_moderator) for record in records],
+            'is_verified': [bool(record.is_verified) for record in records]
+        }
+        return pyarrow.table(columns, schema=self.schema())
+    
+    def _segment_key(self, records: List[CommentRecord], seq: int) -> str:
+        """パーティション付きのファイルパス"""
+        date = records[0].received_at[:10]
+        extension = 'parquet' if self.file_format == 'parquet' else 'arrow'
+        started = records[0].received_at[:19].replace(':', '').replace('-', '')
+        return (f"channel_id={self.channel_id}/date={date}/video_id={self.video_id}/"
+                f"part-{started}-{seq:05d}.{extension}")
+    
+    def _write_segment(self, records: List[CommentRecord], seq: int) -> None:
+        try:
+            table = self._build_table(records)
+            sink = pyarrow.BufferOutputStream()
+            if self.file_format == 'parquet':
+                pyarrow.parquet.write_table(table, sink, compression='zstd')
+            else:
+                with pyarrow.ipc.new_file(sink, table.schema, options=pyarrow.ipc.IpcWriteOptions(compression='zstd')) as writer:
+                    writer.write_table(table)
+            data = sink.getvalue().to_pybytes()
+            
+            key = self._segment_key(records, seq)
+            if self.s3:
+                bucket, _, prefix = self.target[len('s3://'):].partition('/')
+                object_key = f"{prefix.rstrip('/')}/{key}" if prefix else key
+                self.s3.put_object(Bucket=bucket, Key=object_key, Body=data)
+                location = f"s3://{bucket}/{object_key}"
+            else:
+                location = os.path.join(self.target, key)
+                os.makedirs(os.path.dirname(location), exist_ok=True)
+                tmp_path = location + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.rename(tmp_path, location)
+            
+            logger.info(f"Exported {len(records)} comments to {location} ({len(data)} bytes)")
+            
+        except Exception as e:
+            logger.error(f"Error exporting columnar segment: {str(e)}")
 
-# 設定
-MAX_RETRY_COUNT = 3
-RETRY_DELAY = 5  # 秒
-HEALTH_CHECK_INTERVAL = 30  # 秒
-BATCH_SIZE = 25  # DynamoDB書き込みバッチサイズ
 
 class CommentCollector:
     """YouTubeライブチャットコメント収集クラス"""
     
-    def __init__(self, video_id: str, channel_id: str):
+    def __init__(self, video_id: str, channel_id: str, pipeline=None):
         self.video_id = video_id
         self.channel_id = channel_id
         self.comments_table = dynamodb.Table(COMMENTS_TABLE)
         self.taskstatus_table = dynamodb.Table(TASKSTATUS_TABLE)
+        self.pipeline = pipeline
+        self.shard_count = COMMENT_SHARD_COUNT  # start_collectionでLiveStreamsの記録値に置き換える
+        self.poll_scheduler = PollScheduler()
+        self.dedup_cache = CommentIdCache() if DEDUP_CACHE_SIZE > 0 else None
+        self.stats = CollectorStats()
+        self.rollups = StreamRollups(video_id, channel_id) if ROLLUP_FLUSH_INTERVAL > 0 else None
+        self.trending = TrendingTracker(video_id, channel_id) if TRENDING_SNAPSHOT_INTERVAL > 0 else None
+        self.exporter = None
+        if COLUMNAR_EXPORT_TARGET:
+            if pyarrow:
+                self.exporter = ColumnarExporter(video_id, channel_id)
+            else:
+                logger.warning("pyarrow is not installed. Columnar export is disabled")
         self.chat = None
         self.is_running = False
+        self.stop_requested = False
+        self.stop_event = threading.Event()
+        self.stop_started = None
+        self.checkpoint = None
+        self.resume_after_timestamp = 0
+        self.last_checkpoint = 0.0
+        self._checkpoint_token_failed = False
+        self._session_fetches = 0
         self.comment_count = 0
+        self._count_lock = threading.Lock()
         self.last_health_check = time.time()
+        # 書き込みステージに渡したバッチの完了処理を投入順に行うための管理情報
+        self._batch_lock = threading.Lock()
+        self._next_batch_seq = 0
+        self._next_completed_seq = 0
+        self._batches = {}  # seq -> [バッチ, continuation, 状態]
         
     def start_collection(self) -> None:
         """コメント収集を開始"""
         logger.info(f"Starting comment collection for video: {self.video_id}")
         
+        if RESUME_ENABLED:
+            self.checkpoint = self.load_checkpoint()
+        self.shard_count = self.resolve_shard_count()
+        
+        try:
+            self._run_sessions()
+        finally:
+            if self.rollups:
+                self.rollups.flush()
+            if self.trending:
+                self.trending.snapshot()
+            if self.exporter:
+                self.exporter.close()
+    
+    def _run_sessions(self) -> None:
+        """接続・収集・再接続のループ"""
         retry_count = 0
-        while retry_count < MAX_RETRY_COUNT:
+        while not self.stop_requested:
             try:
                 # pytchatでライブチャットに接続
-                self.chat = pytchat.create(video_id=self.video_id)
+                self.chat = self.create_chat()
                 self.is_running = True
+                self._session_fetches = 0
+                
+                # 前回の取得位置から再開
+                if self.checkpoint:
+                    self.resume_from_checkpoint()
                 
                 logger.info(f"Successfully connected to live chat: {self.video_id}")
                 
@@ -80,74 +2504,273 @@ class CommentCollector:
                 break
                 
             except Exception as e:
+                # 1回以上取得できたセッションの切断は新しい障害として数え直す
+                if self._session_fetches > 0:
+                    retry_count = 0
                 retry_count += 1
-                logger.error(f"Error connecting to live chat (attempt {retry_count}/{MAX_RETRY_COUNT}): {str(e)}")
+                logger.error(f"Error connecting to live chat (attempt {retry_count}): {str(e)}")
+                metrics.inc('reconnects_total', self.video_id)
                 
-                if retry_count < MAX_RETRY_COUNT:
-                    logger.info(f"Retrying in {RETRY_DELAY} seconds...")
-                    time.sleep(RETRY_DELAY)
+                if self.stop_requested:
+                    break
+                
+                # チェックポイントのcontinuationで再開直後に失敗した場合は時刻ベースの再開に切り替え
+                if self.checkpoint and self._session_fetches == 0 and not self._checkpoint_token_failed:
+                    self._checkpoint_token_failed = True
+                
+                # 配信中であれば回数制限なしで再接続
+                if retry_count < MAX_RETRY_COUNT or (RESUME_ENABLED and self.is_stream_live()):
+                    delay = self.retry_delay(retry_count)
+                    logger.info(f"Retrying in {delay:.1f} seconds...")
+                    self.stop_event.wait(delay)
                 else:
                     logger.error("Max retry count reached. Exiting.")
                     self.update_task_status("failed")
                     raise
     
+    def retry_delay(self, retry_count: int) -> float:
+        """再接続までの待機時間（ジッター付き指数バックオフ）"""
+        delay = RETRY_DELAY * (2 ** min(retry_count - 1, 6))
+        return min(RETRY_MAX_DELAY, delay * random.uniform(0.5, 1.5))
+    
+    def is_stream_live(self) -> bool:
+        """LiveStreamsテーブル上で配信中かどうか"""
+        try:
+            response = dynamodb.Table(LIVESTREAMS_TABLE).get_item(
+                Key={'video_id': self.video_id},
+                ProjectionExpression='#status',
+                ExpressionAttributeNames={'#status': 'status'}
+            )
+            return response.get('Item', {}).get('status') == 'live'
+        except ClientError as e:
+            logger.error(f"Error checking stream status: {str(e)}")
+            return False
+    
+    def resolve_shard_count(self) -> int:
+        """
+        配信のシャード数をLiveStreamsに記録し、記録済みの場合はその値を返す
+        
+        配信中にCOMMENT_SHARD_COUNTを変更しても書き込み先のパーティションが変わらず、
+        API Handlerは記録された値でパーティションを列挙できる。
+        """
+        try:
+            response = dynamodb.Table(LIVESTREAMS_TABLE).update_item(
+                Key={'video_id': self.video_id},
+                UpdateExpression='SET comment_shard_count = if_not_exists(comment_shard_count, :count)',
+                ConditionExpression='attribute_exists(video_id)',
+                ExpressionAttributeValues={':count': COMMENT_SHARD_COUNT},
+                ReturnValues='UPDATED_NEW'
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                logger.error(f"Error recording comment shard count: {str(e)}")
+            # LiveStreamsに無い配信（合成ソース等）は環境変数の値を使う
+            return COMMENT_SHARD_COUNT
+        
+        shard_count = int(response.get('Attributes', {}).get('comment_shard_count', COMMENT_SHARD_COUNT))
+        if shard_count != COMMENT_SHARD_COUNT:
+            logger.warning(f"Using recorded comment shard count {shard_count} for {self.video_id} "
+                           f"(COMMENT_SHARD_COUNT={COMMENT_SHARD_COUNT})")
+        return shard_count
+    
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """TaskStatusから前回のチェックポイントを取得"""
+        try:
+            response = self.taskstatus_table.get_item(
+                Key={'video_id': self.video_id},
+                ProjectionExpression='chat_continuation, last_comment_timestamp, checkpoint_at'
+            )
+            item = response.get('Item')
+            if item and item.get('last_comment_timestamp'):
+                logger.info(f"Loaded checkpoint saved at {item.get('checkpoint_at')}")
+                return {
+                    'continuation': item.get('chat_continuation'),
+                    'last_comment_timestamp': int(item['last_comment_timestamp'])
+                }
+        except ClientError as e:
+            logger.error(f"Error loading checkpoint: {str(e)}")
+        return None
+    
+    def resume_from_checkpoint(self) -> None:
+        """チェックポイントの位置からチャット取得を再開"""
+        # チェックポイント以前のコメントは保存済みのため除外
+        self.resume_after_timestamp = self.checkpoint['last_comment_timestamp']
+        
+        if self.checkpoint.get('continuation') and not self._checkpoint_token_failed:
+            self.chat.continuation = self.checkpoint['continuation']
+            logger.info("Resuming live chat from checkpoint continuation")
+            return
+        
+        # continuationが使えない場合は最後に保存したコメント時刻から遡って取得
+        elapsed = time.time() - self.checkpoint['last_comment_timestamp'] / 1000
+        past_sec = int(min(CHECKPOINT_MAX_PAST_SEC, max(0, elapsed) + 1))
+        self.chat.continuation = liveparam.getparam(self.video_id, channel_id=self.channel_id, past_sec=past_sec)
+        logger.info(f"Resuming live chat from {past_sec} seconds ago")
+    
+    def save_checkpoint(self, continuation: Optional[str], last_comment_timestamp: int) -> None:
+        """保存済みコメントの取得位置をTaskStatusに記録"""
+        if not continuation or not last_comment_timestamp:
+            return
+        
+        self.checkpoint = {
+            'continuation': continuation,
+            'last_comment_timestamp': last_comment_timestamp
+        }
+        self._checkpoint_token_failed = False
+        
+        if time.time() - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        
+        try:
+            self.taskstatus_table.update_item(
+                Key={'video_id': self.video_id},
+                UpdateExpression='SET chat_continuation = :continuation, last_comment_timestamp = :ts, checkpoint_at = :checkpoint_at',
+                ExpressionAttributeValues={
+                    ':continuation': continuation,
+                    ':ts': last_comment_timestamp,
+                    ':checkpoint_at': datetime.now(timezone.utc).isoformat()
+                }
+            )
+            self.last_checkpoint = time.time()
+        except ClientError as e:
+            logger.error(f"Error saving checkpoint: {str(e)}")
+    
+    def is_disconnected(self) -> bool:
+        """チャット取得の停止が配信終了ではなく接続断によるものか"""
+        if self.stop_requested or not self.chat:
+            return False
+        try:
+            self.chat.raise_for_status()
+        except (pytchat.NoContents, pytchat.ChatDataFinished):
+            # 配信終了
+            return False
+        except Exception as e:
+            logger.warning(f"Live chat disconnected: {str(e)}")
+            return True
+        return False
+    
+    def create_chat(self):
+        """CHAT_SOURCEのチャット取得セッションを作成"""
+        chat = CHAT_SOURCES[CHAT_SOURCE](self.video_id, self.channel_id)
+        # rawモードのyoutubeはChatオブジェクトを生成しないため記録できない
+        if CHAT_RECORD_DIR and not (CHAT_SOURCE == 'youtube' and CHAT_PARSE_MODE == 'raw'):
+            chat = ChatRecorder(chat, self.video_id)
+        return chat
+    
+    def stop(self) -> None:
+        """収集ループを停止（残りのコメントは保存してから終了）"""
+        if self.stop_requested:
+            return
+        logger.info(f"Stop requested for video: {self.video_id}")
+        self.stop_started = time.time()
+        self.stop_requested = True
+        self.stop_event.set()
+        if self.chat:
+            self.chat.terminate()
+    
     def collect_comments(self) -> None:
         """コメント収集メインループ"""
         comment_batch = []
+        batch_started = time.time()
+        
+        # chunkedモードでは時間単位、itemモードではDynamoDBのバッチサイズ単位で保存
+        chunked = COMMENT_STORAGE_MODE == 'chunked'
+        batch_limit = CHUNK_MAX_COMMENTS if chunked else BATCH_SIZE
         
         try:
             while self.chat.is_alive():
                 # コメントを取得 - 正しいpytchat使用方法
                 try:
+                    fetch_started = time.time()
+                    
+                    # このページを再取得できるcontinuation（チェックポイント用）
+                    page_continuation = getattr(self.chat, 'continuation', None)
+                    
                     # pytchatの正しい使用方法: get()の結果を直接イテレート
                     chat_data = self.chat.get()
+                    metrics.observe('fetch_latency_seconds', self.video_id, time.time() - fetch_started)
+                    chat_items = self._iter_chat_items(chat_data)
+                    if self.chat.is_alive():
+                        self._session_fetches += 1
+                    
+                    # 受信時刻はページ単位で1回だけ計算
+                    received_at = datetime.now(timezone.utc).isoformat() if chat_items else None
                     
-                    # chat_dataがitemsを持つ場合
-                    if hasattr(chat_data, 'items'):
-                        for comment in chat_data.items:
-                            comment_data = self.format_comment(comment)
-                            comment_batch.append(comment_data)
-                            
-                            logger.info(f"Comment from {comment.author.name}: {comment.message[:50]}...")
-                            
-                            # バッチサイズに達したら保存
-                            if len(comment_batch) >= BATCH_SIZE:
-                                self.save_comments_batch(comment_batch)
-                                comment_batch = []
+                    for comment in chat_items:
+                        record = self.format_comment(comment, received_at)
+                        
+                        # 再接続時に再送された書き込み済みコメントを除外
+                        if self.dedup_cache and self.dedup_cache.check_and_add(record.id):
+                            continue
+                        
+                        # 再開位置より前のコメントは保存済み
+                        if record.posted_at_ms < self.resume_after_timestamp:
+                            continue
+                        
+                        if not comment_batch:
+                            batch_started = time.time()
+                        comment_batch.append(record)
+                        
+                        if COMMENT_LOG_MODE == 'all' or (COMMENT_LOG_SAMPLE_RATE and random.random() < COMMENT_LOG_SAMPLE_RATE):
+                            logger.info("Comment from %s: %.50s...", record.author_name, record.message)
+                        
+                        # バッチサイズに達したら保存
+                        if len(comment_batch) >= batch_limit:
+                            self.flush_batch(comment_batch, page_continuation)
+                            comment_batch = []
                     
-                    # chat_dataが直接イテレート可能な場合
-                    elif hasattr(chat_data, '__iter__'):
-                        for comment in chat_data:
-                            comment_data = self.format_comment(comment)
-                            comment_batch.append(comment_data)
-                            
-                            logger.info(f"Comment from {comment.author.name}: {comment.message[:50]}...")
-                            
-                            # バッチサイズに達したら保存
-                            if len(comment_batch) >= BATCH_SIZE:
-                                self.save_comments_batch(comment_batch)
-                                comment_batch = []
+                    # チャンクの時間幅を過ぎたら保存
+                    if chunked and comment_batch and time.time() - batch_started >= CHUNK_SECONDS:
+                        self.flush_batch(comment_batch, page_continuation)
+                        comment_batch = []
+                    
+                    self.stats.record_comments(len(chat_items))
+                    metrics.inc('comments_received_total', self.video_id, len(chat_items))
                     
                     # 定期的なヘルスチェック
                     if time.time() - self.last_health_check > HEALTH_CHECK_INTERVAL:
                         self.perform_health_check()
                     
-                    # 短い待機
-                    time.sleep(1)
+                    if COMMENT_LOG_MODE == 'aggregate':
+                        self.stats.maybe_report(self.video_id)
+                    
+                    if self.rollups:
+                        self.rollups.maybe_flush()
+                    if self.trending:
+                        self.trending.maybe_snapshot()
+                    
+                    # チャット量に応じて待機（取得・保存にかかった時間は差し引く）
+                    interval = self.poll_scheduler.on_success(len(chat_items), getattr(chat_data, 'interval', 0))
+                    self.stop_event.wait(max(0, interval - (time.time() - fetch_started)))
                     
                 except Exception as e:
                     logger.warning(f"Error getting comments: {str(e)}")
-                    # コメント取得エラーは継続
-                    time.sleep(2)
+                    metrics.inc('fetch_errors_total', self.video_id)
+                    # コメント取得エラーは継続（連続エラー時は指数バックオフ）
+                    self.stop_event.wait(self.poll_scheduler.on_error())
                     continue
             
             # 残りのコメントを保存
             if comment_batch:
-                self.save_comments_batch(comment_batch)
+                self.flush_batch(comment_batch)
+            
+            # キュー内の書き込み完了を待機
+            if self.pipeline:
+                self.pipeline.wait_idle(self, timeout=drain_timeout())
+            
+            # 接続断の場合は再接続させる
+            if self.is_disconnected():
+                raise ChatDisconnectedError(f"Live chat disconnected: {self.video_id}")
             
-            logger.info("Live stream ended. Comment collection completed.")
+            if self.stop_started:
+                logger.info(f"Collection stopped. Drained remaining comments in {time.time() - self.stop_started:.2f}s "
+                            f"(total saved: {self.comment_count})")
+            else:
+                logger.info("Live stream ended. Comment collection completed.")
             self.update_task_status("completed")
             
+        except ChatDisconnectedError:
+            raise
         except Exception as e:
             logger.error(f"Error during comment collection: {str(e)}")
             self.update_task_status("failed")
@@ -155,39 +2778,137 @@ class CommentCollector:
         finally:
             self.cleanup()
     
-    def format_comment(self, comment) -> Dict[str, Any]:
-        """コメントデータをDynamoDB用にフォーマット"""
-        timestamp = datetime.now(timezone.utc)
-        
-        return {
-            'comment_id': f"{self.video_id}#{comment.id}",
-            'video_id': self.video_id,
-            'channel_id': self.channel_id,
-            'author_name': comment.author.name,
-            'author_channel_id': getattr(comment.author, 'channelId', 'unknown'),
-            'message': comment.message,
-            'timestamp': timestamp.isoformat(),
-            'datetime': getattr(comment, 'datetime', timestamp.isoformat()),
-            'is_owner': getattr(comment.author, 'isOwner', False),
-            'is_moderator': getattr(comment.author, 'isModerator', False),
-            'is_verified': getattr(comment.author, 'isVerified', False),
-            'created_at': timestamp.isoformat()
-        }
+    def _iter_chat_items(self, chat_data):
+        """chat.get()の結果からコメントを取り出す"""
+        # chat_dataがitemsを持つ場合
+        if hasattr(chat_data, 'items'):
+            return chat_data.items
+        # chat_dataが直接イテレート可能な場合
+        elif hasattr(chat_data, '__iter__'):
+            return list(chat_data)
+        return []
     
-    def save_comments_batch(self, comments: list) -> None:
-        """コメントをバッチでDynamoDBに保存"""
+    def flush_batch(self, comments: list, continuation: Optional[str] = None) -> None:
+        """
+        バッチを書き込みステージに渡す（queue/spoolモードでは投入のみ）
+        
+        Args:
+            comments: 保存するコメント
+            continuation: このバッチの最後のコメントを含むページのcontinuation（チェックポイント用）
+        """
+        metrics.observe('batch_size', self.video_id, len(comments))
+        
+        if not self.pipeline:
+            # 失敗時は例外を送出し、呼び出し元がバッチを保持して次回に再試行する
+            self.save_comments_batch(comments)
+            self.complete_batch(self._register_batch(comments, continuation), 'persisted')
+            return
+        
+        seq = self._register_batch(comments, continuation)
         try:
-            with self.comments_table.batch_writer() as batch:
-                for comment in comments:
-                    batch.put_item(Item=comment)
+            self.pipeline.submit(self, comments, seq)
+        except Exception:
+            self.complete_batch(seq, 'released')
+            raise
+    
+    def _register_batch(self, comments: list, continuation: Optional[str]) -> int:
+        """書き込みステージに渡すバッチに投入順の番号を割り当てる"""
+        with self._batch_lock:
+            seq = self._next_batch_seq
+            self._next_batch_seq += 1
+            self._batches[seq] = [comments, continuation, None]
+        return seq
+    
+    def complete_batch(self, seq: int, state: str, reason: str = '') -> None:
+        """
+        バッチの書き込み結果を記録し、投入順に完了処理を行う
+        
+        書き込みワーカーが複数ある場合は完了順が前後するため、先に投入されたバッチが
+        全て完了するまでSSE配信・エクスポート・集計・チェックポイントを進めない。
+        
+        Args:
+            seq: _register_batchで割り当てた番号
+            state: persisted (書き込み確定) / dropped (再試行上限で断念) / released (投入失敗、呼び出し元が再試行)
+            reason: droppedの場合のエラー内容
+        """
+        with self._batch_lock:
+            entry = self._batches[seq]
+            entry[2] = state
+            if state == 'dropped':
+                self._handle_dropped_batch(entry[0], reason)
             
-            self.comment_count += len(comments)
-            logger.info(f"Saved {len(comments)} comments. Total: {self.comment_count}")
+            while self._next_completed_seq in self._batches and self._batches[self._next_completed_seq][2]:
+                comments, continuation, state = self._batches.pop(self._next_completed_seq)
+                self._next_completed_seq += 1
+                if state == 'released':
+                    continue
+                if state == 'persisted':
+                    # 書き込みが確定したバッチのみ配信・エクスポートする（失敗して再投入されたバッチの重複を防ぐ）
+                    if self.exporter:
+                        self.exporter.add(comments)
+                    if self.rollups:
+                        for record in comments:
+                            self.rollups.add(record)
+                    if self.trending:
+                        for record in comments:
+                            self.trending.add(record.message)
+                    if comment_broadcaster:
+                        comment_broadcaster.publish(self.video_id, self.channel_id, comments)
+                # droppedのバッチはデッドレターに退避済みのため、チェックポイントは先に進める
+                self.save_checkpoint(continuation, comments[-1].posted_at_ms)
+    
+    def _handle_dropped_batch(self, comments: list, reason: str) -> None:
+        """書き込めなかったバッチをデッドレターに退避し、重複除外キャッシュから外す"""
+        write_dead_letter(self.video_id, self.channel_id, comments, reason)
+        if self.dedup_cache:
+            self.dedup_cache.discard(record.id for record in comments)
+    
+    @staticmethod
+    def format_comment(comment, received_at: str) -> CommentRecord:
+        """pytchatのコメントを収集レコードに変換（RawChatProcessorのレコードは受信時刻のみ設定）"""
+        if isinstance(comment, CommentRecord):
+            comment.received_at = received_at
+            return comment
+        
+        author = comment.author
+        return CommentRecord(
+            comment.id,
+            author.name,
+            getattr(author, 'channelId', None) or UNKNOWN_AUTHOR_ID,
+            comment.message,
+            getattr(comment, 'datetime', None) or received_at,
+            getattr(author, 'isChatOwner', False),
+            getattr(author, 'isChatModerator', False),
+            getattr(author, 'isVerified', False),
+            received_at,
+            getattr(comment, 'timestamp', 0)
+        )
+    
+    def save_comments_batch(self, comments: List[CommentRecord]) -> None:
+        """コメントをバッチでDynamoDBに保存"""
+        try:
+            write_started = time.time()
+            write_authors(comments)
+            write_comment_items(self.comments_table,
+                                build_storage_items(self.video_id, self.channel_id, comments, self.shard_count))
+            self.record_saved(len(comments), time.time() - write_started)
             
         except ClientError as e:
             logger.error(f"Error saving comments to DynamoDB: {str(e)}")
             raise
     
+    def record_saved(self, count: int, write_seconds: float = 0.0) -> None:
+        """保存済みコメント数を加算"""
+        with self._count_lock:
+            self.comment_count += count
+        self.stats.record_flush(count, write_seconds)
+        metrics.inc('comments_saved_total', self.video_id, count)
+        if write_seconds:
+            metrics.observe('write_latency_seconds', self.video_id, write_seconds)
+        
+        if COMMENT_LOG_MODE == 'all':
+            logger.info(f"Saved {count} comments. Total: {self.comment_count}")
+    
     def perform_health_check(self) -> None:
         """ヘルスチェックを実行"""
         try:
@@ -195,7 +2916,18 @@ class CommentCollector:
             self.update_task_status("collecting")
             self.last_health_check = time.time()
             
-            logger.info(f"Health check completed. Comments collected: {self.comment_count}")
+            message = f"Health check completed. Comments collected: {self.comment_count}"
+            if self.pipeline:
+                message += f", queue depth: {self.pipeline.queue_depth}"
+            if self.dedup_cache:
+                message += f", duplicates skipped: {self.dedup_cache.hits} ({self.dedup_cache.hit_rate:.1%})"
+            if author_cache:
+                message += f", author cache hit rate: {author_cache.hit_rate:.1%}"
+            if comment_broadcaster:
+                message += f", stream subscribers: {comment_broadcaster.subscriber_count}"
+            if comment_writer.throttle_count:
+                message += f", write throttles: {comment_writer.throttle_count} (concurrency {comment_writer.concurrency:.1f})"
+            logger.info(message)
             
         except Exception as e:
             logger.error(f"Health check failed: {str(e)}")
@@ -213,16 +2945,36 @@ class CommentCollector:
                 update_data['collecting_since'] = datetime.now(timezone.utc).isoformat()
             elif status in ["completed", "failed"]:
                 update_data['finished_at'] = datetime.now(timezone.utc).isoformat()
+                # 停止要求から書き込み完了までの所要時間
+                if self.stop_started:
+                    update_data['drain_seconds'] = Decimal(f"{time.time() - self.stop_started:.3f}")
+            
+            # 生存リース: 収集中のみ有効期限を延長し、終了時は即時失効
+            now = int(time.time())
+            lease_expires_at = now + LEASE_DURATION if status == "collecting" else now
             
             # DynamoDBの更新式を修正
-            update_expression = 'SET #status = :status, updated_at = :updated_at, comment_count = :comment_count'
-            expression_attribute_names = {'#status': 'status'}
+            update_expression = ('SET #status = :status, updated_at = :updated_at, comment_count = :comment_count, '
+                                 'lease_expires_at = :lease_expires_at, #ttl = :ttl')
+            expression_attribute_names = {'#status': 'status', '#ttl': 'ttl'}
             expression_attribute_values = {
                 ':status': status,
                 ':updated_at': update_data['updated_at'],
-                ':comment_count': self.comment_count
+                ':comment_count': self.comment_count,
+                ':lease_expires_at': lease_expires_at,
+                ':ttl': lease_expires_at + STATUS_TTL_SECONDS
             }
             
+            # 書き込みキューの滞留状況
+            if self.pipeline:
+                update_expression += ', queue_depth = :queue_depth'
+                expression_attribute_values[':queue_depth'] = self.pipeline.queue_depth
+            
+            # 重複除外の状況
+            if self.dedup_cache:
+                update_expression += ', duplicate_count = :duplicate_count'
+                expression_attribute_values[':duplicate_count'] = self.dedup_cache.hits
+            
             # 追加フィールドがある場合
             if 'collecting_since' in update_data:
                 update_expression += ', collecting_since = :collecting_since'
@@ -232,6 +2984,10 @@ class CommentCollector:
                 update_expression += ', finished_at = :finished_at'
                 expression_attribute_values[':finished_at'] = update_data['finished_at']
             
+            if 'drain_seconds' in update_data:
+                update_expression += ', drain_seconds = :drain_seconds'
+                expression_attribute_values[':drain_seconds'] = update_data['drain_seconds']
+            
             self.taskstatus_table.update_item(
                 Key={'video_id': self.video_id},
                 UpdateExpression=update_expression,
@@ -249,16 +3005,577 @@ class CommentCollector:
         try:
             if self.chat:
                 self.chat.terminate()
+            if self.exporter:
+                # セッション終了時点までのコメントを書き出し
+                self.exporter.roll()
             self.is_running = False
             logger.info("Cleanup completed")
             
         except Exception as e:
             logger.error(f"Error during cleanup: {str(e)}")
 
+
+class MultiStreamCollector:
+    """1プロセスで複数配信のコメントを並行収集するクラス"""
+    
+    def __init__(self, pipeline=None, max_streams: int = MAX_STREAMS_PER_TASK):
+        self.pipeline = pipeline
+        self.max_streams = max_streams
+        self.executor = ThreadPoolExecutor(max_workers=max_streams, thread_name_prefix='stream')
+        self.collectors = {}
+        self.lock = threading.Lock()
+        self.is_running = False
+        self.last_summary = time.time()
+        # コマンド受信元がある場合は配信が無くなっても待ち続ける
+        self.accepts_commands = bool(COLLECTOR_COMMAND_QUEUE_URL)
+    
+    def add_video(self, video_id: str, channel_id: str) -> bool:
+        """
+        配信を収集対象に追加
+        
+        Returns:
+            コマンドを処理済みとして削除してよい場合True（容量超過で拒否した場合を含む）
+        """
+        if shutdown_deadline is not None:
+            # 停止処理中は受け付けない（コマンドはキューに残し次のタスクで処理）
+            logger.warning(f"Shutting down. Cannot add video: {video_id}")
+            return False
+        
+        with self.lock:
+            if video_id in self.collectors:
+                logger.info(f"Video already being collected: {video_id}")
+                return True
+            
+            if len(self.collectors) >= self.max_streams:
+                self.reject_video(video_id, channel_id, f"Stream capacity reached ({self.max_streams})")
+                return True
+            
+            collector = CommentCollector(video_id, channel_id, pipeline=self.pipeline)
+            self.collectors[video_id] = collector
+        
+        self.executor.submit(self._run_stream, collector)
+        logger.info(f"Added video {video_id} (active streams: {len(self.collectors)})")
+        return True
+    
+    def reject_video(self, video_id: str, channel_id: str, reason: str) -> None:
+        """
+        受け付けられない配信をTaskStatusにrejectedとして記録
+        
+        容量超過は待っても解消しないため、コマンドをキューに残さず拒否する。
+        rejectedは収集中として扱われないため、次の開始メッセージで再度割り当てられる。
+        """
+        logger.error(f"Rejected video {video_id}: {reason}")
+        try:
+            now = int(time.time())
+            dynamodb.Table(TASKSTATUS_TABLE).update_item(
+                Key={'video_id': video_id},
+                UpdateExpression=('SET #status = :status, channel_id = :channel_id, rejected_reason = :reason, '
+                                  'updated_at = :updated_at, #ttl = :ttl'),
+                ExpressionAttributeNames={'#status': 'status', '#ttl': 'ttl'},
+                ExpressionAttributeValues={
+                    ':status': 'rejected',
+                    ':channel_id': channel_id,
+                    ':reason': reason,
+                    ':updated_at': datetime.now(timezone.utc).isoformat(),
+                    ':ttl': now + STATUS_TTL_SECONDS
+                }
+            )
+        except ClientError as e:
+            logger.error(f"Error recording rejected video {video_id}: {str(e)}")
+    
+    def remove_video(self, video_id: str) -> bool:
+        """配信を収集対象から除外"""
+        with self.lock:
+            collector = self.collectors.get(video_id)
+        
+        if not collector:
+            logger.info(f"Video not being collected: {video_id}")
+            return False
+        
+        collector.stop()
+        return True
+    
+    def _run_stream(self, collector: CommentCollector) -> None:
+        """ワーカースレッドで1配信の収集を実行"""
+        threading.current_thread().name = f"stream-{collector.video_id}"
+        try:
+            collector.start_collection()
+        except Exception as e:
+            logger.error(f"Collection for video {collector.video_id} ended with error: {str(e)}")
+        finally:
+            with self.lock:
+                self.collectors.pop(collector.video_id, None)
+            metrics.remove_video(collector.video_id)
+            logger.info(f"Stream finished: {collector.video_id} (active streams: {len(self.collectors)})")
+    
+    def handle_command(self, command: Dict[str, Any]) -> bool:
+        """
+        実行時コマンドを処理
+        
+        Returns:
+            コマンドを処理済みとして削除してよい場合True
+        """
+        action = command.get('action')
+        video_id = command.get('video_id')
+        
+        if not video_id:
+            logger.error(f"Invalid command format: {command}")
+            return True
+        
+        if action == 'add_video':
+            # 停止処理中はメッセージを残して次のタスクで処理させる
+            return self.add_video(video_id, command.get('channel_id', ''))
+        elif action == 'remove_video':
+            self.remove_video(video_id)
+            return True
+        
+        logger.error(f"Unknown command action: {action}")
+        return True
+    
+    def poll_commands(self) -> None:
+        """SQSコマンドキューから追加/削除コマンドを受信"""
+        response = sqs.receive_message(
+            QueueUrl=COLLECTOR_COMMAND_QUEUE_URL,
+            MaxNumberOfMessages=10,
+            WaitTimeSeconds=COMMAND_POLL_WAIT
+        )
+        
+        for message in response.get('Messages', []):
+            try:
+                command = json.loads(message['Body'])
+                logger.info(f"Received command: {command}")
+                
+                if self.handle_command(command):
+                    sqs.delete_message(
+                        QueueUrl=COLLECTOR_COMMAND_QUEUE_URL,
+                        ReceiptHandle=message['ReceiptHandle']
+                    )
+            except Exception as e:
+                logger.error(f"Error processing command: {str(e)}")
+    
+    def stream_states(self) -> Dict[str, int]:
+        """配信ごとの収集済みコメント数"""
+        with self.lock:
+            return {video_id: collector.comment_count for video_id, collector in self.collectors.items()}
+    
+    def run(self, initial_videos: List[Tuple[str, str]]) -> None:
+        """コマンド受信ループ"""
+        self.is_running = True
+        
+        for video_id, channel_id in initial_videos:
+            self.add_video(video_id, channel_id)
+        
+        try:
+            while self.is_running:
+                if self.accepts_commands:
+                    try:
+                        self.poll_commands()
+                    except (ClientError, BotoCoreError) as e:
+                        # エンドポイントに接続できない場合も収集中の配信は止めずに再試行
+                        logger.error(f"Error polling command queue: {str(e)}")
+                        time.sleep(RETRY_DELAY)
+                else:
+                    # コマンドキューがない場合は初期配信が全て終了したら終了
+                    if not self.collectors:
+                        break
+                    time.sleep(1)
+                
+                self.tick()
+                
+                if time.time() - self.last_summary > STREAM_SUMMARY_INTERVAL:
+                    logger.info(f"Active streams: {self.stream_states()}")
+                    self.last_summary = time.time()
+        finally:
+            self.shutdown()
+    
+    def tick(self) -> None:
+        """コマンド受信ループの各周回で呼ばれる定期処理（サブクラスで拡張）"""
+        pass
+    
+    def request_stop(self) -> None:
+        """コマンド受信ループを抜けて全配信の収集を停止（シグナルハンドラから呼び出すためロックは取らない）"""
+        self.is_running = False
+        for collector in list(self.collectors.values()):
+            collector.stop()
+    
+    def shutdown(self) -> None:
+        """全配信の収集を停止"""
+        self.is_running = False
+        with self.lock:
+            collectors = list(self.collectors.values())
+        
+        for collector in collectors:
+            collector.stop()
+        
+        self.executor.shutdown(wait=True)
+        logger.info("Multi-stream collector stopped")
+
+
+class SupervisedStreamCollector(MultiStreamCollector):
+    """スーパーバイザー配下のワーカープロセスで動くMultiStreamCollector（コマンドはプロセス間キューで受信）"""
+    
+    def __init__(self, worker_index: int, commands, heartbeats, pipeline=None):
+        super().__init__(pipeline=pipeline)
+        self.worker_index = worker_index
+        self.commands = commands
+        self.heartbeats = heartbeats
+        self.accepts_commands = True
+        self.last_heartbeat = 0
+    
+    def poll_commands(self) -> None:
+        """スーパーバイザーからのadd_video/remove_videoコマンドを受信"""
+        try:
+            command = self.commands.get(timeout=1)
+        except queue.Empty:
+            return
+        if not self.handle_command(command):
+            # 停止処理中などで追加できなかった配信は割り当てから外させる
+            self.heartbeats.put({'type': 'finished', 'worker': self.worker_index, 'video_id': command.get('video_id')})
+    
+    def tick(self) -> None:
+        if time.time() - self.last_heartbeat >= SUPERVISOR_HEARTBEAT_INTERVAL:
+            self.last_heartbeat = time.time()
+            self.heartbeats.put({
+                'type': 'heartbeat',
+                'worker': self.worker_index,
+                'pid': os.getpid(),
+                'streams': self.stream_states(),
+                'at': self.last_heartbeat
+            })
+    
+    def _run_stream(self, collector: CommentCollector) -> None:
+        try:
+            super()._run_stream(collector)
+        finally:
+            self.heartbeats.put({'type': 'finished', 'worker': self.worker_index, 'video_id': collector.video_id,
+                                 'comment_count': collector.comment_count})
+
+
+def run_supervised_worker(worker_index: int, videos: List[Tuple[str, str]], commands, heartbeats) -> None:
+    """スーパーバイザーが起動するワーカープロセスのエントリポイント"""
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(
+            f'%(asctime)s - %(levelname)s - [worker-{worker_index}] [%(threadName)s] %(message)s'
+        ))
+    
+    pipeline = None
+    try:
+        # スプールはワーカーごとに別ディレクトリ、HTTPサーバーはワーカー番号だけずらしたポートを使う
+        pipeline = create_pipeline(spool_dir=os.path.join(SPOOL_DIR, f"worker-{worker_index}"))
+        start_metrics(pipeline, port_offset=worker_index)
+        start_comment_stream(port_offset=worker_index)
+        
+        collector = SupervisedStreamCollector(worker_index, commands, heartbeats, pipeline=pipeline)
+        install_shutdown_handler(collector.request_stop)
+        collector.run(videos)
+    finally:
+        if pipeline:
+            pipeline.close(timeout=drain_timeout())
+        if comment_broadcaster:
+            comment_broadcaster.close()
+
+
+class WorkerHandle:
+    """スーパーバイザーが管理するワーカープロセス1つ分の状態"""
+    
+    def __init__(self, index: int, context):
+        self.index = index
+        self.context = context
+        self.process = None
+        self.commands = None
+        self.videos = {}  # video_id -> channel_id
+        self.rates = {}  # video_id -> 想定流量（件/秒、実測で更新）
+        self.counts = {}  # video_id -> 最新ハートビートのコメント数
+        self.finished_comments = 0  # 収集を終えた配信のコメント数
+        self.last_heartbeat = 0
+        self.started_at = 0
+        self.restarts = 0
+        self.restart_at = None
+    
+    @property
+    def load(self) -> float:
+        return sum(self.rates.values())
+    
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+    
+    def start(self, heartbeats) -> None:
+        """ワーカープロセスを起動（割り当て済みの配信はチェックポイントから再開）"""
+        self.commands = self.context.Queue()
+        self.process = self.context.Process(
+            target=run_supervised_worker,
+            args=(self.index, list(self.videos.items()), self.commands, heartbeats),
+            name=f"collector-worker-{self.index}",
+            daemon=False
+        )
+        self.process.start()
+        self.started_at = self.last_heartbeat = time.time()
+        self.restart_at = None
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}, streams: {len(self.videos)})")
+
+
+class CollectorSupervisor(MultiStreamCollector):
+    """
+    配信を複数のワーカープロセスに分散するスーパーバイザー
+    
+    SQSコマンドキューはスーパーバイザーだけが受信し、想定流量の合計が最も小さい
+    ワーカーに配信を割り当てる。クラッシュ・応答停止したワーカーは割り当て済みの配信ごと
+    再起動し、ワーカーのハートビートをTaskStatusに集約する。
+    """
+    
+    def __init__(self, worker_count: int = SUPERVISOR_WORKERS, max_streams: int = MAX_STREAMS_PER_TASK):
+        super().__init__(max_streams=max_streams)
+        # boto3クライアントやスレッドを持つ親プロセスをforkしないようspawnで起動
+        self.context = multiprocessing.get_context('spawn')
+        self.heartbeats = self.context.Queue()
+        self.workers = [WorkerHandle(index, self.context) for index in range(worker_count or os.cpu_count() or 1)]
+        self.collectors = {}  # video_id -> WorkerHandle
+        self.last_status_update = 0
+    
+    def run(self, initial_videos: List[Tuple[str, str]]) -> None:
+        # 初期配信は全ワーカー起動前に割り当て、ワーカーの起動引数として渡す
+        for video_id, channel_id in initial_videos:
+            self._assign(video_id, channel_id, DEFAULT_EXPECTED_RATE)
+        for worker in self.workers:
+            worker.start(self.heartbeats)
+        
+        super().run([])
+    
+    def _assign(self, video_id: str, channel_id: str, expected_rate: float) -> Optional[WorkerHandle]:
+        """想定流量の合計が最小のワーカーに割り当て"""
+        candidates = [worker for worker in self.workers if worker.restart_at is None]
+        if not candidates:
+            return None
+        
+        worker = min(candidates, key=lambda candidate: (candidate.load, len(candidate.videos)))
+        worker.videos[video_id] = channel_id
+        worker.rates[video_id] = expected_rate
+        self.collectors[video_id] = worker
+        return worker
+    
+    def add_video(self, video_id: str, channel_id: str, expected_rate: Optional[float] = None) -> bool:
+        if shutdown_deadline is not None:
+            logger.warning(f"Shutting down. Cannot add video: {video_id}")
+            return False
+        
+        with self.lock:
+            if video_id in self.collectors:
+                logger.info(f"Video already being collected: {video_id}")
+                return True
+            
+            if len(self.collectors) >= self.max_streams:
+                self.reject_video(video_id, channel_id, f"Stream capacity reached ({self.max_streams})")
+                return True
+            
+            worker = self._assign(video_id, channel_id, float(expected_rate or DEFAULT_EXPECTED_RATE))
+            if not worker:
+                logger.warning(f"No worker available. Cannot add video: {video_id}")
+                return False
+        
+        if worker.alive:
+            worker.commands.put({'action': 'add_video', 'video_id': video_id, 'channel_id': channel_id})
+        logger.info(f"Assigned video {video_id} to worker {worker.index} (worker load {worker.load:.1f}/s)")
+        return True
+    
+    def remove_video(self, video_id: str) -> bool:
+        with self.lock:
+            worker = self.collectors.get(video_id)
+        
+        if not worker:
+            logger.info(f"Video not being collected: {video_id}")
+            return False
+        
+        if worker.alive:
+            worker.commands.put({'action': 'remove_video', 'video_id': video_id})
+        return True
+    
+    def handle_command(self, command: Dict[str, Any]) -> bool:
+        if command.get('action') == 'add_video' and command.get('video_id'):
+            return self.add_video(command['video_id'], command.get('channel_id', ''), command.get('expected_rate'))
+        return super().handle_command(command)
+    
+    def tick(self) -> None:
+        self._drain_heartbeats()
+        self._supervise_workers()
+        if time.time() - self.last_status_update >= HEALTH_CHECK_INTERVAL:
+            self.update_supervisor_status('running')
+    
+    def _drain_heartbeats(self) -> None:
+        """ワーカーからの報告を反映（配信ごとの実測流量で想定流量を更新）"""
+        while True:
+            try:
+                message = self.heartbeats.get_nowait()
+            except queue.Empty:
+                return
+            
+            worker = self.workers[message['worker']]
+            if message['type'] == 'finished':
+                with self.lock:
+                    worker.videos.pop(message['video_id'], None)
+                    worker.rates.pop(message['video_id'], None)
+                    worker.counts.pop(message['video_id'], None)
+                    worker.finished_comments += message.get('comment_count', 0)
+                    if self.collectors.get(message['video_id']) is worker:
+                        self.collectors.pop(message['video_id'], None)
+                continue
+            
+            elapsed = max(message['at'] - worker.last_heartbeat, 1e-3)
+            with self.lock:
+                for video_id, count in message['streams'].items():
+                    previous = worker.counts.get(video_id)
+                    worker.counts[video_id] = count
+                    if previous is not None and video_id in worker.rates:
+                        observed = max(count - previous, 0) / elapsed
+                        worker.rates[video_id] += RATE_SMOOTHING * (observed - worker.rates[video_id])
+            worker.last_heartbeat = message['at']
+    
+    def _supervise_workers(self) -> None:
+        """終了・応答停止したワーカーを割り当て済みの配信ごと再起動"""
+        now = time.time()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at and self.is_running:
+                    worker.start(self.heartbeats)
+                continue
+            
+            if worker.alive and now - worker.last_heartbeat > SUPERVISOR_HEARTBEAT_TIMEOUT:
+                logger.error(f"Worker {worker.index} missed heartbeats for {now - worker.last_heartbeat:.0f}s. Killing")
+                worker.process.kill()
+                worker.process.join(timeout=5)
+            
+            if worker.alive or not self.is_running:
+                continue
+            
+            if now - worker.started_at >= SUPERVISOR_STABLE_SECONDS:
+                worker.restarts = 0
+            worker.restarts += 1
+            delay = min(2 ** (worker.restarts - 1), SUPERVISOR_RESTART_MAX_DELAY)
+            worker.restart_at = now + delay
+            # 再起動後のワーカーは0から数え直すため、終了時点のコメント数を累計に移す
+            with self.lock:
+                worker.finished_comments += sum(worker.counts.values())
+                worker.counts.clear()
+            logger.error(f"Worker {worker.index} exited (code {worker.process.exitcode}). "
+                         f"Restarting in {delay}s with {len(worker.videos)} streams")
+    
+    def stream_states(self) -> Dict[str, int]:
+        with self.lock:
+            return {video_id: count for worker in self.workers for video_id, count in worker.counts.items()}
+    
+    def update_supervisor_status(self, status: str) -> None:
+        """ワーカーのハートビートを集約してTaskStatusに書き込み"""
+        self.last_status_update = time.time()
+        now = int(self.last_status_update)
+        with self.lock:
+            workers = [
+                {
+                    'index': worker.index,
+                    'pid': worker.process.pid if worker.process else 0,
+                    'alive': worker.alive,
+                    'streams': len(worker.videos),
+                    'comment_count': sum(worker.counts.values()) + worker.finished_comments,
+                    'rate': Decimal(f"{worker.load:.2f}"),
+                    'restarts': worker.restarts,
+                    'last_heartbeat_at': int(worker.last_heartbeat),
+                    # ワーカーごとにポート番号 + ワーカー番号で公開（無効の場合0）
+                    'metrics_port': METRICS_PORT + worker.index if METRICS_PORT else 0,
+                    'stream_port': COMMENT_STREAM_PORT + worker.index if COMMENT_STREAM_PORT else 0
+                }
+                for worker in self.workers
+            ]
+            stream_workers = {video_id: worker.index for video_id, worker in self.collectors.items()}
+        
+        try:
+            dynamodb.Table(TASKSTATUS_TABLE).update_item(
+                Key={'video_id': SUPERVISOR_STATUS_KEY},
+                UpdateExpression=('SET supervisor_status = :status, workers = :workers, stream_workers = :stream_workers, '
+                                  'active_streams = :active_streams, comment_count = :comment_count, '
+                                  'lease_expires_at = :lease_expires_at, updated_at = :updated_at'),
+                ExpressionAttributeValues={
+                    ':status': status,
+                    ':workers': workers,
+                    ':stream_workers': stream_workers,
+                    ':active_streams': sum(worker['streams'] for worker in workers),
+                    ':comment_count': sum(worker['comment_count'] for worker in workers),
+                    ':lease_expires_at': now + LEASE_DURATION if status == 'running' else now,
+                    ':updated_at': datetime.now(timezone.utc).isoformat()
+                }
+            )
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Error updating supervisor status: {str(e)}")
+    
+    def request_stop(self) -> None:
+        """コマンド受信ループを抜けて全ワーカーにSIGTERMを転送"""
+        self.is_running = False
+        for worker in self.workers:
+            if worker.alive:
+                os.kill(worker.process.pid, signal.SIGTERM)
+    
+    def shutdown(self) -> None:
+        """全ワーカーを停止し、stopTimeout内に終わらないワーカーは強制終了"""
+        self.is_running = False
+        for worker in self.workers:
+            if worker.alive and shutdown_deadline is None:
+                os.kill(worker.process.pid, signal.SIGTERM)
+        
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=drain_timeout())
+            if worker.process.is_alive():
+                logger.error(f"Worker {worker.index} did not stop in time. Killing")
+                worker.process.kill()
+                worker.process.join()
+        
+        self._drain_heartbeats()
+        self.update_supervisor_status('stopped')
+        logger.info("Collector supervisor stopped")
+
+
+def create_pipeline(spool_dir: str = SPOOL_DIR):
+    """PIPELINE_MODEに応じた書き込みステージを作成（inlineの場合None）"""
+    if PIPELINE_MODE == 'queue':
+        return CommentWritePipeline()
+    elif PIPELINE_MODE == 'spool':
+        return CommentSpool(spool_dir=spool_dir)
+    return None
+
+
+def parse_video_list(value: str) -> List[Tuple[str, str]]:
+    """VIDEO_IDS環境変数 ("video_id:channel_id,...") を解析"""
+    videos = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        video_id, _, channel_id = entry.partition(':')
+        videos.append((video_id, channel_id))
+    return videos
+
+
 def main():
     """メイン関数"""
     logger.info("YouTube Comment Collector starting...")
     
+    if CHAT_SOURCE not in CHAT_SOURCES:
+        logger.error(f"Unknown CHAT_SOURCE: {CHAT_SOURCE} (available: {', '.join(CHAT_SOURCES)})")
+        sys.exit(1)
+    
+    if CHAT_PARSE_MODE not in CHAT_PARSE_MODES:
+        logger.error(f"Unknown CHAT_PARSE_MODE: {CHAT_PARSE_MODE} (available: {', '.join(CHAT_PARSE_MODES)})")
+        sys.exit(1)
+    if CHAT_PARSE_MODE == 'raw' and CHAT_RECORD_DIR and CHAT_SOURCE == 'youtube':
+        logger.warning("CHAT_RECORD_DIR is ignored when CHAT_PARSE_MODE=raw")
+    
+    if COLLECTOR_MODE == 'multi':
+        main_multi()
+        return
+    
+    if COLLECTOR_MODE == 'supervisor':
+        main_supervisor()
+        return
+    
     # 環境変数チェック
     if not VIDEO_ID:
         logger.error("VIDEO_ID environment variable is required")
@@ -274,10 +3591,17 @@ def main():
     logger.info(f"  ENVIRONMENT: {ENVIRONMENT}")
     logger.info(f"  COMMENTS_TABLE: {COMMENTS_TABLE}")
     logger.info(f"  TASKSTATUS_TABLE: {TASKSTATUS_TABLE}")
+    logger.info(f"  PIPELINE_MODE: {PIPELINE_MODE}")
     
+    pipeline = None
     try:
+        pipeline = create_pipeline()
+        start_metrics(pipeline)
+        start_comment_stream()
+        
         # コメント収集開始
-        collector = CommentCollector(VIDEO_ID, CHANNEL_ID)
+        collector = CommentCollector(VIDEO_ID, CHANNEL_ID, pipeline=pipeline)
+        install_shutdown_handler(collector.stop)
         collector.start_collection()
         
         logger.info("Comment collection completed successfully")
@@ -288,6 +3612,85 @@ def main():
     except Exception as e:
         logger.error(f"Fatal error: {str(e)}")
         sys.exit(1)
+    finally:
+        if pipeline:
+            pipeline.close(timeout=drain_timeout())
+        if comment_broadcaster:
+            comment_broadcaster.close()
+        if shutdown_deadline is not None:
+            logger.info(f"Graceful shutdown finished with {drain_timeout():.1f}s of stop timeout remaining")
+
+
+def main_multi():
+    """マルチストリームモードのメイン関数"""
+    # 複数配信のログを区別するためスレッド名を出力
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s'))
+    
+    initial_videos = parse_video_list(VIDEO_IDS)
+    
+    logger.info(f"Configuration (multi-stream):")
+    logger.info(f"  VIDEO_IDS: {initial_videos}")
+    logger.info(f"  COMMAND_QUEUE: {COLLECTOR_COMMAND_QUEUE_URL}")
+    logger.info(f"  MAX_STREAMS_PER_TASK: {MAX_STREAMS_PER_TASK}")
+    logger.info(f"  PIPELINE_MODE: {PIPELINE_MODE}")
+    
+    if not initial_videos and not COLLECTOR_COMMAND_QUEUE_URL:
+        logger.error("VIDEO_IDS or COLLECTOR_COMMAND_QUEUE_URL is required in multi-stream mode")
+        sys.exit(1)
+    
+    pipeline = None
+    try:
+        pipeline = create_pipeline()
+        start_metrics(pipeline)
+        start_comment_stream()
+        
+        multi_collector = MultiStreamCollector(pipeline=pipeline)
+        install_shutdown_handler(multi_collector.request_stop)
+        multi_collector.run(initial_videos)
+        
+    except KeyboardInterrupt:
+        logger.info("Multi-stream collection interrupted by user")
+    except Exception as e:
+        logger.error(f"Fatal error: {str(e)}")
+        sys.exit(1)
+    finally:
+        if pipeline:
+            pipeline.close(timeout=drain_timeout())
+        if comment_broadcaster:
+            comment_broadcaster.close()
+        if shutdown_deadline is not None:
+            logger.info(f"Graceful shutdown finished with {drain_timeout():.1f}s of stop timeout remaining")
+
+
+def main_supervisor():
+    """スーパーバイザーモードのメイン関数"""
+    initial_videos = parse_video_list(VIDEO_IDS)
+    
+    logger.info(f"Configuration (supervisor):")
+    logger.info(f"  VIDEO_IDS: {initial_videos}")
+    logger.info(f"  COMMAND_QUEUE: {COLLECTOR_COMMAND_QUEUE_URL}")
+    logger.info(f"  SUPERVISOR_WORKERS: {SUPERVISOR_WORKERS or os.cpu_count()}")
+    logger.info(f"  MAX_STREAMS_PER_TASK: {MAX_STREAMS_PER_TASK}")
+    logger.info(f"  PIPELINE_MODE: {PIPELINE_MODE}")
+    
+    if not initial_videos and not COLLECTOR_COMMAND_QUEUE_URL:
+        logger.error("VIDEO_IDS or COLLECTOR_COMMAND_QUEUE_URL is required in supervisor mode")
+        sys.exit(1)
+    
+    try:
+        supervisor = CollectorSupervisor()
+        install_shutdown_handler(supervisor.request_stop)
+        supervisor.run(initial_videos)
+        
+    except KeyboardInterrupt:
+        logger.info("Supervisor interrupted by user")
+    except Exception as e:
+        logger.error(f"Fatal error: {str(e)}")
+        sys.exit(1)
+    finally:
+        if shutdown_deadline is not None:
+            logger.info(f"Graceful shutdown finished with {drain_timeout():.1f}s of stop timeout remaining")
 
 if __name__ == "__main__":
     main()
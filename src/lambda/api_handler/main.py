@@ -5,15 +5,23 @@ REST APIエンドポイントを提供するLambda関数
 - チャンネル管理 (GET, POST /channels)
 - ライブ配信一覧 (GET /streams)
 - コメント取得 (GET /streams/{video_id}/comments)
+- 分単位集計取得 (GET /streams/{video_id}/rollups)
+- トレンド取得 (GET /streams/{video_id}/trending)
 """
 
 import json
+import math
+import heapq
 import boto3
 import os
+import zlib
+import time
+import random
 import requests
 import xml.etree.ElementTree as ET
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
 from botocore.exceptions import ClientError
 import logging
 
@@ -30,6 +38,18 @@ CHANNELS_TABLE = os.environ.get('CHANNELS_TABLE', 'dev-Channels')
 LIVESTREAMS_TABLE = os.environ.get('LIVESTREAMS_TABLE', 'dev-LiveStreams')
 COMMENTS_TABLE = os.environ.get('COMMENTS_TABLE', 'dev-Comments')
 TASKSTATUS_TABLE = os.environ.get('TASKSTATUS_TABLE', 'dev-TaskStatus')
+ROLLUPS_TABLE = os.environ.get('ROLLUPS_TABLE', 'dev-Rollups')
+AUTHORS_TABLE = os.environ.get('AUTHORS_TABLE', 'dev-Authors')
+BATCH_GET_LIMIT = 100  # BatchGetItem 1回あたりの最大キー数
+BATCH_GET_MAX_ATTEMPTS = 5  # UnprocessedKeysが残った場合の最大試行回数
+BATCH_GET_BACKOFF_BASE = 0.05  # 秒 (再試行バックオフの初期値)
+BATCH_GET_BACKOFF_MAX = 1  # 秒 (再試行バックオフの上限、APIの応答時間を優先してコレクターより短くする)
+COMMENT_SHARD_COUNT = int(os.environ.get('COMMENT_SHARD_COUNT', '0'))  # LiveStreamsにシャード数が記録されていない配信に使う値 (0/1で無効)
+COMMENT_SHARD_QUERY_CONCURRENCY = 8  # シャードを並列にQueryする最大スレッド数
+COMMENT_SHARD_QUERY_MARGIN = 10  # シャードごとのQuery件数 (limit / パーティション数) に加える余裕
+ROLLUP_TOTAL_KEY = '__all__'  # 全配信の日次集計のvideo_id
+ROLLUP_DEFAULT_MINUTES = 60  # from/to省略時に返す分数
+TRENDING_SNAPSHOT_BUCKET = 'trending'  # トレンドスナップショットのbucket
 YOUTUBE_API_KEY_PARAM = os.environ.get('YOUTUBE_API_KEY_PARAM', '/dev/youtube-chat-collector/youtube-api-key')
 
 def get_youtube_api_key() -> Optional[str]:
@@ -166,6 +186,16 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 video_id = path_parameters.get('video_id')
                 return get_comments(video_id, query_parameters)
                 
+        elif path.startswith('/streams/') and path.endswith('/rollups'):
+            if http_method == 'GET':
+                video_id = path_parameters.get('video_id')
+                return get_rollups(video_id, query_parameters)
+                
+        elif path.startswith('/streams/') and path.endswith('/trending'):
+            if http_method == 'GET':
+                video_id = path_parameters.get('video_id')
+                return get_trending(video_id, query_parameters)
+                
         elif path == '/collection-status':
             if http_method == 'GET':
                 return get_collection_status(query_parameters)
@@ -548,31 +578,34 @@ def get_comments(video_id: str, query_params: Dict[str, str]) -> Dict[str, Any]:
         if not video_id:
             return create_response(400, {'error': 'video_id is required'})
         
-        table = dynamodb.Table(COMMENTS_TABLE)
-        
         # ページネーション対応
         limit = int(query_params.get('limit', '100'))
         limit = min(limit, 1000)  # 最大1000件
         
-        # GSIを使用してvideo_id別に取得
-        query_params_db = {
-            'IndexName': 'video_id-timestamp-index',
-            'KeyConditionExpression': 'video_id = :video_id',
-            'ExpressionAttributeValues': {':video_id': video_id},
-            'ScanIndexForward': False,  # 新しい順
-            'Limit': limit
-        }
-        
         # カーソルベースのページネーション
         last_key = query_params.get('last_key')
         if last_key:
             try:
-                query_params_db['ExclusiveStartKey'] = json.loads(last_key)
+                cursor = json.loads(last_key)
             except json.JSONDecodeError:
                 return create_response(400, {'error': 'Invalid last_key format'})
+        else:
+            cursor = None
+        
+        shard_count = get_comment_shard_count(video_id)
+        if shard_count > 1:
+            if cursor is not None and not is_shard_cursor(cursor):
+                return create_response(400, {'error': 'Invalid last_key format'})
+            partitions = comment_partitions(video_id, shard_count)
+        else:
+            partitions = [video_id]
+            if cursor is not None and not is_shard_cursor(cursor):
+                # 旧形式（ExclusiveStartKeyそのもの）のカーソルも受け付ける
+                cursor = {'shards': {video_id: cursor}}
         
-        response = table.query(**query_params_db)
-        comments = response.get('Items', [])
+        # GSIを使用してvideo_id別に取得
+        comments, next_cursor = query_comments(partitions, limit, cursor)
+        comments = join_authors(comments)
         
         # 日時フィールドを文字列に変換（既に文字列の場合はそのまま）
         for comment in comments:
@@ -588,8 +621,8 @@ def get_comments(video_id: str, query_params: Dict[str, str]) -> Dict[str, Any]:
         }
         
         # 次のページがある場合はlast_keyを含める
-        if 'LastEvaluatedKey' in response:
-            result['last_key'] = json.dumps(response['LastEvaluatedKey'])
+        if next_cursor:
+            result['last_key'] = json.dumps(next_cursor)
         
         return create_response(200, result)
         
@@ -597,6 +630,396 @@ def get_comments(video_id: str, query_params: Dict[str, str]) -> Dict[str, Any]:
         logger.error(f"DynamoDB error in get_comments: {str(e)}")
         return create_response(500, {'error': 'Database error'})
 
+def get_comment_shard_count(video_id: str) -> int:
+    """コレクターがLiveStreamsに記録した配信のシャード数（未記録の場合はCOMMENT_SHARD_COUNT）"""
+    response = dynamodb.Table(LIVESTREAMS_TABLE).get_item(
+        Key={'video_id': video_id},
+        ProjectionExpression='comment_shard_count'
+    )
+    shard_count = response.get('Item', {}).get('comment_shard_count')
+    return COMMENT_SHARD_COUNT if shard_count is None else int(shard_count)
+
+def comment_partitions(video_id: str, shard_count: int) -> List[str]:
+    """
+    シャーディング有効時に1配信のコメントが格納され得るGSIパーティションキーを列挙
+    
+    シャーディング有効化前に書き込まれたコメント（video_idそのもの）も対象に含める。
+    
+    Args:
+        video_id: YouTube動画ID
+        shard_count: 配信のシャード数
+        
+    Returns:
+        video_id-timestamp-indexのパーティションキー値のリスト
+    """
+    return [video_id] + [f"{video_id}#{shard}" for shard in range(shard_count)]
+
+def is_shard_cursor(cursor: Any) -> bool:
+    """パーティション別の再開位置を持つ複合カーソルかを判定"""
+    return (
+        isinstance(cursor, dict)
+        and isinstance(cursor.get('shards'), dict)
+        and all(value is None or isinstance(value, dict) for value in cursor['shards'].values())
+        and isinstance(cursor.get('skip', {}), dict)
+        and all(isinstance(value, int) and value >= 0 for value in cursor.get('skip', {}).values())
+    )
+
+def query_comment_partition(partition: str, limit: int,
+                            start_key: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """video_id-timestamp-indexの1パーティションを新しい順にQuery"""
+    query_params_db = {
+        'IndexName': 'video_id-timestamp-index',
+        'KeyConditionExpression': 'video_id = :video_id',
+        'ExpressionAttributeValues': {':video_id': partition},
+        'ScanIndexForward': False,  # 新しい順
+        'Limit': limit
+    }
+    if start_key:
+        query_params_db['ExclusiveStartKey'] = start_key
+    return dynamodb.Table(COMMENTS_TABLE).query(**query_params_db)
+
+class CommentPartitionReader:
+    """video_id-timestamp-indexの1パーティションを、マージで必要になった分だけページングして読む"""
+    
+    def __init__(self, partition: str, start_key: Optional[Dict[str, Any]], page_size: int):
+        self.partition = partition
+        self.next_key = start_key
+        self.page_size = page_size
+        self.buffer = []
+        self.has_more = True
+        self.fetched = 0
+    
+    def fetch(self) -> None:
+        response = query_comment_partition(self.partition, self.page_size, self.next_key)
+        self.buffer = response.get('Items', [])
+        self.fetched += len(self.buffer)
+        self.next_key = response.get('LastEvaluatedKey')
+        self.has_more = self.next_key is not None
+    
+    def entries(self, index: int):
+        """マージ用に(timestamp, パーティション番号, アイテム)を新しい順に返す（バッファを読み切ったら次のページを取得）"""
+        while True:
+            buffer, self.buffer = self.buffer, []
+            for item in buffer:
+                yield item.get('timestamp', ''), index, item
+            if not self.has_more:
+                return
+            self.fetch()
+
+def query_comments(partitions: List[str], limit: int,
+                   cursor: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    各パーティションを並列にQueryし、timestampの新しい順にマージして先頭limit件のコメントを返す
+    
+    各パーティションは limit / パーティション数 + COMMENT_SHARD_QUERY_MARGIN 件ずつ取得し、
+    マージ中に読み切ったパーティションだけ続きを取得する。
+    複合カーソルはパーティション値ごとの再開位置（ExclusiveStartKey、未取得ならnull）を持ち、
+    読み切ったパーティションは含めない。各パーティションは最後まで返したアイテムの次から
+    再開するため、ページをまたいでも全体の時刻順が保たれる。チャンクアイテムの途中で
+    limitに達した場合は、そのチャンクの直前から再開し、skipに記録した件数だけ
+    チャンク先頭のコメントを読み飛ばす。
+    
+    Args:
+        partitions: video_id-timestamp-indexのパーティションキー値のリスト
+        limit: 最大取得コメント数
+        cursor: 前ページの複合カーソル（先頭ページはNone）
+        
+    Returns:
+        (コメントのリスト（新しい順）, 次ページの複合カーソルまたはNone)
+    """
+    if cursor is None:
+        start_keys = {partition: None for partition in partitions}
+        skips = {}
+    else:
+        start_keys = cursor['shards']
+        skips = cursor.get('skip', {})
+    partitions = [partition for partition in partitions if partition in start_keys]
+    if not partitions:
+        return [], None
+    
+    page_size = min(limit, math.ceil(limit / len(partitions)) + COMMENT_SHARD_QUERY_MARGIN)
+    readers = [CommentPartitionReader(partition, start_keys[partition], page_size) for partition in partitions]
+    with ThreadPoolExecutor(max_workers=min(COMMENT_SHARD_QUERY_CONCURRENCY, len(readers))) as executor:
+        list(executor.map(CommentPartitionReader.fetch, readers))
+    
+    # 各パーティションは新しい順のため、timestampの降順でk-wayマージ
+    streams = [reader.entries(index) for index, reader in enumerate(readers)]
+    
+    comments = []
+    taken = [0] * len(readers)
+    last_keys = [start_keys[partition] for partition in partitions]
+    partial = None
+    for _, index, item in heapq.merge(*streams, key=lambda entry: (entry[0], entry[1]), reverse=True):
+        key = {
+            'comment_id': item['comment_id'],
+            'video_id': item['video_id'],
+            'timestamp': item['timestamp']
+        }
+        # カーソルのskipは再開したパーティションの先頭アイテム（途中まで返したチャンク）に適用
+        skip = skips.get(partitions[index], 0) if taken[index] == 0 else 0
+        expanded = expand_comment_items([item])[skip:]
+        remaining = limit - len(comments)
+        if len(expanded) > remaining:
+            comments.extend(expanded[:remaining])
+            partial = (index, skip + remaining)
+            break
+        comments.extend(expanded)
+        taken[index] += 1
+        last_keys[index] = key
+        if len(comments) >= limit:
+            # 次のアイテムを要求するとマージが余分なページを取得するため、ここで抜ける
+            break
+    
+    next_start_keys = {}
+    next_skips = {}
+    for index, (partition, reader) in enumerate(zip(partitions, readers)):
+        if reader.has_more or taken[index] < reader.fetched:
+            # 最後まで返したアイテムの次から再開
+            next_start_keys[partition] = last_keys[index]
+            if partial is not None and partial[0] == index:
+                next_skips[partition] = partial[1]
+    
+    if not next_start_keys:
+        return comments, None
+    next_cursor = {'shards': next_start_keys}
+    if next_skips:
+        next_cursor['skip'] = next_skips
+    return comments, next_cursor
+
+def expand_comment_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    圧縮チャンクアイテムを個別コメントに展開（通常のコメントアイテムはそのまま）
+    
+    Args:
+        items: Commentsテーブルから取得したアイテム（新しい順）
+        
+    Returns:
+        コメントのリスト（新しい順）
+    """
+    comments = []
+    for item in items:
+        if '#' in item.get('video_id', ''):
+            # シャーディングされたアイテム（video_id#シャード番号）は元のvideo_idに戻す
+            item['video_id'] = item['video_id'].split('#', 1)[0]
+        if item.get('item_type') != 'chunk':
+            comments.append(item)
+            continue
+        
+        payload = item['payload']
+        raw = zlib.decompress(getattr(payload, 'value', payload))
+        fields = item['payload_fields']
+        video_id = item['video_id']
+        
+        # チャンク内は古い順に格納されているため逆順に展開
+        for values in reversed(json.loads(raw)):
+            record = dict(zip(fields, values))
+            comments.append({
+                'comment_id': f"{video_id}#{record['id']}",
+                'video_id': video_id,
+                'channel_id': item.get('channel_id'),
+                'author_name': record['author_name'],
+                'author_channel_id': record['author_channel_id'],
+                'message': record['message'],
+                'timestamp': record['received_at'],
+                'datetime': record['datetime'],
+                'is_owner': record['is_owner'],
+                'is_moderator': record['is_moderator'],
+                'is_verified': record['is_verified'],
+                'created_at': record['received_at']
+            })
+    
+    return comments
+
+def batch_get_backoff(attempt: int) -> float:
+    """BatchGetItem再試行までの待機時間（フルジッター付き指数バックオフ）"""
+    return random.uniform(0, min(BATCH_GET_BACKOFF_MAX, BATCH_GET_BACKOFF_BASE * (2 ** attempt)))
+
+def join_authors(comments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    投稿者IDだけを持つコメントにAuthorsテーブルの投稿者名・認証状態を結合
+    
+    Args:
+        comments: コメントのリスト
+        
+    Returns:
+        投稿者属性を補完したコメントのリスト
+    """
+    author_ids = list({
+        comment['author_channel_id'] for comment in comments
+        if 'author_name' not in comment and comment.get('author_channel_id')
+    })
+    if not author_ids:
+        return comments
+    
+    authors = {}
+    for start in range(0, len(author_ids), BATCH_GET_LIMIT):
+        request_items = {
+            AUTHORS_TABLE: {
+                'Keys': [{'author_channel_id': author_id} for author_id in author_ids[start:start + BATCH_GET_LIMIT]],
+                'ProjectionExpression': 'author_channel_id, author_name, is_verified'
+            }
+        }
+        # スロットリング等で未処理になったキーはバックオフして再取得し、上限に達したら投稿者属性なしで返す
+        attempt = 0
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for author in response.get('Responses', {}).get(AUTHORS_TABLE, []):
+                authors[author['author_channel_id']] = author
+            request_items = response.get('UnprocessedKeys') or None
+            if not request_items:
+                break
+            
+            attempt += 1
+            if attempt >= BATCH_GET_MAX_ATTEMPTS:
+                unprocessed = len(request_items.get(AUTHORS_TABLE, {}).get('Keys', []))
+                logger.warning(f"{unprocessed} authors left unprocessed after {attempt} attempts")
+                break
+            time.sleep(batch_get_backoff(attempt))
+    
+    for comment in comments:
+        if 'author_name' in comment:
+            continue
+        author = authors.get(comment.get('author_channel_id'), {})
+        comment['author_name'] = author.get('author_name')
+        comment['is_verified'] = author.get('is_verified', False)
+    
+    return comments
+
+def get_rollups(video_id: str, query_params: Dict[str, str]) -> Dict[str, Any]:
+    """
+    指定されたライブ配信の分単位集計を取得
+    
+    Args:
+        video_id: YouTube動画ID
+        query_params: クエリパラメータ（from/to: YYYY-MM-DDTHH:MM、省略時は直近60分）
+        
+    Returns:
+        分単位集計と期間合計のレスポンス
+    """
+    try:
+        if not video_id:
+            return create_response(400, {'error': 'video_id is required'})
+        
+        now = datetime.now(timezone.utc)
+        to_minute = query_params.get('to') or now.strftime('%Y-%m-%dT%H:%M')
+        from_minute = query_params.get('from') or (now - timedelta(minutes=ROLLUP_DEFAULT_MINUTES)).strftime('%Y-%m-%dT%H:%M')
+        
+        table = dynamodb.Table(ROLLUPS_TABLE)
+        query_params_db = {
+            'KeyConditionExpression': 'video_id = :video_id AND bucket BETWEEN :from AND :to',
+            'ExpressionAttributeValues': {
+                ':video_id': video_id,
+                ':from': f"minute#{from_minute}",
+                ':to': f"minute#{to_minute}"
+            }
+        }
+        
+        items = []
+        while True:
+            response = table.query(**query_params_db)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_params_db['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        # 期間全体のユニーク投稿者数は各分のHyperLogLogをマージして推定
+        registers = None
+        minutes = []
+        for item in items:
+            hll = item.get('hll')
+            if hll is not None:
+                value = bytes(getattr(hll, 'value', hll))
+                registers = value if registers is None else bytes(max(a, b) for a, b in zip(registers, value))
+            
+            minutes.append({
+                'minute': item['bucket'].split('#', 1)[1],
+                'comment_count': int(item.get('comment_count', 0)),
+                'unique_authors': int(item.get('unique_authors', 0)),
+                'owner_count': int(item.get('owner_count', 0)),
+                'moderator_count': int(item.get('moderator_count', 0))
+            })
+        
+        result = {
+            'video_id': video_id,
+            'from': from_minute,
+            'to': to_minute,
+            'minutes': minutes,
+            'total': {
+                'comment_count': sum(minute['comment_count'] for minute in minutes),
+                'unique_authors': estimate_unique_authors(registers) if registers else 0,
+                'owner_count': sum(minute['owner_count'] for minute in minutes),
+                'moderator_count': sum(minute['moderator_count'] for minute in minutes)
+            }
+        }
+        
+        return create_response(200, result)
+        
+    except ClientError as e:
+        logger.error(f"DynamoDB error in get_rollups: {str(e)}")
+        return create_response(500, {'error': 'Database error'})
+
+def get_trending(video_id: str, query_params: Dict[str, str]) -> Dict[str, Any]:
+    """
+    指定されたライブ配信の頻出語・絵文字を取得（コレクターが書き込むスナップショットをGetItem 1回で返す）
+    
+    Args:
+        video_id: YouTube動画ID
+        query_params: クエリパラメータ（window: 1m/5m/60m、limit: 件数）
+        
+    Returns:
+        ウィンドウごとの上位トークンのレスポンス
+    """
+    try:
+        if not video_id:
+            return create_response(400, {'error': 'video_id is required'})
+        
+        table = dynamodb.Table(ROLLUPS_TABLE)
+        response = table.get_item(Key={'video_id': video_id, 'bucket': TRENDING_SNAPSHOT_BUCKET})
+        item = response.get('Item')
+        if not item:
+            return create_response(404, {'error': 'Trending snapshot not found'})
+        
+        windows = item.get('windows', {})
+        window = query_params.get('window')
+        if window:
+            if window not in windows:
+                return create_response(400, {'error': f"window must be one of: {', '.join(sorted(windows))}"})
+            windows = {window: windows[window]}
+        
+        limit = int(query_params.get('limit', '20'))
+        result = {
+            'video_id': video_id,
+            'updated_at': item.get('updated_at'),
+            'windows': {
+                name: [{'token': entry['token'], 'count': int(entry['count'])} for entry in entries[:limit]]
+                for name, entries in windows.items()
+            }
+        }
+        
+        return create_response(200, result)
+        
+    except ClientError as e:
+        logger.error(f"DynamoDB error in get_trending: {str(e)}")
+        return create_response(500, {'error': 'Database error'})
+
+def estimate_unique_authors(registers: bytes) -> int:
+    """
+    HyperLogLogレジスタからユニーク数を推定（コレクターのHyperLogLog.estimateと同じ計算）
+    
+    Args:
+        registers: マージ済みのレジスタ
+        
+    Returns:
+        推定ユニーク数
+    """
+    size = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / size)
+    raw = alpha * size * size / sum(2.0 ** -register for register in registers)
+    zeros = registers.count(0)
+    if raw <= 2.5 * size and zeros:
+        return int(round(size * math.log(size / zeros)))
+    return int(round(raw))
+
 def get_collection_status(query_params: Dict[str, str]) -> Dict[str, Any]:
     """
     コメント収集タスクの実行状況を取得
@@ -620,20 +1043,17 @@ def get_collection_status(query_params: Dict[str, str]) -> Dict[str, Any]:
         
         running_tasks = response.get('Items', [])
         
-        # 今日のコメント数を取得（簡易版）
+        # 今日のコメント数を取得（コレクターが加算する日次集計から）
         today_comments = 0
         try:
-            comments_table = dynamodb.Table(COMMENTS_TABLE)
+            rollups_table = dynamodb.Table(ROLLUPS_TABLE)
             today = datetime.now(timezone.utc).date().isoformat()
             
-            # 今日のコメントを概算で取得（完全な実装は後で）
-            comments_response = comments_table.scan(
-                FilterExpression='begins_with(#ts, :today)',
-                ExpressionAttributeNames={'#ts': 'timestamp'},
-                ExpressionAttributeValues={':today': today},
-                Select='COUNT'
+            rollup_response = rollups_table.get_item(
+                Key={'video_id': ROLLUP_TOTAL_KEY, 'bucket': f"day#{today}"},
+                ProjectionExpression='comment_count'
             )
-            today_comments = comments_response.get('Count', 0)
+            today_comments = int(rollup_response.get('Item', {}).get('comment_count', 0))
         except Exception as e:
             logger.warning(f"Failed to get today's comment count: {str(e)}")
             today_comments = 0
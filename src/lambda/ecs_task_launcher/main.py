@@ -29,10 +29,20 @@ sqs = boto3.client('sqs')
 ECS_CLUSTER_NAME = os.environ.get('ECS_CLUSTER_NAME', 'dev-comment-collector-cluster')
 ECS_SERVICE_NAME = os.environ.get('ECS_SERVICE_NAME', 'dev-comment-collector-service')
 ECS_TASK_DEFINITION = os.environ.get('ECS_TASK_DEFINITION', 'dev-comment-collector-task')
+ECS_MULTI_TASK_DEFINITION = os.environ.get('ECS_MULTI_TASK_DEFINITION', ECS_TASK_DEFINITION)  # 共有タスク用（複数配信を収集するため大きめのCPU/メモリ）
 TASK_STATUS_TABLE = os.environ.get('DYNAMODB_TABLE_TASKSTATUS', 'dev-TaskStatus')
+STATUS_TTL_SECONDS = int(os.environ.get('STATUS_TTL_SECONDS', str(7 * 24 * 3600)))  # 秒 (最終更新後にTaskStatusを自動削除するまでの期間、コレクターと同じ値)
 SUBNET_IDS = os.environ.get('ECS_SUBNETS', '').split(',')
 SECURITY_GROUP_IDS = os.environ.get('ECS_SECURITY_GROUPS', '').split(',')
 
+# マルチストリームモード設定
+# single: 配信ごとにタスク起動 / multi: 共有タスクにadd/removeコマンドを送信
+COLLECTOR_MODE = os.environ.get('COLLECTOR_MODE', 'single')
+COLLECTOR_COMMAND_QUEUE_URL = os.environ.get('COLLECTOR_COMMAND_QUEUE_URL')
+MULTI_STREAM_TASK_KEY = '__multi_stream_collector__'  # 共有タスクを記録するTaskStatusキー
+# 共有タスクのコレクターモード（multi: 1プロセス / supervisor: CPU数分のワーカープロセス）
+MULTI_STREAM_COLLECTOR_MODE = os.environ.get('MULTI_STREAM_COLLECTOR_MODE', 'multi')
+
 def check_running_tasks_for_video(video_id: str) -> List[str]:
     """
     指定された動画IDで実行中のECSタスクを確認
@@ -164,6 +174,16 @@ def start_comment_collection(video_id: str, channel_id: str) -> bool:
             update_task_status(video_id, channel_id, 'collecting', running_tasks[0])
             return True
         
+        # 前回タスクのチェックポイントはupdate_task_statusが項目を置き換えないため引き継がれる
+        if COLLECTOR_MODE == 'multi':
+            # 共有タスクに配信を追加
+            task_arn = ensure_multi_stream_task()
+            if task_arn and send_collector_command('add_video', video_id, channel_id):
+                update_task_status(video_id, channel_id, 'running', task_arn)
+                logger.info(f"Assigned video {video_id} to multi-stream task: {task_arn}")
+                return True
+            return False
+        
         # ECS Fargateタスクを起動
         task_arn = launch_ecs_task(video_id, channel_id)
         
@@ -200,6 +220,14 @@ def stop_comment_collection(video_id: str, channel_id: str) -> bool:
         
         task_arn = task_status.get('task_arn')
         
+        if COLLECTOR_MODE == 'multi':
+            # 共有タスクは停止せず、配信のみ除外
+            if send_collector_command('remove_video', video_id, channel_id):
+                update_task_status(video_id, channel_id, 'stopped', task_arn)
+                logger.info(f"Removed video {video_id} from multi-stream task: {task_arn}")
+                return True
+            return False
+        
         if task_arn:
             # ECSタスクを停止
             success = stop_ecs_task(task_arn)
@@ -274,6 +302,104 @@ def launch_ecs_task(video_id: str, channel_id: str) -> Optional[str]:
         logger.error(f"Error launching ECS task: {str(e)}")
         return None
 
+def ensure_multi_stream_task() -> Optional[str]:
+    """
+    マルチストリーム収集タスクを取得（未起動の場合は起動）
+    
+    Returns:
+        タスクARN または None
+    """
+    try:
+        shared_task = get_task_status(MULTI_STREAM_TASK_KEY)
+        task_arn = shared_task.get('task_arn') if shared_task else None
+        
+        if task_arn:
+            response = ecs.describe_tasks(cluster=ECS_CLUSTER_NAME, tasks=[task_arn])
+            tasks = response.get('tasks', [])
+            if tasks and tasks[0].get('lastStatus') in ['PROVISIONING', 'PENDING', 'ACTIVATING', 'RUNNING']:
+                return task_arn
+            logger.info(f"Multi-stream task is no longer running: {task_arn}")
+        
+        task_overrides = {
+            'containerOverrides': [
+                {
+                    'name': 'comment-collector',
+                    'environment': [
+                        {'name': 'COLLECTOR_MODE', 'value': MULTI_STREAM_COLLECTOR_MODE},
+                        {'name': 'COLLECTOR_COMMAND_QUEUE_URL', 'value': COLLECTOR_COMMAND_QUEUE_URL or ''},
+                        {'name': 'ENVIRONMENT', 'value': 'dev'}
+                    ]
+                }
+            ]
+        }
+        
+        response = ecs.run_task(
+            cluster=ECS_CLUSTER_NAME,
+            taskDefinition=ECS_MULTI_TASK_DEFINITION,
+            launchType='FARGATE',
+            networkConfiguration={
+                'awsvpcConfiguration': {
+                    'subnets': [subnet for subnet in SUBNET_IDS if subnet.strip()],
+                    'securityGroups': [sg for sg in SECURITY_GROUP_IDS if sg.strip()],
+                    'assignPublicIp': 'ENABLED'
+                }
+            },
+            overrides=task_overrides,
+            tags=[
+                {'key': 'CollectorMode', 'value': 'multi'},
+                {'key': 'Environment', 'value': 'dev'}
+            ]
+        )
+        
+        if not response.get('tasks'):
+            logger.error(f"Failed to launch multi-stream task: {response}")
+            return None
+        
+        task_arn = response['tasks'][0]['taskArn']
+        update_task_status(MULTI_STREAM_TASK_KEY, '', 'running', task_arn)
+        logger.info(f"Multi-stream task launched successfully: {task_arn}")
+        return task_arn
+        
+    except ClientError as e:
+        logger.error(f"Error ensuring multi-stream task: {str(e)}")
+        return None
+
+def send_collector_command(action: str, video_id: str, channel_id: str) -> bool:
+    """
+    マルチストリーム収集タスクにコマンドを送信
+    
+    Args:
+        action: 'add_video' または 'remove_video'
+        video_id: YouTube動画ID
+        channel_id: YouTubeチャンネルID
+        
+    Returns:
+        成功した場合True
+    """
+    try:
+        if not COLLECTOR_COMMAND_QUEUE_URL:
+            logger.error("Collector command queue URL not configured")
+            return False
+        
+        message = {
+            'action': action,
+            'video_id': video_id,
+            'channel_id': channel_id,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+        
+        sqs.send_message(
+            QueueUrl=COLLECTOR_COMMAND_QUEUE_URL,
+            MessageBody=json.dumps(message)
+        )
+        
+        logger.info(f"Sent collector command: {action} for {video_id}")
+        return True
+        
+    except ClientError as e:
+        logger.error(f"Error sending collector command: {str(e)}")
+        return False
+
 def stop_ecs_task(task_arn: str) -> bool:
     """
     ECSタスクを停止
@@ -318,33 +444,52 @@ def get_task_status(video_id: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error getting task status for {video_id}: {str(e)}")
         return None
 
-def update_task_status(video_id: str, channel_id: str, status: str, task_arn: str) -> None:
+def update_task_status(video_id: str, channel_id: str, status: str, task_arn: str,
+                       extra_attributes: Optional[Dict[str, Any]] = None) -> None:
     """
     TaskStatusテーブルを更新
     
+    コレクターが書き込むチェックポイント・生存リース等の属性を残すため、
+    項目全体を置き換えずに指定した属性のみ更新する。配信ごとの項目には
+    コレクターと同じくTTL（ttl）を設定し、コレクターが起動しなかった場合も自動削除させる。
+    
     Args:
         video_id: YouTube動画ID
         channel_id: YouTubeチャンネルID
         status: タスク状態
         task_arn: ECSタスクARN
+        extra_attributes: 追加で保存する属性
     """
     try:
         table = dynamodb.Table(TASK_STATUS_TABLE)
         
-        item = {
-            'video_id': video_id,
+        now = datetime.now(timezone.utc)
+        attributes = {
             'channel_id': channel_id,
             'status': status,
             'task_arn': task_arn,
-            'updated_at': datetime.now(timezone.utc).isoformat()
+            'updated_at': now.isoformat()
         }
         
         if status == 'running':
-            item['started_at'] = datetime.now(timezone.utc).isoformat()
+            attributes['started_at'] = now.isoformat()
         elif status == 'stopped':
-            item['stopped_at'] = datetime.now(timezone.utc).isoformat()
+            attributes['stopped_at'] = now.isoformat()
+        
+        # 共有タスクの項目はタスクが長期間動き続けても消えないようTTLを付けない
+        if video_id != MULTI_STREAM_TASK_KEY:
+            attributes['ttl'] = int(now.timestamp()) + STATUS_TTL_SECONDS
         
-        table.put_item(Item=item)
+        if extra_attributes:
+            attributes.update(extra_attributes)
+        
+        names = {f"#{key}": key for key in attributes}
+        table.update_item(
+            Key={'video_id': video_id},
+            UpdateExpression='SET ' + ', '.join(f"#{key} = :{key}" for key in attributes),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f":{key}": value for key, value in attributes.items()}
+        )
         
         logger.info(f"Updated task status for {video_id}: {status}")
         
@@ -5,15 +5,25 @@ YouTubeチャンネルのRSSフィードを監視してライブ配信を検出
 - 5分間隔でEventBridgeから実行
 - 新しいライブ配信を検出してDynamoDBに保存
 - Stream Status CheckerにSQSメッセージを送信
+- チャンネルはスレッドプールで並列にチェック（接続はセッションで再利用）
+- 条件付きGET・内容ハッシュで変更のないフィードは解析を省略
 """
 
+import re
 import json
+import time
+import hashlib
 import boto3
 import os
+import threading
 import requests
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from botocore.exceptions import ClientError
 import logging
 
@@ -32,6 +42,64 @@ LIVESTREAMS_TABLE = os.environ.get('LIVESTREAMS_TABLE', 'dev-LiveStreams')
 TASK_CONTROL_QUEUE_URL = os.environ.get('TASK_CONTROL_QUEUE_URL')
 YOUTUBE_API_KEY_PARAM = os.environ.get('YOUTUBE_API_KEY_PARAM', '/dev/youtube-chat-collector/youtube-api-key')
 
+# 並列取得設定
+RSS_MAX_WORKERS = int(os.environ.get('RSS_MAX_WORKERS', '32'))  # チャンネルを並列にチェックするスレッド数
+RSS_PER_HOST_CONCURRENCY = int(os.environ.get('RSS_PER_HOST_CONCURRENCY', '16'))  # 同一ホストへの同時リクエスト数
+RSS_FETCH_TIMEOUT = float(os.environ.get('RSS_FETCH_TIMEOUT', '10'))  # 秒 (1リクエストのタイムアウト)
+RSS_TIME_BUDGET_MARGIN = float(os.environ.get('RSS_TIME_BUDGET_MARGIN', '15'))  # 秒 (Lambdaタイムアウト前に通知・集計に残す時間)
+RSS_DEFAULT_TIME_BUDGET = 240  # 秒 (実行コンテキストがない場合の時間予算)
+
+# 変更検知設定 (ETag/Last-Modifiedと内容ハッシュをChannelsテーブルに保存)
+RSS_CONDITIONAL_GET = os.environ.get('RSS_CONDITIONAL_GET', 'true').lower() == 'true'
+# 再生回数・評価・更新日時はフィードを取得するたびに変わるため内容ハッシュから除外
+VOLATILE_FEED_PATTERN = re.compile(rb'<media:statistics[^>]*/>|<media:starRating[^>]*/>|<updated>[^<]*</updated>')
+
+# HTTPセッション（ウォームスタート間でもKeep-Alive接続を再利用）
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=RSS_MAX_WORKERS))
+host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+host_semaphores_lock = threading.Lock()
+
+class TimeBudgetExceeded(Exception):
+    """実行の時間予算を使い切った"""
+
+@contextmanager
+def host_slot(url: str):
+    """同一ホストへの同時リクエスト数をRSS_PER_HOST_CONCURRENCYに制限"""
+    host = urlsplit(url).netloc
+    with host_semaphores_lock:
+        semaphore = host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(max(1, RSS_PER_HOST_CONCURRENCY))
+            host_semaphores[host] = semaphore
+    with semaphore:
+        yield
+
+def http_get(url: str, deadline: Optional[float] = None, **kwargs) -> requests.Response:
+    """
+    共有セッションでGETリクエストを送信
+    
+    Args:
+        url: リクエストURL
+        deadline: 時間予算の期限（time.monotonic()基準、Noneで無制限）
+        **kwargs: requests.Session.getに渡す引数
+        
+    Returns:
+        レスポンス
+        
+    Raises:
+        TimeBudgetExceeded: 期限を過ぎている場合
+    """
+    with host_slot(url):
+        timeout = RSS_FETCH_TIMEOUT
+        if deadline is not None:
+            # 枠待ちの間に期限が近づいた場合はタイムアウトを残り時間に短縮
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeBudgetExceeded(url)
+            timeout = min(timeout, remaining)
+        return http_session.get(url, timeout=timeout, **kwargs)
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda関数のメインハンドラー
@@ -50,24 +118,28 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         channels = get_active_channels()
         logger.info(f"Found {len(channels)} active channels")
         
-        new_streams_count = 0
+        # Lambdaの残り実行時間から時間予算を決定
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            budget = context.get_remaining_time_in_millis() / 1000 - RSS_TIME_BUDGET_MARGIN
+        else:
+            budget = RSS_DEFAULT_TIME_BUDGET
+        deadline = time.monotonic() + max(budget, 0)
         
-        # 各チャンネルのRSSフィードをチェック
-        for channel in channels:
-            try:
-                new_streams = check_channel_rss(channel)
-                new_streams_count += len(new_streams)
-                
-                # 新しいライブ配信があればStream Status Checkerに通知
-                for stream in new_streams:
-                    send_stream_check_message(stream)
-                    
-            except Exception as e:
-                logger.error(f"Error checking channel {channel['channel_id']}: {str(e)}")
-                continue
+        # 各チャンネルのRSSフィードを並列にチェック
+        results, skipped, failed = check_channels(channels, deadline)
+        
+        new_streams_count = 0
+        for new_streams in results.values():
+            new_streams_count += len(new_streams)
+            
+            # 新しいライブ配信があればStream Status Checkerに通知
+            for stream in new_streams:
+                send_stream_check_message(stream)
         
         result = {
-            'channels_checked': len(channels),
+            'channels_checked': len(results),
+            'channels_skipped': skipped,
+            'channels_failed': failed,
             'new_streams_found': new_streams_count,
             'timestamp': datetime.now(timezone.utc).isoformat()
         }
@@ -101,24 +173,96 @@ def get_active_channels() -> List[Dict[str, Any]]:
         logger.error(f"Error getting active channels: {str(e)}")
         return []
 
-def check_channel_rss(channel: Dict[str, Any]) -> List[Dict[str, Any]]:
+def check_channels(channels: List[Dict[str, Any]], deadline: float) -> tuple:
+    """
+    チャンネルのRSSフィードをスレッドプールで並列にチェック
+    
+    期限までに開始できなかったチャンネルはスキップし、次回の実行でチェックする。
+    期限の時点で実行中だったチェックは終了を待って結果を回収する（配信を保存済みの場合があるため）。
+    
+    Args:
+        channels: チャンネル情報のリスト
+        deadline: 時間予算の期限（time.monotonic()基準）
+        
+    Returns:
+        (チャンネルID別の新しいライブ配信のリスト, スキップしたチャンネル数, エラーになったチャンネル数)
+    """
+    if not channels:
+        return {}, 0, 0
+    
+    executor = ThreadPoolExecutor(max_workers=min(RSS_MAX_WORKERS, len(channels)), thread_name_prefix='rss')
+    try:
+        futures = {
+            executor.submit(check_channel_rss, channel, deadline): channel['channel_id']
+            for channel in channels
+        }
+        _, not_done = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        for future in not_done:
+            # 開始前のチェックだけが取り消される
+            future.cancel()
+    finally:
+        # 実行中のリクエストも期限までにタイムアウトするため、待機は余裕時間内に収まる
+        executor.shutdown(wait=True)
+    
+    results = {}
+    skipped = failed = 0
+    for future, channel_id in futures.items():
+        if future.cancelled():
+            skipped += 1
+            continue
+        try:
+            results[channel_id] = future.result()
+        except TimeBudgetExceeded:
+            skipped += 1
+        except Exception as e:
+            failed += 1
+            logger.error(f"Error checking channel {channel_id}: {str(e)}")
+    
+    if skipped:
+        logger.warning(f"Time budget exhausted: skipped {skipped} channels")
+    return results, skipped, failed
+
+def check_channel_rss(channel: Dict[str, Any], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
     """
     チャンネルのRSSフィードをチェックして新しいライブ配信を検出
     
     Args:
         channel: チャンネル情報
+        deadline: 時間予算の期限（time.monotonic()基準、Noneで無制限）
         
     Returns:
         新しいライブ配信のリスト
+        
+    Raises:
+        TimeBudgetExceeded: RSSフィードを取得する前に期限を過ぎた場合
     """
     channel_id = channel['channel_id']
     rss_url = f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
     
     try:
-        # RSSフィードを取得
-        response = requests.get(rss_url, timeout=10)
+        # RSSフィードを取得（前回の検証子があれば条件付きGET）
+        headers = {}
+        if RSS_CONDITIONAL_GET:
+            if channel.get('rss_etag'):
+                headers['If-None-Match'] = channel['rss_etag']
+            if channel.get('rss_last_modified'):
+                headers['If-Modified-Since'] = channel['rss_last_modified']
+        response = http_get(rss_url, deadline, headers=headers)
+        if response.status_code == 304:
+            logger.debug(f"RSS not modified for channel {channel_id}")
+            return []
         response.raise_for_status()
         
+        validators = {
+            'rss_etag': response.headers.get('ETag'),
+            'rss_last_modified': response.headers.get('Last-Modified'),
+            'rss_content_hash': feed_content_hash(response.content)
+        }
+        if RSS_CONDITIONAL_GET and validators['rss_content_hash'] == channel.get('rss_content_hash'):
+            logger.debug(f"RSS content unchanged for channel {channel_id}")
+            save_feed_validators(channel, validators)
+            return []
+        
         # XMLを解析
         root = ET.fromstring(response.content)
         
@@ -130,6 +274,8 @@ def check_channel_rss(channel: Dict[str, Any]) -> List[Dict[str, Any]]:
         }
         
         new_streams = []
+        # ライブ配信か確認できなかったエントリがあれば次回も解析するため検証子を保存しない
+        complete = True
         
         # 各エントリをチェック（最新の5件のみ）
         entries = root.findall('atom:entry', namespaces)[:5]
@@ -147,7 +293,10 @@ def check_channel_rss(channel: Dict[str, Any]) -> List[Dict[str, Any]]:
             # 既存のレコードをチェック
             if not is_existing_stream(video_id):
                 # YouTube Data APIでライブ配信かどうかを確認
-                if is_live_stream(video_id):
+                is_live = is_live_stream(video_id, deadline)
+                if is_live is None:
+                    complete = False
+                elif is_live:
                     stream_info = {
                         'video_id': video_id,
                         'channel_id': channel_id,
@@ -162,8 +311,13 @@ def check_channel_rss(channel: Dict[str, Any]) -> List[Dict[str, Any]]:
                     new_streams.append(stream_info)
                     logger.info(f"New live stream detected: {video_id} - {title}")
         
+        if RSS_CONDITIONAL_GET and complete:
+            save_feed_validators(channel, validators)
+        
         return new_streams
         
+    except TimeBudgetExceeded:
+        raise
     except requests.RequestException as e:
         logger.error(f"Error fetching RSS for channel {channel_id}: {str(e)}")
         return []
@@ -174,17 +328,51 @@ def check_channel_rss(channel: Dict[str, Any]) -> List[Dict[str, Any]]:
         logger.error(f"Unexpected error checking RSS for channel {channel_id}: {str(e)}")
         return []
 
-        return new_streams
+def feed_content_hash(content: bytes) -> str:
+    """
+    RSSフィードの内容ハッシュを計算（取得のたびに変わる要素は除外）
+    
+    Args:
+        content: RSSフィードの本文
         
-    except requests.RequestException as e:
-        logger.error(f"Error fetching RSS for channel {channel_id}: {str(e)}")
-        return []
-    except ET.ParseError as e:
-        logger.error(f"Error parsing RSS XML for channel {channel_id}: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error checking RSS for channel {channel_id}: {str(e)}")
-        return []
+    Returns:
+        SHA-256の16進文字列
+    """
+    return hashlib.sha256(VOLATILE_FEED_PATTERN.sub(b'', content)).hexdigest()
+
+def save_feed_validators(channel: Dict[str, Any], validators: Dict[str, Optional[str]]) -> None:
+    """
+    RSSフィードの検証子（ETag/Last-Modified/内容ハッシュ）をChannelsテーブルに保存
+    
+    前回から変わっていない場合は書き込まない。保存に失敗しても次回フィード全体を再取得するだけのため
+    例外は送出しない。
+    
+    Args:
+        channel: チャンネル情報（前回の検証子を含む）
+        validators: 今回の検証子（レスポンスにないヘッダーはNone）
+    """
+    if all(channel.get(name) == value for name, value in validators.items()):
+        return
+    
+    set_names = [name for name, value in validators.items() if value is not None]
+    remove_names = [name for name, value in validators.items() if value is None and name in channel]
+    update_expression = 'SET ' + ', '.join(f"{name} = :{name}" for name in set_names)
+    if remove_names:
+        update_expression += ' REMOVE ' + ', '.join(remove_names)
+    
+    try:
+        table = dynamodb.Table(CHANNELS_TABLE)
+        table.update_item(
+            Key={'channel_id': channel['channel_id']},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues={f":{name}": validators[name] for name in set_names},
+            # 実行中に削除されたチャンネルを復活させない
+            ConditionExpression='attribute_exists(channel_id)'
+        )
+        
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.error(f"Error saving RSS validators for channel {channel['channel_id']}: {str(e)}")
 
 def is_existing_stream(video_id: str) -> bool:
     """
@@ -205,22 +393,23 @@ def is_existing_stream(video_id: str) -> bool:
         logger.error(f"Error checking existing stream {video_id}: {str(e)}")
         return False
 
-def is_live_stream(video_id: str) -> bool:
+def is_live_stream(video_id: str, deadline: Optional[float] = None) -> Optional[bool]:
     """
     YouTube Data APIを使用してライブ配信かどうか確認
     
     Args:
         video_id: YouTube動画ID
+        deadline: 時間予算の期限（time.monotonic()基準、Noneで無制限）
         
     Returns:
-        ライブ配信の場合True
+        ライブ配信の場合True、確認できなかった場合None
     """
     try:
         # YouTube API Keyを取得
         api_key = get_youtube_api_key()
         if not api_key:
             logger.error("YouTube API key not found")
-            return False
+            return None
         
         # YouTube Data API v3で動画情報を取得
         url = "https://www.googleapis.com/youtube/v3/videos"
@@ -230,7 +419,7 @@ def is_live_stream(video_id: str) -> bool:
             'key': api_key
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_get(url, deadline, params=params)
         response.raise_for_status()
         
         data = response.json()
@@ -252,12 +441,16 @@ def is_live_stream(video_id: str) -> bool:
         
         return live_broadcast_content in ['live', 'upcoming']
         
+    except TimeBudgetExceeded:
+        # 保存しないため次回の実行で再確認される
+        logger.warning(f"Time budget exhausted before checking live stream status for {video_id}")
+        return None
     except requests.RequestException as e:
         logger.error(f"Error checking live stream status for {video_id}: {str(e)}")
-        return False
+        return None
     except Exception as e:
         logger.error(f"Unexpected error checking live stream {video_id}: {str(e)}")
-        return False
+        return None
 
 def get_youtube_api_key() -> Optional[str]:
     """
@@ -9,6 +9,7 @@ YouTube Live Chat Collector - Stream Status Checker Lambda Function
 """
 
 import json
+import time
 import boto3
 import os
 import requests
@@ -25,6 +26,7 @@ logger.setLevel(logging.INFO)
 dynamodb = boto3.resource('dynamodb')
 sqs = boto3.client('sqs')
 ssm = boto3.client('ssm')
+ecs = boto3.client('ecs')
 
 # 環境変数
 CHANNELS_TABLE = os.environ.get('DYNAMODB_TABLE_CHANNELS', 'dev-Channels')
@@ -358,7 +360,12 @@ def is_task_running(video_id: str) -> bool:
         
         # running または collecting 状態のタスクがある場合はTrue
         if status in ['running', 'collecting']:
-            # タスクが実際に実行中かECS APIで確認
+            # コレクターの生存リースが有効であればECS APIは呼ばない
+            lease_expires_at = task_status.get('lease_expires_at')
+            if lease_expires_at and float(lease_expires_at) > time.time():
+                return True
+            
+            # リース切れ（または未取得）の場合はECS APIで確認
             task_arn = task_status.get('task_arn')
             if task_arn and is_ecs_task_actually_running(task_arn):
                 return True
@@ -385,13 +392,8 @@ def is_ecs_task_actually_running(task_arn: str) -> bool:
         タスクが実行中の場合True
     """
     try:
-        ecs = boto3.client('ecs')
-        
-        # クラスター名を環境変数から取得
-        cluster_name = os.environ.get('ECS_CLUSTER_NAME', 'dev-youtube-comment-collector')
-        
         response = ecs.describe_tasks(
-            cluster=cluster_name,
+            cluster=ECS_CLUSTER_NAME,
             tasks=[task_arn]
         )
         
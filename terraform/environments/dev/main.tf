@@ -76,7 +76,10 @@ module "compute" {
   youtube_api_key_parameter_arn  = module.storage.youtube_api_key_parameter_arn
   sqs_queue_url                  = module.messaging.sqs_queue_url
   sqs_queue_arn                  = module.messaging.sqs_queue_arn
+  collector_command_queue_url    = module.messaging.collector_command_queue_url
+  collector_command_queue_arn    = module.messaging.collector_command_queue_arn
   ecs_cluster_name               = "${var.environment}-youtube-comment-collector"
+  comment_shard_count            = var.comment_shard_count
 }
 
 # API
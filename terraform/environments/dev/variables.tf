@@ -42,6 +42,12 @@ variable "allowed_ip_addresses" {
   default     = ["0.0.0.0/0"]  # 本番環境では制限する
 }
 
+variable "comment_shard_count" {
+  description = "Number of video_id#shard partitions for comment writes (0 or 1 disables sharding)"
+  type        = number
+  default     = 0
+}
+
 # 共通タグ設定
 variable "common_tags" {
   description = "Common tags for all resources"
@@ -46,6 +46,18 @@ resource "aws_api_gateway_resource" "comments" {
   path_part   = "comments"
 }
 
+resource "aws_api_gateway_resource" "trending" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  parent_id   = aws_api_gateway_resource.stream_id.id
+  path_part   = "trending"
+}
+
+resource "aws_api_gateway_resource" "rollups" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  parent_id   = aws_api_gateway_resource.stream_id.id
+  path_part   = "rollups"
+}
+
 # Collection Status Resource
 resource "aws_api_gateway_resource" "collection_status" {
   rest_api_id = aws_api_gateway_rest_api.main.id
@@ -82,6 +94,20 @@ resource "aws_api_gateway_method" "comments_options" {
   authorization = "NONE"
 }
 
+resource "aws_api_gateway_method" "trending_options" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.trending.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_method" "rollups_options" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.rollups.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
 resource "aws_api_gateway_method" "collection_status_options" {
   rest_api_id   = aws_api_gateway_rest_api.main.id
   resource_id   = aws_api_gateway_resource.collection_status.id
@@ -139,6 +165,22 @@ resource "aws_api_gateway_method" "comments_get" {
   api_key_required = true
 }
 
+resource "aws_api_gateway_method" "trending_get" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.trending.id
+  http_method   = "GET"
+  authorization = "NONE"
+  api_key_required = true
+}
+
+resource "aws_api_gateway_method" "rollups_get" {
+  rest_api_id   = aws_api_gateway_rest_api.main.id
+  resource_id   = aws_api_gateway_resource.rollups.id
+  http_method   = "GET"
+  authorization = "NONE"
+  api_key_required = true
+}
+
 resource "aws_api_gateway_method" "collection_status_get" {
   rest_api_id   = aws_api_gateway_rest_api.main.id
   resource_id   = aws_api_gateway_resource.collection_status.id
@@ -209,6 +251,26 @@ resource "aws_api_gateway_integration" "comments_get" {
   uri                    = var.api_handler_lambda.invoke_arn
 }
 
+resource "aws_api_gateway_integration" "trending_get" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.trending.id
+  http_method = aws_api_gateway_method.trending_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda.invoke_arn
+}
+
+resource "aws_api_gateway_integration" "rollups_get" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.rollups.id
+  http_method = aws_api_gateway_method.rollups_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = var.api_handler_lambda.invoke_arn
+}
+
 resource "aws_api_gateway_integration" "collection_status_get" {
   rest_api_id = aws_api_gateway_rest_api.main.id
   resource_id = aws_api_gateway_resource.collection_status.id
@@ -272,6 +334,32 @@ resource "aws_api_gateway_integration" "comments_options" {
   }
 }
 
+resource "aws_api_gateway_integration" "trending_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.trending.id
+  http_method = aws_api_gateway_method.trending_options.http_method
+
+  type = "MOCK"
+  request_templates = {
+    "application/json" = jsonencode({
+      statusCode = 200
+    })
+  }
+}
+
+resource "aws_api_gateway_integration" "rollups_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.rollups.id
+  http_method = aws_api_gateway_method.rollups_options.http_method
+
+  type = "MOCK"
+  request_templates = {
+    "application/json" = jsonencode({
+      statusCode = 200
+    })
+  }
+}
+
 resource "aws_api_gateway_integration" "collection_status_options" {
   rest_api_id = aws_api_gateway_rest_api.main.id
   resource_id = aws_api_gateway_resource.collection_status.id
@@ -338,6 +426,32 @@ resource "aws_api_gateway_method_response" "comments_options" {
   }
 }
 
+resource "aws_api_gateway_method_response" "trending_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.trending.id
+  http_method = aws_api_gateway_method.trending_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
+resource "aws_api_gateway_method_response" "rollups_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.rollups.id
+  http_method = aws_api_gateway_method.rollups_options.http_method
+  status_code = "200"
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true
+    "method.response.header.Access-Control-Allow-Methods" = true
+    "method.response.header.Access-Control-Allow-Origin"  = true
+  }
+}
+
 resource "aws_api_gateway_method_response" "collection_status_options" {
   rest_api_id = aws_api_gateway_rest_api.main.id
   resource_id = aws_api_gateway_resource.collection_status.id
@@ -404,6 +518,32 @@ resource "aws_api_gateway_integration_response" "comments_options" {
   }
 }
 
+resource "aws_api_gateway_integration_response" "trending_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.trending.id
+  http_method = aws_api_gateway_method.trending_options.http_method
+  status_code = aws_api_gateway_method_response.trending_options.status_code
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Methods" = "'GET,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
+resource "aws_api_gateway_integration_response" "rollups_options" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.rollups.id
+  http_method = aws_api_gateway_method.rollups_options.http_method
+  status_code = aws_api_gateway_method_response.rollups_options.status_code
+
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Methods" = "'GET,OPTIONS'"
+    "method.response.header.Access-Control-Allow-Origin"  = "'*'"
+  }
+}
+
 resource "aws_api_gateway_integration_response" "collection_status_options" {
   rest_api_id = aws_api_gateway_rest_api.main.id
   resource_id = aws_api_gateway_resource.collection_status.id
@@ -475,11 +615,15 @@ resource "aws_api_gateway_deployment" "main" {
     aws_api_gateway_integration.channel_id_delete,
     aws_api_gateway_integration.streams_get,
     aws_api_gateway_integration.comments_get,
+    aws_api_gateway_integration.trending_get,
+    aws_api_gateway_integration.rollups_get,
     aws_api_gateway_integration.collection_status_get,
     aws_api_gateway_integration.channels_options,
     aws_api_gateway_integration.channel_id_options,
     aws_api_gateway_integration.streams_options,
     aws_api_gateway_integration.comments_options,
+    aws_api_gateway_integration.trending_options,
+    aws_api_gateway_integration.rollups_options,
     aws_api_gateway_integration.collection_status_options,
   ]
 
@@ -43,7 +43,8 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
           "dynamodb:Query",
-          "dynamodb:Scan"
+          "dynamodb:Scan",
+          "dynamodb:BatchGetItem"
         ]
         Resource = [
           for table_arn in values(var.dynamodb_table_arns) : table_arn
@@ -73,7 +74,10 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "sqs:DeleteMessage",
           "sqs:GetQueueAttributes"
         ]
-        Resource = var.sqs_queue_arn
+        Resource = [
+          var.sqs_queue_arn,
+          var.collector_command_queue_arn
+        ]
       },
       {
         Effect = "Allow"
@@ -162,8 +166,10 @@ resource "aws_lambda_function" "ecs_task_launcher" {
       DYNAMODB_TABLE_TASKSTATUS = var.dynamodb_table_names.taskstatus
       ECS_CLUSTER_NAME = aws_ecs_cluster.main.name
       ECS_TASK_DEFINITION = aws_ecs_task_definition.comment_collector.family
+      ECS_MULTI_TASK_DEFINITION = aws_ecs_task_definition.comment_collector_multi.family
       ECS_SUBNETS = join(",", var.public_subnet_ids)
       ECS_SECURITY_GROUPS = var.security_group_ids.ecs_tasks
+      COLLECTOR_COMMAND_QUEUE_URL = var.collector_command_queue_url
     }
   }
 
@@ -188,6 +194,9 @@ resource "aws_lambda_function" "api_handler" {
       DYNAMODB_TABLE_LIVESTREAMS = var.dynamodb_table_names.livestreams
       DYNAMODB_TABLE_COMMENTS = var.dynamodb_table_names.comments
       TASKSTATUS_TABLE = var.dynamodb_table_names.taskstatus
+      ROLLUPS_TABLE = var.dynamodb_table_names.rollups
+      AUTHORS_TABLE = var.dynamodb_table_names.authors
+      COMMENT_SHARD_COUNT = tostring(var.comment_shard_count)
     }
   }
 
@@ -422,8 +431,26 @@ resource "aws_iam_role_policy" "ecs_task_policy" {
         ]
         Resource = [
           var.dynamodb_table_arns.comments,
-          var.dynamodb_table_arns.taskstatus
+          var.dynamodb_table_arns.taskstatus,
+          var.dynamodb_table_arns.rollups,
+          var.dynamodb_table_arns.authors
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:UpdateItem"
+        ]
+        Resource = var.dynamodb_table_arns.livestreams
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage"
         ]
+        Resource = var.collector_command_queue_arn
       },
       {
         Effect = "Allow"
@@ -438,6 +465,54 @@ resource "aws_iam_role_policy" "ecs_task_policy" {
   })
 }
 
+locals {
+  # 共有タスク（multi/supervisorモード）と配信ごとのタスクで共通の環境変数
+  collector_environment = [
+    {
+      name  = "ENVIRONMENT"
+      value = var.environment
+    },
+    {
+      name  = "DYNAMODB_TABLE_COMMENTS"
+      value = var.dynamodb_table_names.comments
+    },
+    {
+      name  = "DYNAMODB_TABLE_TASKSTATUS"
+      value = var.dynamodb_table_names.taskstatus
+    },
+    {
+      name  = "DYNAMODB_TABLE_LIVESTREAMS"
+      value = var.dynamodb_table_names.livestreams
+    },
+    {
+      name  = "DYNAMODB_TABLE_ROLLUPS"
+      value = var.dynamodb_table_names.rollups
+    },
+    {
+      name  = "DYNAMODB_TABLE_AUTHORS"
+      value = var.dynamodb_table_names.authors
+    },
+    {
+      name  = "COMMENT_SHARD_COUNT"
+      value = tostring(var.comment_shard_count)
+    },
+    {
+      name  = "STOP_TIMEOUT"
+      value = "120"
+    }
+  ]
+
+  collector_log_configuration = {
+    logDriver = "awslogs"
+    options = {
+      "awslogs-group"         = "/ecs/${var.environment}-comment-collector"
+      "awslogs-region"        = data.aws_region.current.name
+      "awslogs-stream-prefix" = "ecs"
+      "awslogs-create-group"  = "true"
+    }
+  }
+}
+
 # ECS Task Definition
 resource "aws_ecs_task_definition" "comment_collector" {
   family                   = "${var.environment}-comment-collector"
@@ -453,37 +528,54 @@ resource "aws_ecs_task_definition" "comment_collector" {
       name  = "comment-collector"
       image = "${aws_ecr_repository.comment_collector.repository_url}:latest"
       
-      environment = [
-        {
-          name  = "ENVIRONMENT"
-          value = var.environment
-        },
-        {
-          name  = "DYNAMODB_TABLE_COMMENTS"
-          value = var.dynamodb_table_names.comments
-        },
+      environment = local.collector_environment
+
+      # SIGTERM受信後、バッファ中のコメントを書き込み終えるまでの猶予（Fargateの上限）
+      stopTimeout = 120
+
+      logConfiguration = local.collector_log_configuration
+
+      essential = true
+    }
+  ])
+
+  tags = {
+    Name = "${var.environment}-comment-collector"
+  }
+}
+
+# ECS Task Definition (共有タスク: 1タスクで複数配信を収集するため配信数に応じたサイズにする)
+resource "aws_ecs_task_definition" "comment_collector_multi" {
+  family                   = "${var.environment}-comment-collector-multi"
+  network_mode             = "awsvpc"
+  requires_compatibilities = ["FARGATE"]
+  cpu                      = var.multi_stream_task_cpu
+  memory                   = var.multi_stream_task_memory
+  execution_role_arn       = aws_iam_role.ecs_task_execution_role.arn
+  task_role_arn           = aws_iam_role.ecs_task_role.arn
+
+  container_definitions = jsonencode([
+    {
+      name  = "comment-collector"
+      image = "${aws_ecr_repository.comment_collector.repository_url}:latest"
+      
+      environment = concat(local.collector_environment, [
         {
-          name  = "DYNAMODB_TABLE_TASKSTATUS"
-          value = var.dynamodb_table_names.taskstatus
+          name  = "MAX_STREAMS_PER_TASK"
+          value = tostring(var.multi_stream_max_streams)
         }
-      ]
-
-      logConfiguration = {
-        logDriver = "awslogs"
-        options = {
-          "awslogs-group"         = "/ecs/${var.environment}-comment-collector"
-          "awslogs-region"        = data.aws_region.current.name
-          "awslogs-stream-prefix" = "ecs"
-          "awslogs-create-group"  = "true"
-        }
-      }
+      ])
+
+      stopTimeout = 120
+
+      logConfiguration = local.collector_log_configuration
 
       essential = true
     }
   ])
 
   tags = {
-    Name = "${var.environment}-comment-collector"
+    Name = "${var.environment}-comment-collector-multi"
   }
 }
 
@@ -30,6 +30,8 @@ variable "dynamodb_table_names" {
     livestreams = string
     comments    = string
     taskstatus  = string
+    rollups     = string
+    authors     = string
   })
 }
 
@@ -40,6 +42,8 @@ variable "dynamodb_table_arns" {
     livestreams = string
     comments    = string
     taskstatus  = string
+    rollups     = string
+    authors     = string
   })
 }
 
@@ -70,7 +74,41 @@ variable "sqs_queue_arn" {
   type        = string
 }
 
+variable "collector_command_queue_url" {
+  description = "SQS Queue URL for multi-stream collector commands"
+  type        = string
+}
+
+variable "collector_command_queue_arn" {
+  description = "SQS Queue ARN for multi-stream collector commands"
+  type        = string
+}
+
 variable "ecs_cluster_name" {
   description = "ECS Cluster name"
   type        = string
 }
+
+variable "comment_shard_count" {
+  description = "Number of video_id#shard partitions for comment writes (0 or 1 disables sharding)"
+  type        = number
+  default     = 0
+}
+
+variable "multi_stream_task_cpu" {
+  description = "CPU units for the shared multi-stream collector task"
+  type        = string
+  default     = "1024"
+}
+
+variable "multi_stream_task_memory" {
+  description = "Memory (MiB) for the shared multi-stream collector task"
+  type        = string
+  default     = "2048"
+}
+
+variable "multi_stream_max_streams" {
+  description = "Maximum number of streams collected by one shared task (sized for multi_stream_task_memory)"
+  type        = number
+  default     = 40
+}
@@ -28,6 +28,19 @@ resource "aws_sqs_queue" "task_control_dlq" {
   }
 }
 
+# SQS Queue for multi-stream collector commands (add_video / remove_video)
+resource "aws_sqs_queue" "collector_command" {
+  name                      = "${var.environment}-collector-command-queue"
+  delay_seconds             = 0
+  max_message_size          = 2048
+  message_retention_seconds = 86400  # 1 day
+  visibility_timeout_seconds = 30
+
+  tags = {
+    Name = "${var.environment}-collector-command-queue"
+  }
+}
+
 # EventBridge Rule for RSS Monitor (5 minutes)
 resource "aws_cloudwatch_event_rule" "rss_monitor_schedule" {
   name                = "${var.environment}-rss-monitor-schedule"
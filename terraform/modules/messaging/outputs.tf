@@ -20,6 +20,16 @@ output "sqs_dlq_arn" {
   value       = aws_sqs_queue.task_control_dlq.arn
 }
 
+output "collector_command_queue_url" {
+  description = "URL of SQS collector command queue"
+  value       = aws_sqs_queue.collector_command.url
+}
+
+output "collector_command_queue_arn" {
+  description = "ARN of SQS collector command queue"
+  value       = aws_sqs_queue.collector_command.arn
+}
+
 output "eventbridge_rule_arns" {
   description = "ARNs of EventBridge rules"
   value = {
@@ -119,6 +119,12 @@ resource "aws_dynamodb_table" "taskstatus" {
     type = "S"
   }
 
+  # コレクターが最終更新から一定期間後に削除されるよう設定する期限
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
   server_side_encryption {
     enabled = true
   }
@@ -127,3 +133,49 @@ resource "aws_dynamodb_table" "taskstatus" {
     Name = "${var.environment}-TaskStatus"
   }
 }
+
+# Rollups Table（コレクターが書き込む分単位・日次の集計）
+resource "aws_dynamodb_table" "rollups" {
+  name           = "${var.environment}-Rollups"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "video_id"
+  range_key      = "bucket"
+
+  attribute {
+    name = "video_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "bucket"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Name = "${var.environment}-Rollups"
+  }
+}
+
+# Authors Table（コメント投稿者の属性。コメントには投稿者IDのみ保存）
+resource "aws_dynamodb_table" "authors" {
+  name           = "${var.environment}-Authors"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "author_channel_id"
+
+  attribute {
+    name = "author_channel_id"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = {
+    Name = "${var.environment}-Authors"
+  }
+}
@@ -7,6 +7,8 @@ output "dynamodb_table_names" {
     livestreams = aws_dynamodb_table.livestreams.name
     comments    = aws_dynamodb_table.comments.name
     taskstatus  = aws_dynamodb_table.taskstatus.name
+    rollups     = aws_dynamodb_table.rollups.name
+    authors     = aws_dynamodb_table.authors.name
   }
 }
 
@@ -17,6 +19,8 @@ output "dynamodb_table_arns" {
     livestreams = aws_dynamodb_table.livestreams.arn
     comments    = aws_dynamodb_table.comments.arn
     taskstatus  = aws_dynamodb_table.taskstatus.arn
+    rollups     = aws_dynamodb_table.rollups.arn
+    authors     = aws_dynamodb_table.authors.arn
   }
 }
 